@@ -0,0 +1,131 @@
+"""Report of the largest static files and duplicated libraries."""
+import gzip
+import hashlib
+import re
+
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management.base import BaseCommand
+
+# jquery-3.0.0.min.js, jquery.min.js, bootstrap.min.js, modernizr-2.6.2.min.js
+LIBRARY_RE = re.compile(
+    r'^(?P<library>[a-z]+?)(?:[-.]?v?(?P<version>\d+(?:\.\d+)*))?'
+    r'(?P<minified>[.-]min)?(?P<extension>\.(?:js|css))$',
+)
+
+
+def human_size(size):
+    for unit in ('B', 'KB', 'MB'):
+        if size < 1024:
+            return '{0:.0f} {1}'.format(size, unit)
+        size /= 1024
+    return '{0:.1f} GB'.format(size)
+
+
+class Command(BaseCommand):
+    """Print the largest static files, identical files and libraries
+    which are shipped several times (e.g. jquery.min.js and
+    jquery-3.0.0.min.js):
+
+        python manage.py static_report --top 20
+    """
+
+    help = 'Report the largest and duplicated static files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=20)
+
+    def collect(self):
+        """Return list of (path, size, gzip size, md5) of source files."""
+        files = []
+        seen = set()
+        for finder in get_finders():
+            for path, storage in finder.list(ignore_patterns=[]):
+                if path in seen:
+                    continue
+                seen.add(path)
+                with storage.open(path) as static_file:
+                    content = static_file.read()
+                files.append((
+                    path,
+                    len(content),
+                    len(gzip.compress(content, compresslevel=6)),
+                    hashlib.md5(content).hexdigest(),
+                ))
+        return files
+
+    def handle(self, *args, **options):
+        files = self.collect()
+        total = sum(size for _, size, _, _ in files)
+        total_gzip = sum(gzip_size for _, _, gzip_size, _ in files)
+        self.stdout.write('{0} files, {1}, {2} gzipped\n'.format(
+            len(files),
+            human_size(total),
+            human_size(total_gzip),
+        ))
+
+        self.stdout.write('Largest files:')
+        for path, size, gzip_size, _ in sorted(
+            files,
+            key=lambda row: row[1],
+            reverse=True,
+        )[:options['top']]:
+            self.stdout.write('  {0:>8}  {1:>8} gz  {2}'.format(
+                human_size(size),
+                human_size(gzip_size),
+                path,
+            ))
+
+        by_digest = {}
+        for path, size, _, digest in files:
+            by_digest.setdefault(digest, []).append((path, size))
+        identical = [rows for rows in by_digest.values() if len(rows) > 1]
+        self.stdout.write('\nIdentical files:')
+        for rows in sorted(identical, key=lambda rows: -rows[0][1]):
+            self.stdout.write('  {0:>8}  {1}'.format(
+                human_size(rows[0][1]),
+                ', '.join(path for path, _ in rows),
+            ))
+        if not identical:
+            self.stdout.write('  none')
+
+        # a copy is a library version in a directory, lib.js and lib.min.js
+        # next to each other are one copy
+        libraries = {}
+        for path, size, _, _ in files:
+            directory, _, filename = path.rpartition('/')
+            match = LIBRARY_RE.match(filename.lower())
+            if match is None:
+                continue
+            library = match.group('library') + match.group('extension')
+            copies = libraries.setdefault(
+                library,
+                {'copies': {}, 'named': False},
+            )
+            copies['copies'].setdefault(
+                (directory, match.group('version')),
+                [],
+            ).append((path, size))
+            if match.group('version') or match.group('minified'):
+                copies['named'] = True
+        # calendar.js of two apps are different scripts, only minified or
+        # versioned names are taken for libraries
+        duplicated = {
+            library: [
+                row
+                for rows in copies['copies'].values()
+                for row in rows
+            ]
+            for library, copies in libraries.items()
+            if copies['named'] and len(copies['copies']) > 1
+        }
+        self.stdout.write('\nLibraries shipped several times:')
+        for library, rows in sorted(duplicated.items()):
+            self.stdout.write('  {0}: {1}'.format(
+                library,
+                ', '.join(
+                    '{0} ({1})'.format(path, human_size(size))
+                    for path, size in rows
+                ),
+            ))
+        if not duplicated:
+            self.stdout.write('  none')
@@ -0,0 +1,142 @@
+"""Static files storage with hashed names and precompressed copies.
+
+collectstatic writes every file as name.<md5>.ext (ManifestStaticFilesStorage)
+and next to every compressible file name.<md5>.ext.gz and, when the
+brotli package is installed, name.<md5>.ext.br. assets.views.serve
+returns them to clients which accept the encoding.
+"""
+import gzip
+import logging
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# images and woff fonts are compressed already
+COMPRESSIBLE_EXTENSIONS = (
+    '.css',
+    '.js',
+    '.map',
+    '.svg',
+    '.json',
+    '.txt',
+    '.html',
+    '.xml',
+    '.ico',
+    '.ttf',
+    '.eot',
+    '.otf',
+)
+# a compressed copy is kept when it is at least this part smaller
+MIN_SAVING = 0.05
+
+ENCODING_SUFFIXES = {'gzip': '.gz', 'br': '.br'}
+
+
+def compress(content):
+    """Return dict encoding -> compressed content."""
+    variants = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content, quality=11)
+    return variants
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage which also writes .gz and .br copies."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # names of the last pass, earlier passes may yield outdated ones
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            for compressed_name in self.compress_file(hashed_name):
+                yield hashed_name, compressed_name, True
+
+    def stored_name(self, name):
+        """Return the hashed name, the plain name before collectstatic.
+
+        Tests and DEBUG = False runs without collected files then still
+        render templates with {% static %}, the miss is logged once for
+        every name. A name which is not in an existing manifest raises
+        ValueError like in ManifestStaticFilesStorage, a typo is not
+        served uncached.
+        """
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            if self.hashed_files:
+                raise
+            missed = self.__dict__.setdefault('_missed_names', set())
+            if name in missed:
+                return name
+            missed.add(name)
+            logger.warning(
+                'Static file %s is not collected, run collectstatic',
+                name,
+            )
+            return name
+
+    def compress_file(self, name):
+        """Write compressed copies of a collected file.
+
+        Returns:
+            list: names of written copies
+        """
+        if not name.lower().endswith(COMPRESSIBLE_EXTENSIONS):
+            return []
+        with self.open(name) as original:
+            content = original.read()
+        written = []
+        for encoding, compressed in compress(content).items():
+            if len(compressed) > len(content) * (1 - MIN_SAVING):
+                continue
+            compressed_name = name + ENCODING_SUFFIXES[encoding]
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self._save(compressed_name, ContentFile(compressed))
+            written.append(compressed_name)
+        return written
+
+    def is_hashed(self, name):
+        """Return True if name is a hashed name from the manifest."""
+        return name in self._hashed_names
+
+    @property
+    def _hashed_names(self):
+        names = getattr(self, '_hashed_names_cache', None)
+        if names is None:
+            names = set(self.hashed_files.values())
+            self._hashed_names_cache = names
+        return names
+
+
+def encoded_path(storage, name, accept_encoding):
+    """Return (path, encoding) of the best stored variant of name.
+
+    Arguments:
+        storage: static files storage with files on disk
+        name: requested name
+        accept_encoding: Accept-Encoding header of the request
+
+    Returns:
+        tuple: absolute path and content encoding or None
+    """
+    accepted = {
+        part.split(';')[0].strip().lower()
+        for part in accept_encoding.split(',')
+    }
+    path = storage.path(name)
+    for encoding in ('br', 'gzip'):
+        if encoding in accepted:
+            variant = path + ENCODING_SUFFIXES[encoding]
+            if os.path.isfile(variant):
+                return variant, encoding
+    return path, None
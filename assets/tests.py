@@ -0,0 +1,109 @@
+import contextlib
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from assets.views import IMMUTABLE_CACHE_CONTROL, serve
+
+SCRIPT = b'function hello() {\n    return "hello";\n}\n' * 50
+
+
+@contextlib.contextmanager
+def static_not_collected(test_case):
+    """Capture warnings about static files of pages rendered in tests.
+
+    The block gets a new storage without collected files, it logs every
+    name again, so the warnings are always there and never printed.
+    """
+    root = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, root)
+    with override_settings(STATIC_ROOT=root), \
+            test_case.assertLogs('assets.storage', 'WARNING'):
+        yield
+
+
+class CollectedFilesTest(SimpleTestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source)
+        self.addCleanup(shutil.rmtree, self.root)
+        os.mkdir(os.path.join(self.source, 'js'))
+        with open(os.path.join(self.source, 'js', 'hello.js'), 'wb') as file:
+            file.write(SCRIPT)
+        collected = override_settings(
+            STATIC_ROOT=self.root,
+            STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=[
+                'django.contrib.staticfiles.finders.FileSystemFinder',
+            ],
+        )
+        collected.enable()
+        self.addCleanup(collected.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.hashed_name = staticfiles_storage.stored_name('js/hello.js')
+
+    def test_unknown_name_is_an_error(self):
+        with self.assertRaises(ValueError):
+            staticfiles_storage.stored_name('js/missing.js')
+
+    def get(self, path, **headers):
+        request = RequestFactory().get('/static/' + path, **headers)
+        response = serve(request, path)
+        self.addCleanup(response.close)
+        return response
+
+    def test_compressed_copy_is_written(self):
+        self.assertNotEqual(self.hashed_name, 'js/hello.js')
+        path = os.path.join(self.root, self.hashed_name + '.gz')
+        with open(path, 'rb') as file:
+            self.assertEqual(gzip.decompress(file.read()), SCRIPT)
+
+    def test_encoding_is_negotiated(self):
+        response = self.get(
+            self.hashed_name,
+            HTTP_ACCEPT_ENCODING='gzip, deflate',
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            SCRIPT,
+        )
+        response = self.get(self.hashed_name)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(response.streaming_content), SCRIPT)
+
+    def test_only_hashed_names_are_immutable(self):
+        response = self.get(self.hashed_name)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        response = self.get('js/hello.js')
+        self.assertEqual(
+            response['Cache-Control'],
+            'public, max-age={0}'.format(settings.STATIC_MAX_AGE),
+        )
+        response = self.get(
+            self.hashed_name,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class NotCollectedTest(SimpleTestCase):
+
+    def test_plain_name_is_returned(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        with override_settings(STATIC_ROOT=root), \
+                self.assertLogs('assets.storage', 'WARNING'):
+            self.assertEqual(
+                staticfiles_storage.stored_name('js/hello.js'),
+                'js/hello.js',
+            )
@@ -0,0 +1,71 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+from django.views.static import was_modified_since
+
+from assets.storage import encoded_path
+
+# a hashed name never changes its content
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+@require_safe
+def serve(request, path):
+    """Serve a collected static file from STATIC_ROOT.
+
+    A precompressed copy is returned when the client accepts its
+    encoding. Hashed names are cached by browsers for a year, other
+    names for STATIC_MAX_AGE seconds.
+
+    Arguments:
+        request: client request
+        path: name of the file relative to STATIC_ROOT
+
+    Returns:
+        FileResponse: file content
+        HttpResponseNotModified: if the file was not modified since
+        If-Modified-Since
+    """
+    try:
+        original = safe_join(settings.STATIC_ROOT, path)
+    except ValueError:
+        raise Http404('Static file not found')
+    if not os.path.isfile(original):
+        raise Http404('Static file not found')
+
+    stat = os.stat(original)
+    if not was_modified_since(
+        request.META.get('HTTP_IF_MODIFIED_SINCE'),
+        stat.st_mtime,
+        stat.st_size,
+    ):
+        return HttpResponseNotModified()
+
+    file_path, encoding = encoded_path(
+        staticfiles_storage,
+        path,
+        request.META.get('HTTP_ACCEPT_ENCODING', ''),
+    )
+    content_type, _ = mimetypes.guess_type(original)
+    response = FileResponse(
+        open(file_path, 'rb'),
+        content_type=content_type or 'application/octet-stream',
+    )
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Vary'] = 'Accept-Encoding'
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    is_hashed = getattr(staticfiles_storage, 'is_hashed', None)
+    if is_hashed is not None and is_hashed(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    else:
+        response['Cache-Control'] = 'public, max-age={0}'.format(
+            settings.STATIC_MAX_AGE,
+        )
+    return response
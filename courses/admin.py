@@ -1,5 +1,12 @@
 from django.contrib import admin
-from .models import Subject, Course, Module
+from .models import (
+    Course,
+    CourseProgress,
+    Module,
+    Subject,
+    Submission,
+    WorkspaceRevision,
+)
 
 
 # Register your models here.
@@ -25,3 +32,22 @@ class CourseAdmin(admin.ModelAdmin):
 @admin.register(Module)
 class ModuleAdmin(admin.ModelAdmin):
     list_display = ['title', 'description']
+
+
+@admin.register(CourseProgress)
+class CourseProgressAdmin(admin.ModelAdmin):
+    list_display = ['user', 'course', 'unlocked_order', 'percent_done', 'completed']
+    list_filter = ['course']
+
+
+@admin.register(Submission)
+class SubmissionAdmin(admin.ModelAdmin):
+    list_display = ['user', 'content_type', 'object_id', 'answer', 'is_correct', 'created']
+    list_filter = ['is_correct', 'content_type']
+    raw_id_fields = ['user']
+
+
+@admin.register(WorkspaceRevision)
+class WorkspaceRevisionAdmin(admin.ModelAdmin):
+    list_display = ['user', 'blockly', 'created']
+    raw_id_fields = ['user', 'blockly', 'blob']
@@ -1,5 +1,42 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_init, post_save
 
 
 class CoursesConfig(AppConfig):
     name = 'courses'
+
+    def ready(self):
+        from . import checks  # noqa: F401
+        from .grading import ANSWER_FIELDS
+        from .models import Course, ItemBase, Module, Subject
+        from .signals import (
+            COUNTERS,
+            count_deleted,
+            count_saved,
+            delete_submissions,
+            invalidate_item_render,
+            invalidate_public_pages,
+            regrade_changed_key,
+            remember_answer_key,
+            remember_parent,
+        )
+
+        for model in (Course, Module, Subject):
+            post_save.connect(invalidate_public_pages, sender=model)
+            post_delete.connect(invalidate_public_pages, sender=model)
+
+        for model in self.get_models():
+            if issubclass(model, ItemBase):
+                post_save.connect(invalidate_item_render, sender=model)
+                post_delete.connect(invalidate_item_render, sender=model)
+
+        for model in COUNTERS:
+            post_init.connect(remember_parent, sender=model)
+            post_save.connect(count_saved, sender=model)
+            post_delete.connect(count_deleted, sender=model)
+
+        for model_name in ANSWER_FIELDS:
+            model = self.get_model(model_name)
+            post_init.connect(remember_answer_key, sender=model)
+            post_save.connect(regrade_changed_key, sender=model)
+            post_delete.connect(delete_submissions, sender=model)
@@ -0,0 +1,27 @@
+"""System checks of settings the courses app depends on."""
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """The default cache must be shared by all processes in production.
+
+    Role and page versions, page rebuild locks, login throttling and
+    pending autosaves are kept there, with a cache of one process every
+    worker sees only its own changes.
+    """
+    backend = settings.CACHES.get('default', {}).get('BACKEND')
+    if settings.DEBUG or backend not in PROCESS_CACHES:
+        return []
+    return [Error(
+        'The default cache is not shared between processes.',
+        hint='Use memcached, redis or the database cache.',
+        obj='CACHES',
+        id='courses.E001',
+    )]
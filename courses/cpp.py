@@ -0,0 +1,452 @@
+"""Compile and run C++ solutions of C_plus_plus items on this host.
+
+A solution is compiled with COURSES_CPP_COMPILER and run in child
+processes with resource limits (CPU time, memory, output size, open
+files) and a wall clock timeout, in an empty temporary directory with
+an empty environment.
+
+The compiler and the program are started by the isolation tool of
+COURSES_CPP_SANDBOX_PREFIX (bwrap, firejail...) which must not show
+the project files and the network: a source can #include any readable
+file and print it in compiler messages. '{work_dir}' in the prefix is
+replaced by the temporary directory. Without a prefix nothing is
+compiled (ImproperlyConfigured).
+
+At most COURSES_CPP_WORKERS solutions are compiled or run at once on
+the host: every web process takes one of the slot lock files, others
+wait in the queue up to COURSES_CPP_QUEUE_TIMEOUT seconds.
+
+Binaries and run results are stored in COURSES_CPP_CACHE_DIR by the
+sha256 of the source, an identical solution is never compiled again:
+
+    cache/ab/ab12...ef/program         compiled binary
+    cache/ab/ab12...ef/compile.json    compiler verdict
+    cache/ab/ab12...ef/run-<stdin>.json
+
+A verdict of a compilation or run stopped by the wall clock timeout is
+not stored, it depends on the load of the host. Every use touches the
+entry directory, the clean_cpp_cache command removes the least
+recently used entries above COURSES_CPP_CACHE_SIZE.
+
+The resource limits are set before the isolation tool starts, so they
+apply to the tool too and the program inherits them. Memory and CPU
+time are counted per process: a tool which forks the program (bwrap,
+firejail) does not spend the program's limits, one which execs it
+does. The start-up of the tool always counts against the wall clock
+timeout (twice the CPU limit) and the reported time.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+# statuses of a solution
+ACCEPTED = 'accepted'
+WRONG_ANSWER = 'wrong_answer'
+COMPILE_ERROR = 'compile_error'
+RUNTIME_ERROR = 'runtime_error'
+TIMEOUT = 'timeout'
+
+# characters of compiler and program output kept in verdicts
+OUTPUT_LIMIT = 64 * 1024
+
+
+class JudgeBusy(Exception):
+    """All slots stayed busy for COURSES_CPP_QUEUE_TIMEOUT seconds."""
+
+
+def source_digest(source):
+    """Return sha256 of source and compiler options."""
+    digest = hashlib.sha256()
+    digest.update(' '.join(compiler_command()).encode())
+    digest.update(b'\0')
+    digest.update(source.encode())
+    return digest.hexdigest()
+
+
+def compiler_command():
+    return [settings.COURSES_CPP_COMPILER] + list(settings.COURSES_CPP_FLAGS)
+
+
+def sandbox_configured():
+    """Return True if solutions can be compiled and run."""
+    return bool(settings.COURSES_CPP_SANDBOX_PREFIX)
+
+
+def _sandboxed(command, work_dir):
+    """Return command started by COURSES_CPP_SANDBOX_PREFIX."""
+    if not sandbox_configured():
+        raise ImproperlyConfigured(
+            'COURSES_CPP_SANDBOX_PREFIX is required to run C++ solutions',
+        )
+    return [
+        part.replace('{work_dir}', work_dir)
+        for part in settings.COURSES_CPP_SANDBOX_PREFIX
+    ] + command
+
+
+def _entry_dir(digest):
+    return os.path.join(settings.COURSES_CPP_CACHE_DIR, digest[:2], digest)
+
+
+def _touch(entry):
+    """Mark entry as used now, see evict()."""
+    try:
+        os.utime(entry)
+    except FileNotFoundError:
+        pass
+
+
+def _read_json(path):
+    try:
+        with open(path) as json_file:
+            return json.load(json_file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    temporary_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'w') as json_file:
+        json.dump(data, json_file)
+    os.replace(temporary_path, path)
+
+
+def _limits(cpu_seconds, memory_bytes, file_bytes):
+    """Return preexec_fn which sets resource limits of a child process.
+
+    The child is the isolation tool, the limits pass to the program it
+    starts (see the module docstring).
+    """
+    def set_limits():
+        os.setsid()
+        # SIGXCPU at the soft limit tells a timeout from a crash, the
+        # hard limit kills a program which ignores it
+        resource.setrlimit(
+            resource.RLIMIT_CPU,
+            (cpu_seconds, cpu_seconds + 1),
+        )
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (file_bytes, file_bytes))
+        resource.setrlimit(resource.RLIMIT_NOFILE, (64, 64))
+        resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    return set_limits
+
+
+def _run(command, cwd, stdin, limits, timeout):
+    """Run command with limits.
+
+    Output goes to files in cwd, not to pipes, so the file size limit
+    stops a program which prints forever.
+
+    Arguments:
+        limits: (cpu seconds, memory bytes, written file bytes)
+
+    Returns:
+        tuple: return code (None on timeout), stdout, stderr
+    """
+    stdout = open(os.path.join(cwd, '.stdout'), 'w+b')
+    stderr = open(os.path.join(cwd, '.stderr'), 'w+b')
+    try:
+        process = subprocess.Popen(
+            command,
+            cwd=cwd,
+            stdin=subprocess.PIPE,
+            stdout=stdout,
+            stderr=stderr,
+            env={'PATH': '/usr/local/bin:/usr/bin:/bin', 'LANG': 'C.UTF-8'},
+            preexec_fn=_limits(*limits),
+        )
+        try:
+            process.communicate(stdin.encode(), timeout=timeout)
+        except subprocess.TimeoutExpired:
+            # the whole session, a program may have started children
+            os.killpg(process.pid, signal.SIGKILL)
+            process.communicate()
+            return None, '', ''
+        outputs = []
+        for output in (stdout, stderr):
+            output.seek(0)
+            outputs.append(output.read(OUTPUT_LIMIT).decode(errors='replace'))
+    finally:
+        stdout.close()
+        stderr.close()
+    return (process.returncode, *outputs)
+
+
+class Slot:
+    """One of COURSES_CPP_WORKERS host-wide slots, taken with flock."""
+
+    def __init__(self):
+        self.lock_file = None
+
+    def __enter__(self):
+        directory = os.path.join(settings.COURSES_CPP_CACHE_DIR, 'slots')
+        os.makedirs(directory, exist_ok=True)
+        deadline = time.monotonic() + settings.COURSES_CPP_QUEUE_TIMEOUT
+        # processes start from different slots, so they rarely collide
+        first = os.getpid() % settings.COURSES_CPP_WORKERS
+        while True:
+            for number in range(settings.COURSES_CPP_WORKERS):
+                slot = (first + number) % settings.COURSES_CPP_WORKERS
+                lock_file = open(
+                    os.path.join(directory, '{0}.lock'.format(slot)),
+                    'w',
+                )
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    lock_file.close()
+                    continue
+                self.lock_file = lock_file
+                return self
+            if time.monotonic() >= deadline:
+                raise JudgeBusy('All C++ workers are busy')
+            time.sleep(0.02)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+
+
+class _EntryLock:
+    """Exclusive lock of one cache entry, an identical solution sent by
+    many students at once is compiled (or run) by one of them."""
+
+    def __init__(self, entry, name):
+        os.makedirs(entry, exist_ok=True)
+        self.path = os.path.join(entry, '{0}.lock'.format(name))
+
+    def __enter__(self):
+        self.lock_file = open(self.path, 'w')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+
+
+def compile_source(source):
+    """Compile source once, later calls return the stored verdict.
+
+    Returns:
+        dict: digest, ok, output (compiler messages), cached
+
+    Raises:
+        ImproperlyConfigured: if COURSES_CPP_SANDBOX_PREFIX is not set
+    """
+    if not sandbox_configured():
+        _sandboxed([], '')
+    digest = source_digest(source)
+    entry = _entry_dir(digest)
+    _touch(entry)
+    verdict_path = os.path.join(entry, 'compile.json')
+    verdict = _read_json(verdict_path)
+    if verdict is not None:
+        verdict['cached'] = True
+        return verdict
+
+    with _EntryLock(entry, 'compile'):
+        verdict = _read_json(verdict_path)
+        if verdict is not None:
+            verdict['cached'] = True
+            return verdict
+        with tempfile.TemporaryDirectory() as work_dir:
+            with open(os.path.join(work_dir, 'main.cpp'), 'w') as source_file:
+                source_file.write(source)
+            with Slot():
+                return_code, stdout, stderr = _run(
+                    _sandboxed(
+                        compiler_command() + ['main.cpp', '-o', 'program'],
+                        work_dir,
+                    ),
+                    work_dir,
+                    '',
+                    (
+                        settings.COURSES_CPP_COMPILE_TIMEOUT,
+                        settings.COURSES_CPP_COMPILE_MEMORY,
+                        settings.COURSES_CPP_BINARY_LIMIT,
+                    ),
+                    settings.COURSES_CPP_COMPILE_TIMEOUT * 2,
+                )
+            if return_code == 0:
+                temporary_path = os.path.join(
+                    entry,
+                    'program.{0}.tmp'.format(os.getpid()),
+                )
+                shutil.copy2(
+                    os.path.join(work_dir, 'program'),
+                    temporary_path,
+                )
+                os.replace(temporary_path, os.path.join(entry, 'program'))
+        verdict = {
+            'digest': digest,
+            'ok': return_code == 0,
+            'output': stderr + stdout,
+        }
+        if return_code is None:
+            verdict['output'] = 'Compilation timed out'
+        else:
+            _write_json(verdict_path, verdict)
+    verdict['cached'] = False
+    return verdict
+
+
+def run_source(source, stdin=''):
+    """Compile source and run it with stdin, reusing stored results.
+
+    Returns:
+        dict: digest, status (None if it ran, COMPILE_ERROR,
+        RUNTIME_ERROR or TIMEOUT), stdout, stderr, time (seconds),
+        cached
+    """
+    compiled = compile_source(source)
+    if not compiled['ok']:
+        return {
+            'digest': compiled['digest'],
+            'status': COMPILE_ERROR,
+            'stdout': '',
+            'stderr': compiled['output'],
+            'time': 0,
+            'cached': compiled['cached'],
+        }
+
+    entry = _entry_dir(compiled['digest'])
+    run_path = os.path.join(entry, 'run-{0}.json'.format(
+        hashlib.sha256(stdin.encode()).hexdigest()[:32],
+    ))
+    result = _read_json(run_path)
+    if result is not None:
+        result['cached'] = True
+        return result
+
+    with _EntryLock(entry, 'run'):
+        result = _read_json(run_path)
+        if result is not None:
+            result['cached'] = True
+            return result
+        with tempfile.TemporaryDirectory() as work_dir:
+            # the sandbox shows only the temporary directory
+            program = os.path.join(work_dir, 'program')
+            try:
+                os.link(os.path.join(entry, 'program'), program)
+            except OSError:
+                shutil.copy2(os.path.join(entry, 'program'), program)
+            with Slot():
+                started = time.monotonic()
+                return_code, stdout, stderr = _run(
+                    _sandboxed(['./program'], work_dir),
+                    work_dir,
+                    stdin,
+                    (
+                        settings.COURSES_CPP_RUN_TIMEOUT,
+                        settings.COURSES_CPP_RUN_MEMORY,
+                        settings.COURSES_CPP_OUTPUT_LIMIT,
+                    ),
+                    settings.COURSES_CPP_RUN_TIMEOUT * 2,
+                )
+                elapsed = time.monotonic() - started
+        if return_code in (None, -signal.SIGXCPU, -signal.SIGKILL):
+            status = TIMEOUT
+        elif return_code != 0:
+            status = RUNTIME_ERROR
+            if return_code == -signal.SIGXFSZ:
+                stderr += 'Output limit exceeded'
+        else:
+            status = None
+        result = {
+            'digest': compiled['digest'],
+            'status': status,
+            'stdout': stdout,
+            'stderr': stderr,
+            'time': round(elapsed, 3),
+        }
+        if return_code is not None:
+            _write_json(run_path, result)
+    result['cached'] = False
+    return result
+
+
+def evict(max_bytes=None):
+    """Remove the least recently used cache entries above max_bytes.
+
+    An entry (binary and verdicts of one source) is removed as a whole.
+    An entry used less than a compilation and a run can take, waiting
+    in the queue included, is kept: it may be in use.
+
+    Arguments:
+        max_bytes: size limit, COURSES_CPP_CACHE_SIZE by default
+
+    Returns:
+        int: amount of removed entries
+    """
+    if max_bytes is None:
+        max_bytes = settings.COURSES_CPP_CACHE_SIZE
+    in_use = time.time() - 2 * (
+        settings.COURSES_CPP_QUEUE_TIMEOUT
+        + settings.COURSES_CPP_COMPILE_TIMEOUT * 2
+        + settings.COURSES_CPP_RUN_TIMEOUT * 2
+    )
+    root = settings.COURSES_CPP_CACHE_DIR
+    entries = []
+    for prefix in os.listdir(root) if os.path.isdir(root) else ():
+        # slots/ holds the lock files of the workers
+        if len(prefix) != 2:
+            continue
+        for digest in os.listdir(os.path.join(root, prefix)):
+            entry = os.path.join(root, prefix, digest)
+            try:
+                used = os.stat(entry).st_mtime
+                size = sum(
+                    os.stat(os.path.join(entry, name)).st_size
+                    for name in os.listdir(entry)
+                )
+            except FileNotFoundError:
+                continue
+            entries.append((used, size, entry))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for used, size, entry in sorted(entries):
+        if total <= max_bytes or used > in_use:
+            break
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def normalize_output(output):
+    """Drop trailing spaces of lines and empty lines at the end."""
+    return '\n'.join(line.rstrip() for line in output.strip().splitlines())
+
+
+def judge(source, answer, stdin=''):
+    """Run a solution and compare its output with the expected answer.
+
+    Arguments:
+        source: C++ source
+        answer: expected output (C_plus_plus.answer)
+        stdin: input of the program
+
+    Returns:
+        dict: run_source() result where status is ACCEPTED or
+        WRONG_ANSWER if the program finished
+    """
+    result = run_source(source, stdin)
+    if result['status'] is None:
+        if normalize_output(result['stdout']) == normalize_output(answer):
+            result['status'] = ACCEPTED
+        else:
+            result['status'] = WRONG_ANSWER
+    return result
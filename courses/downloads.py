@@ -0,0 +1,199 @@
+"""Protected downloads of File and Image items.
+
+Only the course owner, enrolled students and staff get the file.
+The file is streamed in blocks, a single HTTP Range is supported, so
+video players and download managers can seek and resume.
+
+With COURSES_DOWNLOAD_ACCEL_HEADER the transfer is handed to the front
+server and the worker is free at once. nginx:
+
+    COURSES_DOWNLOAD_ACCEL_HEADER = 'X-Accel-Redirect'
+    COURSES_DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
+    location /protected-media/ {
+        internal;
+        alias /path/to/media/;
+    }
+
+Apache mod_xsendfile: 'X-Sendfile' with MEDIA_ROOT as the prefix.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.db.models import Q
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from .models import Content, Course
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def user_can_download(user, model_name, item_id):
+    """Return True if user may get the file of the content item.
+
+    Arguments:
+        user: request.user
+        model_name: 'file' or 'image'
+        item_id: id of File or Image
+    """
+    if not user.is_authenticated:
+        return False
+    if user.is_staff:
+        return True
+    course_ids = Content.objects.filter(
+        content_type__app_label='courses',
+        content_type__model=model_name,
+        object_id=item_id,
+    ).values('module__course_id')
+    return Course.objects.filter(
+        Q(owner__user=user) | Q(students__user=user),
+        id__in=course_ids,
+    ).exists()
+
+
+class FileRange:
+    """File object which reads only bytes [start, start + length).
+
+    It has no fileno(), a server's sendfile() would send the whole file.
+    """
+
+    def __init__(self, file_object, start, length):
+        self.file_object = file_object
+        self.file_object.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file_object.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file_object.close()
+
+
+def parse_range(header, size):
+    """Return (start, end) of a single byte range, end is inclusive.
+
+    Returns:
+        tuple: the range, None if the whole file is sent (no header,
+        several ranges, unknown unit), False if it can not be satisfied
+    """
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        suffix = int(end)
+        if suffix == 0:
+            return False
+        return max(size - suffix, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def file_response(request, path, filename, as_attachment=True):
+    """Return the file with Range and conditional requests support.
+
+    Arguments:
+        request: client request
+        path: absolute path of the file
+        filename: name offered to the client
+        as_attachment: download instead of showing in the browser
+
+    Returns:
+        HttpResponse: 200, 206, 304, 412 or 416 response
+    """
+    stat = os.stat(path)
+    etag = quote_etag('{0:x}-{1:x}'.format(
+        int(stat.st_mtime * 1000000),
+        stat.st_size,
+    ))
+    conditional = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(stat.st_mtime),
+    )
+    if conditional is not None:
+        return conditional
+
+    content_type, encoding = mimetypes.guess_type(filename)
+    if encoding:
+        # a .tar.gz is an archive, not a gzipped tar for the browser
+        content_type = 'application/octet-stream'
+    content_type = content_type or 'application/octet-stream'
+    disposition = 'attachment' if as_attachment else 'inline'
+
+    accel_header = settings.COURSES_DOWNLOAD_ACCEL_HEADER
+    if accel_header:
+        response = HttpResponse(content_type=content_type)
+        relative_path = os.path.relpath(path, settings.MEDIA_ROOT)
+        response[accel_header] = (
+            settings.COURSES_DOWNLOAD_ACCEL_PREFIX
+            + relative_path.replace(os.sep, '/')
+        )
+        response['Content-Disposition'] = '{0}; filename="{1}"'.format(
+            disposition,
+            filename.replace('"', ''),
+        )
+        return response
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header and _if_range_matches(request, etag, stat.st_mtime):
+        byte_range = parse_range(range_header, stat.st_size)
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{0}'.format(stat.st_size)
+        return response
+
+    if byte_range is None:
+        response = FileResponse(
+            open(path, 'rb'),
+            as_attachment=as_attachment,
+            filename=filename,
+            content_type=content_type,
+        )
+    else:
+        start, end = byte_range
+        response = FileResponse(
+            FileRange(open(path, 'rb'), start, end - start + 1),
+            status=206,
+            as_attachment=as_attachment,
+            filename=filename,
+            content_type=content_type,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(
+            start,
+            end,
+            stat.st_size,
+        )
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = 'private'
+    return response
+
+
+def _if_range_matches(request, etag, mtime):
+    """Return True if Range may be used (RFC 7233 If-Range)."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and int(mtime) <= if_range_date
@@ -0,0 +1,64 @@
+"""Resolve video urls with django-embed-video backends.
+
+Backends parse the url with regexps, Vimeo and SoundCloud also ask the
+provider API over HTTP, so it is done once when a Video is saved.
+"""
+import logging
+
+import requests
+from embed_video.backends import EmbedVideoException, detect_backend
+
+logger = logging.getLogger(__name__)
+
+# an image which always exists, the backend probes four sizes with HEAD
+YOUTUBE_THUMBNAIL = 'https://img.youtube.com/vi/{0}/hqdefault.jpg'
+
+
+def get_backend(url):
+    """Return the embed-video backend of url or None if it is unknown."""
+    try:
+        backend = detect_backend(url)
+        backend.is_secure = True
+    except EmbedVideoException:
+        return None
+    return backend
+
+
+def embed_fields(backend):
+    """Return provider, video_id and embed_url of a backend.
+
+    Returns:
+        dict: empty strings if the video can not be embedded
+    """
+    fields = {'provider': '', 'video_id': '', 'embed_url': ''}
+    if backend is None:
+        return fields
+    try:
+        fields['video_id'] = backend.code or ''
+        fields['embed_url'] = backend.url or ''
+    except (
+        EmbedVideoException,
+        requests.RequestException,
+        ValueError,
+    ) as error:
+        logger.warning('Video %s can not be embedded: %s', backend._url, error)
+        return {'provider': '', 'video_id': '', 'embed_url': ''}
+    fields['provider'] = backend.backend.replace('Backend', '').lower()
+    return fields
+
+
+def fetch_thumbnail(backend):
+    """Return thumbnail url of the video, '' if the provider has none."""
+    if backend.backend == 'YoutubeBackend':
+        return YOUTUBE_THUMBNAIL.format(backend.code)
+    try:
+        return backend.thumbnail or ''
+    except (
+        EmbedVideoException,
+        requests.RequestException,
+        ValueError,
+        KeyError,
+        AttributeError,
+    ) as error:
+        logger.warning('No thumbnail of video %s: %s', backend._url, error)
+        return ''
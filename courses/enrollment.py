@@ -0,0 +1,78 @@
+"""Selection of students for bulk enrollment into a course.
+
+Used by CourseBulkEnrollView and the enroll_students command:
+
+    {"student_ids": [1, 2, 3]}
+    {"filter": {"city": "Moscow", "age__gte": 10}}
+    {"all": true}
+"""
+from django.core.exceptions import ValidationError
+
+from students.models import Student
+
+# Student fields which can select students for bulk enrollment
+ENROLL_FILTERS = (
+    'city',
+    'status',
+    'age',
+    'age__gte',
+    'age__lte',
+    'signup_confirmation',
+)
+
+
+def clean_filter(filters):
+    """Return filter values converted to Student field types.
+
+    Arguments:
+        filters: dict with ENROLL_FILTERS keys
+
+    Returns:
+        dict: lookups for Student.objects.filter
+
+    Raises:
+        ValueError: if a lookup is unknown or a value is wrong
+    """
+    unknown = set(filters) - set(ENROLL_FILTERS)
+    if unknown:
+        raise ValueError('Unknown filter: {0}'.format(
+            ', '.join(sorted(unknown)),
+        ))
+    cleaned = {}
+    for lookup, value in filters.items():
+        field = Student._meta.get_field(lookup.split('__')[0])
+        if value is None or isinstance(value, (list, dict)):
+            raise ValueError('Wrong {0}: {1!r}'.format(lookup, value))
+        try:
+            cleaned[lookup] = field.to_python(value)
+        except ValidationError as error:
+            raise ValueError('Wrong {0}: {1}'.format(
+                lookup,
+                ' '.join(error.messages),
+            ))
+    return cleaned
+
+
+def get_enroll_students(data):
+    """Return queryset of students selected for bulk enrollment.
+
+    Arguments:
+        data: dict with 'student_ids' list or 'filter' dict with
+        ENROLL_FILTERS keys, {'all': true} selects every student
+
+    Returns:
+        QuerySet: selected students
+
+    Raises:
+        ValueError: if nothing is selected or filter is wrong
+    """
+    students = Student.objects.all()
+    if data.get('student_ids') is not None:
+        return students.filter(
+            id__in=[int(student_id) for student_id in data['student_ids']],
+        )
+    if data.get('filter'):
+        return students.filter(**clean_filter(data['filter']))
+    if data.get('all'):
+        return students
+    raise ValueError('student_ids, filter or all is expected')
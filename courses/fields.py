@@ -1,25 +1,54 @@
 from django.db import models
-from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_save
 
 
 class OrderField(models.PositiveIntegerField):
+    """Position of an object among objects with the same for_fields.
+
+    The next free order is computed by the INSERT (or UPDATE) itself,
+    so saving an object costs no extra query. PostgreSQL returns the
+    allocated value with RETURNING, other databases reload it after save.
+
+    Two transactions inserting into the same parent at once can see the
+    same last order. Models keep (parent, order) unique, so the second
+    INSERT fails instead of storing a duplicate; views which create
+    ordered objects lock the parent row with select_for_update(), so
+    they wait for each other instead of failing. OrderedQuerySet numbers
+    the rows of bulk_create().
+    """
+
     def __init__(self, for_fields=None, *args, **kwargs):
         self.for_fields = for_fields
         super(OrderField, self).__init__(*args, **kwargs)
 
+    @property
+    def db_returning(self):
+        return True
+
+    def contribute_to_class(self, cls, name, **kwargs):
+        super(OrderField, self).contribute_to_class(cls, name, **kwargs)
+        if not cls._meta.abstract:
+            post_save.connect(self.load_order, sender=cls, weak=False)
+
+    def next_order(self, model_instance):
+        """Return SQL expression with the next free order."""
+        qs = self.model._default_manager.order_by('-{}'.format(self.attname))
+        if self.for_fields:
+            query = {field: getattr(model_instance, field)
+                     for field in self.for_fields}
+            qs = qs.filter(**query)
+        last_order = Subquery(qs.values(self.attname)[:1])
+        return Coalesce(last_order + Value(1), Value(0))
+
     def pre_save(self, model_instance, add):
         if getattr(model_instance, self.attname) is None:
-            try:
-                qs = self.model.objects.all()
-                if self.for_fields:
-                    query = {field: getattr(model_instance, field) \
-                             for field in self.for_fields}
-                    qs = qs.filter(**query)
-                last_item = qs.latest(self.attname)
-                value = last_item.order + 1
-            except ObjectDoesNotExist:
-                value = 0
-            setattr(model_instance, self.attname, value)
-            return value
+            return self.next_order(model_instance)
         else:
-            return super(OrderField, self).pre_save(model_instance, add)
\ No newline at end of file
+            return super(OrderField, self).pre_save(model_instance, add)
+
+    def load_order(self, sender, instance, **kwargs):
+        """Reload order which was not returned by the database."""
+        if getattr(instance, self.attname) is None:
+            instance.refresh_from_db(fields=[self.attname])
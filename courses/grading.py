@@ -0,0 +1,71 @@
+"""Normalization and comparison of answers to Question, Blockly and
+Drag_and_drop items.
+
+An answer is compared after normalization: case is folded, runs of
+whitespace become one space, and a number gets one canonical form
+('2,50', ' 2.5 ' and '2.500' are '2.5'). Numbers also match within
+COURSES_GRADING_ABS_TOLERANCE or COURSES_GRADING_REL_TOLERANCE of the
+key, whichever is larger.
+
+The whole normalized text and the number are stored in Submission, so
+the history of an item is re-graded with one UPDATE when the answer key
+changes (SubmissionQuerySet.regrade) with the same result as grading
+in Python.
+"""
+import math
+
+from django.conf import settings
+
+# model name -> field with the answer key
+ANSWER_FIELDS = {
+    'question': 'answer',
+    'blockly': 'answer',
+    'drag_and_drop': 'answer_correct',
+}
+
+
+def parse_number(text):
+    """Return float of a normalized answer or None if it is not a number.
+
+    A decimal comma is accepted, '1,5' is 1.5.
+    """
+    if text.count(',') == 1 and '.' not in text:
+        text = text.replace(',', '.')
+    try:
+        number = float(text.replace(' ', ''))
+    except ValueError:
+        return None
+    if math.isnan(number) or math.isinf(number):
+        return None
+    return number
+
+
+def normalize_answer(answer):
+    """Return (normalized text, number or None) of an answer."""
+    text = ' '.join(str(answer).split()).casefold()
+    number = parse_number(text)
+    if number is not None:
+        text = '{0:.15g}'.format(number)
+    return text, number
+
+
+def tolerance(number):
+    """Return the allowed difference from a numeric key."""
+    return max(
+        settings.COURSES_GRADING_ABS_TOLERANCE,
+        settings.COURSES_GRADING_REL_TOLERANCE * abs(number),
+    )
+
+
+def answers_match(answer, key):
+    """Return True if answer is correct for the answer key."""
+    text, number = normalize_answer(answer)
+    key_text, key_number = normalize_answer(key)
+    if key_number is not None and number is not None:
+        return abs(number - key_number) <= tolerance(key_number)
+    return text == key_text
+
+
+def answer_key(item):
+    """Return the answer key of a graded item."""
+    return getattr(item, ANSWER_FIELDS[item._meta.model_name])
@@ -0,0 +1,70 @@
+"""Resolve embed fields of Video rows saved before they existed."""
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from courses.models import Video
+
+FIELDS = ['provider', 'video_id', 'embed_url', 'thumbnail_url']
+
+
+class Command(BaseCommand):
+    """Fill provider, video_id, embed_url and thumbnail_url of videos.
+
+    Only rows without embed_url are resolved, --all resolves every row
+    again (e.g. to refresh thumbnails):
+
+        python manage.py backfill_video_embeds
+    """
+
+    help = 'Resolve embed fields of Video items'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Resolve videos which already have embed fields',
+        )
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def flush(self, videos):
+        # bulk_update does not set auto_now fields, a new updated makes
+        # fragments rendered by every process outdated
+        now = timezone.now()
+        for video in videos:
+            video.updated = now
+        Video.objects.bulk_update(videos, FIELDS + ['updated'])
+        caches['local'].delete_many(
+            [video.render_cache_key() for video in videos],
+        )
+
+    def handle(self, *args, **options):
+        videos = Video.objects.only('id', 'url', *FIELDS).order_by('id')
+        if not options['all']:
+            videos = videos.filter(embed_url='')
+
+        resolved = 0
+        unknown = 0
+        batch = []
+        for video in videos.iterator():
+            if options['all']:
+                # the thumbnail is requested again
+                video.thumbnail_url = ''
+            video.resolve_embed()
+            if video.embed_url:
+                resolved += 1
+            else:
+                unknown += 1
+            batch.append(video)
+            if len(batch) >= options['batch_size']:
+                self.flush(batch)
+                batch = []
+        if batch:
+            self.flush(batch)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Resolved {0} videos, {1} urls can not be embedded'.format(
+                resolved,
+                unknown,
+            ),
+        ))
@@ -0,0 +1,73 @@
+"""Throughput and latency of the C++ judge under parallel submissions."""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from courses import cpp
+
+SOURCE = '''#include <iostream>
+int main() {{
+    long long a, b, sum = {0};
+    std::cin >> a >> b;
+    for (int i = 0; i < 1000000; ++i) sum += i % 7;
+    std::cout << a + b << std::endl;
+}}
+'''
+
+
+class Command(BaseCommand):
+    """Send many submissions at once, some of them identical, like a
+    class solving one task:
+
+        python manage.py bench_cpp --submissions 200 --distinct 20 --threads 50
+
+    Distinct sources are made unique by the run id, so every run compiles
+    them again.
+    """
+
+    help = 'Benchmark of C++ compile and run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--submissions', type=int, default=200)
+        parser.add_argument('--distinct', type=int, default=20)
+        parser.add_argument('--threads', type=int, default=50)
+
+    def handle(self, *args, **options):
+        run_id = int(time.time() * 1000)
+
+        def submit(number):
+            source = SOURCE.format(
+                run_id * 1000 + number % options['distinct'],
+            )
+            started = time.monotonic()
+            try:
+                result = cpp.judge(source, '5', stdin='2 3')
+            except cpp.JudgeBusy:
+                return 'busy', False, time.monotonic() - started
+            return result['status'], result['cached'], (
+                time.monotonic() - started
+            )
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(submit, range(options['submissions'])))
+        elapsed = time.monotonic() - started
+
+        latencies = sorted(latency for _, _, latency in results)
+        statuses = {}
+        for status, _, _ in results:
+            statuses[status] = statuses.get(status, 0) + 1
+        cached = sum(1 for _, was_cached, _ in results if was_cached)
+        self.stdout.write('Statuses: {0}'.format(statuses))
+        self.stdout.write('Served from cache: {0} of {1}'.format(
+            cached,
+            len(results),
+        ))
+        self.stdout.write('Throughput: {0:.1f} submissions/s'.format(
+            len(results) / elapsed,
+        ))
+        self.stdout.write('Latency p50: {0:.3f} s, p99: {1:.3f} s'.format(
+            latencies[len(latencies) // 2],
+            latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)],
+        ))
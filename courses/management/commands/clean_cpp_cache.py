@@ -0,0 +1,28 @@
+"""Trim the cache of compiled C++ solutions."""
+from django.core.management.base import BaseCommand
+
+from courses.cpp import evict
+
+
+class Command(BaseCommand):
+    """Delete least recently used binaries and verdicts above
+    COURSES_CPP_CACHE_SIZE, run it from cron:
+
+        python manage.py clean_cpp_cache
+    """
+
+    help = 'Remove least recently used compiled C++ solutions'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-bytes',
+            type=int,
+            default=None,
+            help='Size limit of the cache',
+        )
+
+    def handle(self, *args, **options):
+        removed = evict(options['max_bytes'])
+        self.stdout.write(self.style.SUCCESS(
+            'Removed {0} entries'.format(removed),
+        ))
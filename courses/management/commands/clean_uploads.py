@@ -0,0 +1,28 @@
+"""Remove abandoned chunked uploads."""
+from django.core.management.base import BaseCommand
+
+from courses.uploads import remove_expired
+
+
+class Command(BaseCommand):
+    """Delete unfinished uploads older than COURSES_UPLOAD_EXPIRE, run it
+    from cron:
+
+        python manage.py clean_uploads
+    """
+
+    help = 'Remove abandoned chunked uploads'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age',
+            type=int,
+            default=None,
+            help='Seconds since the last chunk',
+        )
+
+    def handle(self, *args, **options):
+        removed = remove_expired(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(
+            'Removed {0} uploads'.format(removed),
+        ))
@@ -0,0 +1,20 @@
+"""Remove stored Blockly workspaces no revision refers to."""
+from django.core.management.base import BaseCommand
+
+from courses.workspaces import remove_unused_blobs
+
+
+class Command(BaseCommand):
+    """Delete workspace blobs left after old revisions were pruned,
+    run it from cron:
+
+        python manage.py clean_workspaces
+    """
+
+    help = 'Remove unused Blockly workspace blobs'
+
+    def handle(self, *args, **options):
+        removed = remove_unused_blobs()
+        self.stdout.write(self.style.SUCCESS(
+            'Removed {0} blobs'.format(removed),
+        ))
@@ -0,0 +1,81 @@
+"""Move guardian 'course_done' grants to CourseProgress."""
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from guardian.models import UserObjectPermission
+
+from courses.models import Course, CourseProgress
+
+
+class Command(BaseCommand):
+    """Convert course_done object permissions to finished progress rows.
+
+    The time of finishing is not stored in grants, the time of the
+    conversion is used. Run it once after the completion fields of
+    courseprogress table are created:
+
+        python manage.py convert_course_done_grants
+    """
+
+    help = 'Convert course_done grants to completed CourseProgress rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--remove-grants',
+            action='store_true',
+            help='Delete the converted guardian grants',
+        )
+
+    def handle(self, *args, **options):
+        grants = UserObjectPermission.objects.filter(
+            permission__codename='course_done',
+            content_type=ContentType.objects.get_for_model(Course),
+        )
+        last_orders = dict(Course.objects.annotate(
+            last_order=Max('modules__order'),
+        ).values_list('id', 'last_order'))
+        done = {
+            (user_id, int(course_pk))
+            for user_id, course_pk in grants.values_list('user_id', 'object_pk')
+            if int(course_pk) in last_orders
+        }
+        now = timezone.now()
+
+        with transaction.atomic():
+            existing = {
+                (progress.user_id, progress.course_id): progress
+                for progress in CourseProgress.objects.select_for_update()
+            }
+            created = []
+            updated = []
+            for user_id, course_id in done:
+                progress = existing.get((user_id, course_id))
+                if progress is None:
+                    progress = CourseProgress(user_id=user_id, course_id=course_id)
+                    created.append(progress)
+                elif progress.completed is None:
+                    updated.append(progress)
+                else:
+                    continue
+                progress.completed = now
+                progress.percent_done = 100
+                progress.unlocked_order = max(
+                    progress.unlocked_order,
+                    last_orders[course_id] or 0,
+                )
+            CourseProgress.objects.bulk_create(created)
+            CourseProgress.objects.bulk_update(
+                updated,
+                ['completed', 'percent_done', 'unlocked_order'],
+            )
+            if options['remove_grants']:
+                grants.delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Created {0}, completed {1} course progress rows'.format(
+                len(created),
+                len(updated),
+            ),
+        ))
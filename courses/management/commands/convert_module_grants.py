@@ -0,0 +1,75 @@
+"""Move guardian 'view_current_module' grants to CourseProgress."""
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from guardian.models import UserObjectPermission
+
+from courses.models import CourseProgress, Module
+
+
+class Command(BaseCommand):
+    """Convert per-module object permissions to course progress rows.
+
+    For every (user, course) the furthest granted module becomes
+    CourseProgress.unlocked_order. Existing progress is never lowered.
+    Run it once after the courseprogress table is created:
+
+        python manage.py convert_module_grants
+    """
+
+    help = 'Convert view_current_module grants to CourseProgress rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--remove-grants',
+            action='store_true',
+            help='Delete the converted guardian grants',
+        )
+
+    def handle(self, *args, **options):
+        grants = UserObjectPermission.objects.filter(
+            permission__codename='view_current_module',
+            content_type=ContentType.objects.get_for_model(Module),
+        )
+        user_modules = list(grants.values_list('user_id', 'object_pk'))
+        modules = Module.objects.in_bulk(
+            {int(module_pk) for _, module_pk in user_modules},
+        )
+
+        furthest = {}
+        for user_id, module_pk in user_modules:
+            module = modules.get(int(module_pk))
+            if module is None:
+                continue
+            key = (user_id, module.course_id)
+            furthest[key] = max(furthest.get(key, 0), module.order)
+
+        with transaction.atomic():
+            existing = {
+                (progress.user_id, progress.course_id): progress
+                for progress in CourseProgress.objects.select_for_update()
+            }
+            created = []
+            updated = []
+            for (user_id, course_id), order in furthest.items():
+                progress = existing.get((user_id, course_id))
+                if progress is None:
+                    created.append(CourseProgress(
+                        user_id=user_id,
+                        course_id=course_id,
+                        unlocked_order=order,
+                    ))
+                elif progress.unlocked_order < order:
+                    progress.unlocked_order = order
+                    updated.append(progress)
+            CourseProgress.objects.bulk_create(created)
+            CourseProgress.objects.bulk_update(updated, ['unlocked_order'])
+            if options['remove_grants']:
+                grants.delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Created {0}, updated {1} course progress rows'.format(
+                len(created),
+                len(updated),
+            ),
+        ))
@@ -0,0 +1,41 @@
+"""Enroll many students into a course."""
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.models import Course
+from courses.enrollment import get_enroll_students
+
+
+class Command(BaseCommand):
+    """Enroll students selected by ids or by a filter.
+
+        python manage.py enroll_students python-basics --ids 1,2,3
+        python manage.py enroll_students python-basics --city Moscow
+        python manage.py enroll_students python-basics --all
+    """
+
+    help = 'Enroll many students into a course'
+
+    def add_arguments(self, parser):
+        parser.add_argument('course', help='Course slug')
+        parser.add_argument('--ids', default=None)
+        parser.add_argument('--city', default=None)
+        parser.add_argument('--all', action='store_true')
+
+    def handle(self, *args, **options):
+        try:
+            course = Course.objects.get(slug=options['course'])
+        except Course.DoesNotExist:
+            raise CommandError('No course {0}'.format(options['course']))
+        data = {'all': options['all']}
+        if options['ids']:
+            data['student_ids'] = options['ids'].split(',')
+        elif options['city']:
+            data['filter'] = {'city': options['city']}
+        try:
+            students = get_enroll_students(data)
+        except ValueError as error:
+            raise CommandError(str(error))
+        enrolled = course.enroll(students.values_list('id', flat=True))
+        self.stdout.write(self.style.SUCCESS(
+            'Enrolled {0} students into {1}'.format(enrolled, course),
+        ))
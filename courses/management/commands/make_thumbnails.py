@@ -0,0 +1,60 @@
+"""Worker which makes resized copies of course images in advance."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses import thumbnails
+from courses.models import Image
+
+
+class Command(BaseCommand):
+    """Make every missing copy of Image items and trim the copies
+    directory, run it from cron or keep it running:
+
+        python manage.py make_thumbnails --evict --loop --interval 300
+    """
+
+    help = 'Make resized copies of course images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--evict',
+            action='store_true',
+            help='Remove least recently used copies above the size limit',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep making copies of new images',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=300,
+            help='Seconds between passes with --loop',
+        )
+
+    def make_pass(self, evict):
+        made = 0
+        failed = 0
+        for image in Image.objects.only('id', 'file').iterator():
+            try:
+                made += thumbnails.make_all(image.file)
+            except thumbnails.IMAGE_ERRORS as error:
+                failed += 1
+                self.stderr.write('Image {0}: {1}'.format(image.id, error))
+        removed = thumbnails.evict() if evict else 0
+        self.stdout.write(self.style.SUCCESS(
+            'Copies in place: {0}, failed images: {1}, evicted: {2}'.format(
+                made,
+                failed,
+                removed,
+            ),
+        ))
+
+    def handle(self, *args, **options):
+        while True:
+            self.make_pass(options['evict'])
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
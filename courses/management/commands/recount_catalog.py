@@ -0,0 +1,47 @@
+"""Recompute the stored catalog counters."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from courses.models import Course, Module, Subject
+
+
+def _count_of(model, parent_field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{parent_field: OuterRef('pk')},
+            ).order_by().values(parent_field).annotate(
+                total=Count('pk'),
+            ).values('total'),
+        ),
+        0,
+    )
+
+
+class Command(BaseCommand):
+    """Set Subject.total_courses and Course.total_modules from scratch.
+
+    The counters are maintained by signals, the command repairs them
+    after raw SQL, bulk operations or fixture loading:
+
+        python manage.py recount_catalog
+    """
+
+    help = 'Recompute course and module counters of the catalog'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            subjects = Subject.objects.update(
+                total_courses=_count_of(Course, 'subject'),
+            )
+            courses = Course.objects.update(
+                total_modules=_count_of(Module, 'course'),
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Recounted {0} subjects and {1} courses'.format(
+                subjects,
+                courses,
+            ),
+        ))
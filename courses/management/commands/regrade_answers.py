@@ -0,0 +1,50 @@
+"""Grade stored answers again with the current answer keys."""
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.grading import ANSWER_FIELDS
+from courses.models import Submission
+
+
+class Command(BaseCommand):
+    """Re-grade submissions of graded items, one UPDATE per item.
+
+    A key changed with save() is re-graded by a signal, the command is
+    for keys changed by QuerySet.update(), imports and new tolerances:
+
+        python manage.py regrade_answers --model question --id 7
+    """
+
+    help = 'Re-grade answers to Question, Blockly and Drag_and_drop items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', choices=sorted(ANSWER_FIELDS))
+        parser.add_argument('--id', type=int, help='Requires --model')
+
+    def handle(self, *args, **options):
+        if options['id'] is not None and not options['model']:
+            raise CommandError('--id requires --model')
+        model_names = [options['model']] if options['model'] else sorted(
+            ANSWER_FIELDS,
+        )
+        items = 0
+        submissions = 0
+        for model_name in model_names:
+            model = apps.get_model('courses', model_name)
+            answered = Submission.objects.filter(
+                content_type=ContentType.objects.get_for_model(model),
+            ).values('object_id')
+            queryset = model.objects.filter(pk__in=answered).only(
+                'id',
+                ANSWER_FIELDS[model_name],
+            )
+            if options['id'] is not None:
+                queryset = queryset.filter(pk=options['id'])
+            for item in queryset.iterator():
+                submissions += Submission.objects.regrade(item)
+                items += 1
+        self.stdout.write('Re-graded {0} submissions of {1} items'.format(
+            submissions,
+            items,
+        ))
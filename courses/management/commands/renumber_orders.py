@@ -0,0 +1,53 @@
+"""Renumber modules and contents which share an order."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F
+
+from courses.models import Content, Module
+
+# ordered model -> parent field
+ORDERED = (
+    (Module, 'course'),
+    (Content, 'module'),
+)
+
+
+class Command(BaseCommand):
+    """Give children of every parent distinct orders 0, 1, 2...
+
+    Run it before the migration which makes (parent, order) unique,
+    rows saved concurrently before could take the same order:
+
+        python manage.py renumber_orders
+    """
+
+    help = 'Renumber modules and contents with duplicated orders'
+
+    def handle(self, *args, **options):
+        for model, parent_field in ORDERED:
+            parent_ids = model.objects.order_by().values(
+                parent_field,
+            ).annotate(
+                total=Count('id'),
+                orders=Count('order', distinct=True),
+            ).filter(total__gt=F('orders')).values_list(
+                parent_field,
+                flat=True,
+            )
+            renumbered = 0
+            for parent_id in parent_ids:
+                with transaction.atomic():
+                    children = model.objects.filter(
+                        **{parent_field: parent_id},
+                    )
+                    children.reorder(list(children.order_by(
+                        'order',
+                        'id',
+                    ).values_list('id', flat=True)))
+                renumbered += 1
+            self.stdout.write(self.style.SUCCESS(
+                'Renumbered {0} of {1} parents'.format(
+                    model._meta.verbose_name_plural,
+                    renumbered,
+                ),
+            ))
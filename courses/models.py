@@ -1,11 +1,23 @@
 """File with classes which describe tables in database."""
 from django.conf import settings
-from django.db import models
+from django.core.cache import caches
+from django.db import models, transaction
+from django.db.models import Avg, Case, Count, F, Max, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 from .fields import OrderField
+from .grading import (
+    ANSWER_FIELDS,
+    answer_key,
+    answers_match,
+    normalize_answer,
+    tolerance,
+)
 from django.template.loader import render_to_string
+from django.urls import reverse
 from students.models import Student, Teacher
 
 
@@ -19,6 +31,8 @@ class Subject(models.Model):
     """
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
+    # kept up to date by courses.signals, see recount_catalog command
+    total_courses = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         """Metadata class.
@@ -39,32 +53,21 @@ class Subject(models.Model):
 class Course(models.Model):
     """Class describes courses_course table in db.
 
-    Note: чтобы проставить атрибут 'course_done', если пользователь закончил курс
-    можно прописать:
+    Note: законченные курсы хранятся в CourseProgress, а не в
+    разрешении 'course_done' (оно осталось для старых данных, см.
+    команду convert_course_done_grants):
 
-        class Meta:
-            permissions = (
-                ('course_done', 'Course done')
-            )
-
-    и отдельно для каждого пользователя можно делать:
-
-        from guardian.shortcuts import assign_perm
-        assign_perm('course_done', student, course)
+        CourseProgress.objects.complete(user, course)
 
-        student.has_perm('course_done', course)
+        CourseProgress.objects.filter(
+            user=user, course=course, completed__isnull=False,
+        ).exists()
         True
-    
-    Это значит для конкретного 'student' и 'course'
-    значение 'course_done' будет свое
 
-    чтобы удалить атрибут:
+    статистика прохождения по курсам и предметам:
 
-        from guardian.shortcuts import remove_perm
-        remove_perm('course_done', student, course)
-
-        student.has_perm('course_done', course)
-        False
+        CourseProgress.objects.course_stats()
+        CourseProgress.objects.subject_stats()
 
     Arguments:
         models.Model: superclass where describe the fields
@@ -88,6 +91,8 @@ class Course(models.Model):
         related_name='courses_joined',
         blank=True,
     )
+    # kept up to date by courses.signals, see recount_catalog command
+    total_modules = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         ordering = ['-created']
@@ -98,10 +103,117 @@ class Course(models.Model):
     def __str__(self):
         return self.title
 
+    def enroll(self, student_ids):
+        """Enroll many students with one INSERT.
+
+        Students who are already enrolled are skipped. No access rows
+        are needed, the first module is open to every enrolled student
+        (see CourseProgress).
+
+        Arguments:
+            student_ids: ids of Student
+
+        Returns:
+            int: amount of newly enrolled students
+        """
+        Enrollment = Course.students.through
+        student_ids = set(student_ids)
+        enrolled = set(Enrollment.objects.filter(
+            course_id=self.id,
+            student_id__in=student_ids,
+        ).values_list('student_id', flat=True))
+        new_ids = student_ids - enrolled
+        Enrollment.objects.bulk_create(
+            [
+                Enrollment(course_id=self.id, student_id=student_id)
+                for student_id in sorted(new_ids)
+            ],
+            ignore_conflicts=True,
+        )
+        return len(new_ids)
+
+
+class OrderedQuerySet(models.QuerySet):
+    """QuerySet for models with OrderField."""
+
+    def _order_field(self):
+        return next(
+            field
+            for field in self.model._meta.fields
+            if isinstance(field, OrderField)
+        )
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Insert objects, numbering those without order per parent.
+
+        OrderField computes the order inside a single INSERT, rows of
+        one multi-row INSERT would all get the same value.
+        """
+        objs = list(objs)
+        field = self._order_field()
+        groups = {}
+        for obj in objs:
+            if getattr(obj, field.attname) is None:
+                parent = tuple(
+                    getattr(obj, name) for name in field.for_fields or ()
+                )
+                groups.setdefault(parent, []).append(obj)
+        with transaction.atomic(using=self.db):
+            for parent, group in groups.items():
+                last_order = self.filter(
+                    **dict(zip(field.for_fields or (), parent))
+                ).aggregate(
+                    last_order=models.Max(field.attname),
+                )['last_order']
+                first = 0 if last_order is None else last_order + 1
+                for number, obj in enumerate(group):
+                    setattr(obj, field.attname, first + number)
+            return super(OrderedQuerySet, self).bulk_create(
+                objs,
+                *args,
+                **kwargs,
+            )
+
+    def reorder(self, pks):
+        """Set order of objects to their position in pks.
+
+        Use it on a related manager, e.g. course.modules.reorder(ids),
+        pks must list every object of the parent exactly once. Orders are
+        unique per parent, so objects are moved above the current orders
+        first and then numbered from 0 with one UPDATE.
+
+        Arguments:
+            pks: primary keys in the new order
+
+        Returns:
+            int: amount of updated objects
+        """
+        if len(set(pks)) != len(pks):
+            raise ValueError('ids contain duplicates')
+        attname = self._order_field().attname
+        with transaction.atomic(using=self.db):
+            current = dict(self.values_list('pk', attname))
+            if set(pks) != set(current):
+                raise ValueError('ids must list every object once')
+            if not pks:
+                return 0
+            self.filter(pk__in=pks).update(
+                **{attname: F(attname) + max(current.values()) + 1},
+            )
+            new_order = Case(
+                *[
+                    When(pk=pk, then=Value(order))
+                    for order, pk in enumerate(pks)
+                ],
+                output_field=models.PositiveIntegerField(),
+            )
+            return self.filter(pk__in=pks).update(**{attname: new_order})
+
 
 class Module(models.Model):
     class Meta:
         ordering = ['order']
+        unique_together = ('course', 'order')
         permissions = (
                 ('view_current_module', 'Can view current module'),
             )
@@ -115,13 +227,252 @@ class Module(models.Model):
     description = models.TextField(blank=True)
     order = OrderField(blank=True, for_fields=['course'])
 
+    objects = OrderedQuerySet.as_manager()
+
     def __str__(self):
         return '{0}. {1}'.format(self.order, self.title)
 
+    def is_passed_by(self, user):
+        """Return True if user answered correctly every graded item.
+
+        A module without Question, Blockly or Drag_and_drop items is
+        always passed, the next module is unlocked when the student
+        marks it done (see students.views.module_done).
+        """
+        graded = set(self.contents.filter(
+            content_type__app_label='courses',
+            content_type__model__in=ANSWER_FIELDS,
+        ).values_list('content_type_id', 'object_id'))
+        if not graded:
+            return True
+        solved = set(Submission.objects.filter(
+            user=user,
+            is_correct=True,
+            content_type_id__in={type_id for type_id, _ in graded},
+            object_id__in={object_id for _, object_id in graded},
+        ).values_list('content_type_id', 'object_id').distinct())
+        return graded <= solved
+
+
+class CourseProgressQuerySet(models.QuerySet):
+    """QuerySet for students progress through courses."""
+
+    def unlocked_order(self, user, course):
+        """Return the furthest module order which user can view.
+
+        Arguments:
+            user: student user
+            course: course which modules are checked
+
+        Returns:
+            int: order of the furthest unlocked module or None
+            if user has not unlocked anything beyond the first module
+        """
+        return self.filter(
+            user=user,
+            course=course,
+        ).values_list('unlocked_order', flat=True).first()
+
+    def unlock(self, user, module):
+        """Open module and all modules before it for user.
+
+        The order only grows, unlocking an earlier module does nothing.
+
+        Arguments:
+            user: student user
+            module: module which becomes available
+        """
+        progress, created = self.get_or_create(
+            user=user,
+            course_id=module.course_id,
+            defaults={'unlocked_order': module.order},
+        )
+        if not created:
+            self.filter(
+                pk=progress.pk,
+                unlocked_order__lt=module.order,
+            ).update(unlocked_order=module.order)
+        total = Course.objects.filter(
+            pk=module.course_id,
+        ).values_list('total_modules', flat=True).first()
+        if total:
+            passed = Module.objects.filter(
+                course_id=module.course_id,
+                order__lt=module.order,
+            ).count()
+            self.filter(
+                pk=progress.pk,
+                percent_done__lt=passed * 100 // total,
+                completed__isnull=True,
+            ).update(percent_done=passed * 100 // total)
+
+    def complete(self, user, course):
+        """Mark course as finished by user.
+
+        Every module of a finished course is unlocked.
+
+        Arguments:
+            user: student user
+            course: finished course
+        """
+        last_order = Module.objects.filter(course=course).aggregate(
+            last=Max('order'),
+        )['last'] or 0
+        progress, created = self.get_or_create(
+            user=user,
+            course=course,
+            defaults={
+                'unlocked_order': last_order,
+                'percent_done': 100,
+                'completed': timezone.now(),
+            },
+        )
+        if not created:
+            self.filter(pk=progress.pk).update(
+                unlocked_order=Greatest('unlocked_order', Value(last_order)),
+                percent_done=100,
+                completed=timezone.now(),
+            )
+
+    def is_unlocked(self, user, module):
+        """Return True if user can view module.
+
+        The first module of a course is always open.
+        """
+        unlocked_order = self.unlocked_order(user, module.course_id)
+        if unlocked_order is not None and module.order <= unlocked_order:
+            return True
+        return not Module.objects.filter(
+            course_id=module.course_id,
+            order__lt=module.order,
+        ).exists()
+
+    def pass_module(self, user, module):
+        """Open the module after module, finish the course after the last.
+
+        Arguments:
+            user: student user
+            module: passed module, it must be unlocked for user
+
+        Returns:
+            Module: opened module, None if the course is completed
+        """
+        next_module = Module.objects.filter(
+            course_id=module.course_id,
+            order__gt=module.order,
+        ).order_by('order').first()
+        if next_module is None:
+            self.complete(user, module.course)
+        else:
+            self.unlock(user, next_module)
+        return next_module
+
+    def pass_solved_modules(self, user, item):
+        """Pass unlocked modules with item where user solved every task.
+
+        Called after a correct answer to item.
+
+        Returns:
+            list: passed modules
+        """
+        modules = Module.objects.filter(
+            contents__content_type=ContentType.objects.get_for_model(item),
+            contents__object_id=item.pk,
+        ).select_related('course').distinct()
+        passed = [
+            module
+            for module in modules
+            if self.is_unlocked(user, module) and module.is_passed_by(user)
+        ]
+        for module in passed:
+            self.pass_module(user, module)
+        return passed
+
+    def _stats(self, *group_by):
+        return self.order_by().values(*group_by).annotate(
+            started=Count('id'),
+            completed_count=Count('completed'),
+            avg_percent_done=Avg('percent_done'),
+        ).order_by(*group_by)
+
+    def course_stats(self):
+        """Return completion stats of every course with one GROUP BY.
+
+        Returns:
+            QuerySet: dicts with course_id, course__title, started,
+            completed_count and avg_percent_done
+        """
+        return self._stats('course_id', 'course__title')
+
+    def subject_stats(self):
+        """Return completion stats of every subject with one GROUP BY.
+
+        Returns:
+            QuerySet: dicts with course__subject_id, course__subject__title,
+            started, completed_count and avg_percent_done
+        """
+        return self._stats('course__subject_id', 'course__subject__title')
+
+
+class CourseProgress(models.Model):
+    """Describe courses_courseprogress table in database.
+
+    One row for each (user, course) pair, it keeps the order of the
+    furthest module which user can view. The first module of a course
+    is always available, so a row appears only when user goes further.
+
+    percent_done: share of modules before the furthest unlocked one
+    completed: when user finished the course, None if not finished
+
+    Arguments:
+        models.Model: superclass where describe the fields
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='course_progress',
+        on_delete=models.CASCADE,
+    )
+    course = models.ForeignKey(
+        Course,
+        related_name='progress',
+        on_delete=models.CASCADE,
+    )
+    unlocked_order = models.PositiveIntegerField(default=0)
+    percent_done = models.PositiveSmallIntegerField(default=0)
+    completed = models.DateTimeField(null=True, blank=True)
+
+    objects = CourseProgressQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('user', 'course')
+        indexes = [
+            models.Index(fields=['course', 'completed']),
+        ]
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.user, self.course)
+
+
+class ContentQuerySet(OrderedQuerySet):
+    """QuerySet for module contents."""
+
+    def with_items(self):
+        """Resolve ``item`` for every content in a fixed number of queries.
+
+        Contents are grouped by ``content_type`` and every concrete
+        ItemBase subclass is loaded with one query, so rendering a module
+        does not cost a query per row.
+
+        Returns:
+            ContentQuerySet: contents with prefetched items
+        """
+        return self.prefetch_related('item')
+
 
 class Content(models.Model):
     class Meta:
         ordering = ['order']
+        unique_together = ('module', 'order')
 
     module = models.ForeignKey(
         Module,
@@ -147,6 +498,8 @@ class Content(models.Model):
     item = GenericForeignKey('content_type', 'object_id')
     order = OrderField(blank=True, for_fields=['module'])
 
+    objects = ContentQuerySet.as_manager()
+
 
 class ItemBase(models.Model):
     owner = models.ForeignKey(
@@ -161,9 +514,32 @@ class ItemBase(models.Model):
     class Meta:
         abstract = True
 
+    def render_cache_key(self):
+        """Return the cache key of the rendered item fragment."""
+        return 'courses:item:{0}:{1}'.format(self._meta.model_name, self.pk)
+
     def render(self):
-        return render_to_string('courses/content/{}.html'.format(
+        """Render the item template, reusing the cached fragment.
+
+        The fragment is stored together with the ``updated`` timestamp
+        it was rendered from, so a stale fragment is never served even
+        if the invalidation signal was missed.
+
+        Returns:
+            str: rendered html of the item
+        """
+        key = self.render_cache_key()
+        cached = caches['local'].get(key)
+        if cached is not None and cached[0] == self.updated:
+            return cached[1]
+        html = render_to_string('courses/content/{}.html'.format(
             self._meta.model_name), {'item': self})
+        caches['local'].set(
+            key,
+            (self.updated, html),
+            settings.COURSES_RENDER_CACHE_TIMEOUT,
+        )
+        return html
 
     def __str__(self):
         return self.title
@@ -198,11 +574,316 @@ class Question(ItemBase):
 class File(ItemBase):
     file = models.FileField(upload_to='files')
 
+    def download_url(self):
+        """Return url of the file, it is given to course members."""
+        return reverse('content_download', args=['file', self.pk])
+
 
 class Image(ItemBase):
     file = models.FileField(upload_to='images')
 
+    def download_url(self):
+        """Return url of the original, it is given to course members."""
+        return reverse('content_download', args=['image', self.pk])
+
+    def thumbnail_url(self, width, image_format):
+        """Return url of the resized copy, it is made on first request."""
+        from .thumbnails import source_digest
+
+        return '{0}?v={1}'.format(
+            reverse('image_thumbnail', args=[self.pk, width, image_format]),
+            source_digest(self.file)[:16],
+        )
+
+    def sources(self):
+        """Return srcset of resized copies for the image template.
+
+        Returns:
+            list: dicts with type (mime type) and srcset, the last one
+            is JPEG with the original as the widest candidate,
+            empty if the file is not a readable image
+        """
+        from .thumbnails import (
+            FORMATS,
+            available_widths,
+            source_size,
+            supported_formats,
+        )
+
+        try:
+            widths = available_widths(self.file)
+        except (OSError, ValueError):
+            return []
+        if not widths:
+            return []
+        sources = []
+        for image_format in supported_formats():
+            candidates = [
+                '{0} {1}w'.format(
+                    self.thumbnail_url(width, image_format),
+                    width,
+                )
+                for width in widths
+            ]
+            if image_format == 'jpeg':
+                candidates.append('{0} {1}w'.format(
+                    self.download_url(),
+                    source_size(self.file)[0],
+                ))
+            sources.append({
+                'type': FORMATS[image_format][1],
+                'srcset': ', '.join(candidates),
+            })
+        return sources
+
 
 class Video(ItemBase):
+    """Video from YouTube, Vimeo or SoundCloud.
+
+    Provider, video id, embed url and thumbnail are resolved with
+    django-embed-video once on save (see backfill_video_embeds command
+    for old rows), the template only reads them.
+    """
     url = models.URLField()
+    provider = models.CharField(max_length=30, blank=True, editable=False)
+    video_id = models.CharField(max_length=100, blank=True, editable=False)
+    embed_url = models.URLField(max_length=500, blank=True, editable=False)
+    thumbnail_url = models.URLField(
+        max_length=500,
+        blank=True,
+        editable=False,
+    )
+
+    def resolve_embed(self):
+        """Fill provider, video_id, embed_url and thumbnail_url from url.
+
+        An unknown or broken url leaves the fields empty, the template
+        shows a plain link then. The thumbnail is requested from the
+        provider only when the video changed.
+        """
+        from .embeds import embed_fields, fetch_thumbnail, get_backend
+
+        backend = get_backend(self.url)
+        self._resolved_url = self.url
+        old_embed_url = self.embed_url
+        for field, value in embed_fields(backend).items():
+            setattr(self, field, value)
+        if not self.embed_url:
+            self.thumbnail_url = ''
+        elif self.embed_url != old_embed_url or not self.thumbnail_url:
+            self.thumbnail_url = fetch_thumbnail(backend)
+
+    def save(self, *args, **kwargs):
+        """Save the video, resolve its url unless it was resolved already.
+
+        Call resolve_embed() before a transaction, the providers are
+        asked over HTTP.
+        """
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'url' in update_fields:
+            if getattr(self, '_resolved_url', None) != self.url:
+                self.resolve_embed()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {
+                    'provider',
+                    'video_id',
+                    'embed_url',
+                    'thumbnail_url',
+                }
+        super().save(*args, **kwargs)
+
+
+class SubmissionQuerySet(models.QuerySet):
+    """QuerySet for answers of students to graded items."""
+
+    def for_item(self, item):
+        return self.filter(
+            content_type=ContentType.objects.get_for_model(item),
+            object_id=item.pk,
+        )
+
+    def submit(self, user, item, answer):
+        """Store an answer of user and grade it at once.
+
+        Arguments:
+            user: student user
+            item: Question, Blockly or Drag_and_drop
+            answer: text of the answer
+
+        Returns:
+            Submission: graded submission
+        """
+        normalized, number = normalize_answer(answer)
+        return self.create(
+            user=user,
+            item=item,
+            answer=answer,
+            normalized=normalized,
+            number=number,
+            is_correct=answers_match(answer, answer_key(item)),
+        )
+
+    def regrade(self, item):
+        """Grade every answer to item again with one UPDATE.
+
+        Used when the answer key of item is changed.
+
+        Returns:
+            int: amount of re-graded submissions
+        """
+        key_text, key_number = normalize_answer(answer_key(item))
+        if key_number is None:
+            correct = When(normalized=key_text, then=Value(True))
+        else:
+            correct = When(
+                number__gte=key_number - tolerance(key_number),
+                number__lte=key_number + tolerance(key_number),
+                then=Value(True),
+            )
+        return self.for_item(item).update(
+            is_correct=Case(
+                correct,
+                default=Value(False),
+                output_field=models.BooleanField(),
+            ),
+            graded=timezone.now(),
+        )
+
+    def item_stats(self):
+        """Return answer stats of every item with one GROUP BY.
+
+        Returns:
+            QuerySet: dicts with content_type__model, object_id,
+            attempts, correct_attempts, students and solved (students
+            with a correct answer)
+        """
+        return self.order_by().values(
+            'content_type__model',
+            'object_id',
+        ).annotate(
+            attempts=Count('id'),
+            correct_attempts=Count('id', filter=Q(is_correct=True)),
+            students=Count('user', distinct=True),
+            solved=Count('user', distinct=True, filter=Q(is_correct=True)),
+        ).order_by('content_type__model', 'object_id')
+
+    def course_stats(self, course):
+        """Return item_stats() of graded items in modules of course."""
+        contents = Content.objects.filter(module__course=course)
+        in_course = Q(pk__in=[])
+        for model_name in ANSWER_FIELDS:
+            in_course |= Q(
+                content_type__app_label='courses',
+                content_type__model=model_name,
+                object_id__in=contents.filter(
+                    content_type__model=model_name,
+                ).values('object_id'),
+            )
+        return self.filter(in_course).item_stats()
+
+
+class Submission(models.Model):
+    """Describe courses_submission table in database.
+
+    An answer of a student to a Question, Blockly or Drag_and_drop item.
+    normalized and number are kept for re-grading without Python, see
+    courses.grading.
+
+    Arguments:
+        models.Model: superclass where describe the fields
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='submissions',
+        on_delete=models.CASCADE,
+    )
+    content_type = models.ForeignKey(
+        ContentType,
+        on_delete=models.CASCADE,
+        limit_choices_to={'model__in': tuple(ANSWER_FIELDS)},
+    )
+    object_id = models.PositiveIntegerField()
+    item = GenericForeignKey('content_type', 'object_id')
+    answer = models.TextField()
+    normalized = models.TextField()
+    number = models.FloatField(null=True, blank=True)
+    is_correct = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    graded = models.DateTimeField(default=timezone.now)
+
+    objects = SubmissionQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created']
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'user']),
+        ]
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.user, self.answer[:50])
+
+
+class WorkspaceBlob(models.Model):
+    """Describe courses_workspaceblob table in database.
+
+    zlib compressed Blockly workspace, one row for every distinct
+    workspace, revisions of all students share equal ones.
+
+    Arguments:
+        models.Model: superclass where describe the fields
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()
 
+    def __str__(self):
+        return self.digest
+
+
+class WorkspaceRevisionQuerySet(models.QuerySet):
+    """QuerySet for saved Blockly workspaces of students."""
+
+    def latest_for(self, user, blockly_id):
+        """Return the newest revision with its blob in one query, it
+        is read from the (user, blockly, id) index."""
+        return self.filter(
+            user=user,
+            blockly_id=blockly_id,
+        ).select_related('blob').order_by('-id').first()
+
+
+class WorkspaceRevision(models.Model):
+    """Describe courses_workspacerevision table in database.
+
+    A saved state of the workspace of user in a Blockly item, see
+    courses.workspaces.
+
+    Arguments:
+        models.Model: superclass where describe the fields
+    """
+    user = models.ForeignKey(
+        User,
+        related_name='workspace_revisions',
+        on_delete=models.CASCADE,
+    )
+    blockly = models.ForeignKey(
+        Blockly,
+        related_name='workspace_revisions',
+        on_delete=models.CASCADE,
+    )
+    blob = models.ForeignKey(
+        WorkspaceBlob,
+        related_name='revisions',
+        on_delete=models.PROTECT,
+    )
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = WorkspaceRevisionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'blockly', 'id']),
+        ]
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.user, self.blockly_id)
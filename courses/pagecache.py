@@ -0,0 +1,79 @@
+"""Full-response cache for public course pages.
+
+Only anonymous GET requests are served from the cache, everyone sees
+the same html there. Cached pages are keyed by a catalog version which
+is rotated whenever a Course, Module or Subject changes.
+
+When a page is missing only one request rebuilds it, the others get the
+previous (stale) copy of the page or wait for the rebuild. The version
+and the rebuild lock work across workers only with a shared default
+cache, the courses.E001 check requires one in production.
+"""
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'courses:page:version'
+PAGE_KEY = 'courses:page:{0}:{1}'
+STALE_KEY = 'courses:page:stale:{0}'
+LOCK_KEY = 'courses:page:lock:{0}'
+
+# seconds a rebuild may hold the lock
+LOCK_TIMEOUT = 30
+# seconds to wait for a concurrent rebuild when no stale page exists
+WAIT_TIMEOUT = 5
+WAIT_STEP = 0.05
+
+
+def invalidate_pages():
+    """Make every cached public page outdated."""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def _is_cacheable(response):
+    return response.status_code == 200 and not response.cookies
+
+
+def get_cached_page(name, build):
+    """Return cached response of the page called name.
+
+    Arguments:
+        name: page key, e.g. 'course_detail:python'
+        build: callable which renders the response
+
+    Returns:
+        HttpResponse: cached, stale or freshly built response
+    """
+    version = cache.get_or_set(VERSION_KEY, uuid.uuid4().hex, None)
+    key = PAGE_KEY.format(version, name)
+    response = cache.get(key)
+    if response is not None:
+        return response
+
+    lock_key = LOCK_KEY.format(name)
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        stale = cache.get(STALE_KEY.format(name))
+        if stale is not None:
+            return stale
+        if time.monotonic() >= deadline:
+            return build()
+        time.sleep(WAIT_STEP)
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+    try:
+        response = build()
+        if _is_cacheable(response):
+            cache.set(key, response, settings.COURSES_PAGE_CACHE_TIMEOUT)
+            cache.set(
+                STALE_KEY.format(name),
+                response,
+                settings.COURSES_PAGE_CACHE_STALE_TIMEOUT,
+            )
+    finally:
+        cache.delete(lock_key)
+    return response
@@ -0,0 +1,87 @@
+"""Signal handlers which keep courses caches in sync with the database."""
+from django.core.cache import caches
+from django.db.models import F
+
+from .grading import ANSWER_FIELDS
+from .models import Course, Module, Submission, Subject
+from .pagecache import invalidate_pages
+
+
+def invalidate_item_render(sender, instance, **kwargs):
+    """Drop the cached fragment of a saved or deleted ItemBase item."""
+    caches['local'].delete(instance.render_cache_key())
+
+
+# counted model -> (parent field, parent model, parent counter field)
+COUNTERS = {
+    Course: ('subject_id', Subject, 'total_courses'),
+    Module: ('course_id', Course, 'total_modules'),
+}
+
+
+def _change_counter(model, pk, field, delta):
+    if pk is not None:
+        model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def remember_parent(sender, instance, **kwargs):
+    """Remember the parent of a loaded Course or Module.
+
+    It lets count_saved() notice that the object was moved.
+    """
+    parent_field = COUNTERS[sender][0]
+    # a deferred parent field is not loaded here, it would cost a query
+    if parent_field in instance.__dict__:
+        instance._counted_parent_id = instance.__dict__[parent_field]
+
+
+def count_saved(sender, instance, created, raw=False, **kwargs):
+    """Update the parent counter of a created or moved Course or Module."""
+    if raw:
+        return
+    parent_field, parent_model, counter = COUNTERS[sender]
+    parent_id = getattr(instance, parent_field)
+    if created:
+        old_parent_id = None
+    else:
+        old_parent_id = getattr(instance, '_counted_parent_id', parent_id)
+    if parent_id != old_parent_id:
+        _change_counter(parent_model, old_parent_id, counter, -1)
+        _change_counter(parent_model, parent_id, counter, 1)
+    instance._counted_parent_id = parent_id
+
+
+def count_deleted(sender, instance, **kwargs):
+    """Update the parent counter of a deleted Course or Module."""
+    parent_field, parent_model, counter = COUNTERS[sender]
+    _change_counter(parent_model, getattr(instance, parent_field), counter, -1)
+
+
+def invalidate_public_pages(sender, **kwargs):
+    """Drop cached public pages after a catalog change."""
+    invalidate_pages()
+
+
+def remember_answer_key(sender, instance, **kwargs):
+    """Remember the answer key of a loaded graded item."""
+    field = ANSWER_FIELDS[sender._meta.model_name]
+    if field in instance.__dict__:
+        instance._graded_key = instance.__dict__[field]
+
+
+def regrade_changed_key(sender, instance, created, raw=False, **kwargs):
+    """Re-grade the answers to an item whose answer key was changed."""
+    field = ANSWER_FIELDS[sender._meta.model_name]
+    key = getattr(instance, field)
+    if not created and not raw and key != getattr(
+        instance,
+        '_graded_key',
+        key,
+    ):
+        Submission.objects.regrade(instance)
+    instance._graded_key = key
+
+
+def delete_submissions(sender, instance, **kwargs):
+    """Delete the answers to a deleted graded item."""
+    Submission.objects.for_item(instance).delete()
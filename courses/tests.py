@@ -1,3 +1,918 @@
-from django.test import TestCase
+import datetime
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from PIL import Image as PillowImage
+
+from assets.tests import static_not_collected
+from courses import cpp, pagecache, thumbnails, workspaces
+from courses.models import (
+    Blockly,
+    C_plus_plus,
+    Content,
+    Course,
+    CourseProgress,
+    File,
+    Image,
+    Module,
+    Question,
+    Subject,
+    Submission,
+    Text,
+    Video,
+    WorkspaceBlob,
+    WorkspaceRevision,
+)
+from students.models import Student, StudentStatus, Teacher, TeacherStatus
+
+
+def create_course(title='Python', slug='python', modules=3):
+    """Create a teacher with a course of modules and an enrolled student.
+
+    Returns:
+        tuple: course, list of modules, student user
+    """
+    # default statuses of new students and teachers
+    StudentStatus.objects.get_or_create(id=1, name='lead')
+    TeacherStatus.objects.get_or_create(id=1, name='Teacher')
+    teacher = Teacher.objects.create(
+        user=User.objects.create_user('teacher', 'teacher@example.com', 'pw'),
+        name='Teacher',
+    )
+    subject = Subject.objects.create(title='Программирование', slug='code')
+    course = Course.objects.create(
+        owner=teacher,
+        subject=subject,
+        title=title,
+        slug=slug,
+        overview='Overview',
+    )
+    module_list = [
+        Module.objects.create(course=course, title='Module {0}'.format(number))
+        for number in range(modules)
+    ]
+    student_user = User.objects.create_user(
+        'student',
+        'student@example.com',
+        'pw',
+    )
+    course.students.add(Student.objects.create(user=student_user, name='S'))
+    return course, module_list, student_user
+
+
+class PageCacheTest(TestCase):
+
+    def setUp(self):
+        self.course, _, _ = create_course()
+
+    def test_anonymous_page_is_cached(self):
+        with static_not_collected(self):
+            self.client.get('/courses/')
+            built = []
+            response = pagecache.get_cached_page(
+                'course_list',
+                lambda: built.append(1),
+            )
+            self.assertContains(response, 'Python')
+            self.assertEqual(built, [])
+
+    def test_catalog_change_invalidates_pages(self):
+        with static_not_collected(self):
+            self.assertNotContains(self.client.get('/courses/'), 'Django')
+            Course.objects.create(
+                owner=self.course.owner,
+                subject=self.course.subject,
+                title='Django',
+                slug='django',
+                overview='Overview',
+            )
+            self.assertContains(self.client.get('/courses/'), 'Django')
+
+    def test_stale_page_is_served_during_rebuild(self):
+        with static_not_collected(self):
+            self.client.get('/courses/')
+            pagecache.invalidate_pages()
+            # another process is rebuilding the page
+            pagecache.cache.add(pagecache.LOCK_KEY.format('course_list'), 1)
+            response = pagecache.get_cached_page(
+                'course_list',
+                lambda: self.fail('the page must not be built twice'),
+            )
+            self.assertContains(response, 'Python')
+
+
+class OrderFieldTest(TestCase):
+
+    def setUp(self):
+        self.course, self.modules, _ = create_course(modules=0)
+
+    def test_orders_follow_inserts(self):
+        modules = [
+            Module.objects.create(course=self.course, title=str(number))
+            for number in range(3)
+        ]
+        self.assertEqual([module.order for module in modules], [0, 1, 2])
+
+    def test_bulk_create_numbers_each_parent(self):
+        Module.objects.create(course=self.course, title='first')
+        Module.objects.bulk_create([
+            Module(course=self.course, title=str(number))
+            for number in range(3)
+        ])
+        self.assertEqual(
+            list(self.course.modules.values_list('order', flat=True)),
+            [0, 1, 2, 3],
+        )
+
+    def test_duplicated_order_is_rejected(self):
+        Module.objects.create(course=self.course, title='first', order=0)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Module.objects.create(course=self.course, title='copy', order=0)
+
+    def test_reorder(self):
+        first, second, third = [
+            Module.objects.create(course=self.course, title=str(number))
+            for number in range(3)
+        ]
+        self.assertEqual(
+            self.course.modules.reorder([third.id, first.id, second.id]),
+            3,
+        )
+        self.assertEqual(
+            list(self.course.modules.values_list('id', flat=True)),
+            [third.id, first.id, second.id],
+        )
+        with self.assertRaises(ValueError):
+            self.course.modules.reorder([third.id, first.id])
+        with self.assertRaises(ValueError):
+            self.course.modules.reorder([third.id, first.id, first.id])
+
+    def test_order_view_rejects_incomplete_ids(self):
+        first, second = [
+            Module.objects.create(course=self.course, title=str(number))
+            for number in range(2)
+        ]
+        self.client.login(username='teacher', password='pw')
+        url = '/courses/{0}/module/order/'.format(self.course.id)
+        response = self.client.post(
+            url,
+            json.dumps({'ids': [second.id]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(
+            url,
+            json.dumps({'ids': [second.id, first.id]}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.json(), {'updated': 2})
+
+
+class CatalogCounterTest(TestCase):
+
+    def setUp(self):
+        self.course, self.modules, _ = create_course(modules=2)
+        self.other = Course.objects.create(
+            owner=self.course.owner,
+            subject=Subject.objects.create(title='Математика', slug='math'),
+            title='Algebra',
+            slug='algebra',
+            overview='Overview',
+        )
+
+    def assertCounters(self, total_courses, total_modules):
+        self.assertEqual(
+            list(Subject.objects.order_by('id').values_list(
+                'total_courses',
+                flat=True,
+            )),
+            total_courses,
+        )
+        self.assertEqual(
+            list(Course.objects.order_by('id').values_list(
+                'total_modules',
+                flat=True,
+            )),
+            total_modules,
+        )
+
+    def test_counters_follow_changes(self):
+        self.assertCounters([1, 1], [2, 0])
+
+        module = Module.objects.get(id=self.modules[0].id)
+        module.course = self.other
+        module.save()
+        self.assertCounters([1, 1], [1, 1])
+
+        course = Course.objects.get(id=self.other.id)
+        course.subject = self.course.subject
+        course.save()
+        self.assertCounters([2, 0], [1, 1])
+
+        Module.objects.create(course=self.other, title='Module')
+        self.modules[1].delete()
+        self.assertCounters([2, 0], [0, 2])
+
+        course.delete()
+        self.assertCounters([1, 0], [0])
+
+    def test_recount_repairs_bulk_changes(self):
+        Module.objects.bulk_create([
+            Module(course=self.other, title='Module', order=number)
+            for number in range(3)
+        ])
+        Course.objects.filter(id=self.other.id).update(
+            subject=self.course.subject,
+        )
+        self.assertCounters([1, 1], [2, 0])
+
+        call_command('recount_catalog', stdout=io.StringIO())
+        self.assertCounters([2, 0], [2, 3])
+
+
+class BulkEnrollTest(TestCase):
+
+    def setUp(self):
+        self.course, _, _ = create_course(modules=1)
+        for number, city in enumerate(('Moscow', 'Moscow', 'Kazan')):
+            Student.objects.create(
+                user=User.objects.create_user('pupil{0}'.format(number)),
+                name='Pupil',
+                city=city,
+                age=10 + number,
+            )
+        self.client.login(username='teacher', password='pw')
+
+    def enroll(self, data):
+        return self.client.post(
+            reverse('course_bulk_enroll', args=[self.course.id]),
+            json.dumps(data),
+            content_type='application/json',
+        )
+
+    def test_filter_selects_students(self):
+        response = self.enroll({
+            'filter': {'city': 'Moscow', 'age__gte': '11'},
+        })
+        self.assertEqual(response.json(), {'enrolled': 1})
+        response = self.enroll({'all': True})
+        self.assertEqual(response.json(), {'enrolled': 2})
+
+    def test_wrong_filter_is_bad_request(self):
+        for data in (
+            {'filter': {'signup_confirmation': 'maybe'}},
+            {'filter': {'age__gte': 'ten'}},
+            {'filter': {'status': [1]}},
+            {'filter': {'user__password': 'x'}},
+            {'student_ids': ['one']},
+            ['all'],
+        ):
+            self.assertEqual(self.enroll(data).status_code, 400, data)
+        self.assertEqual(self.course.students.count(), 1)
+
+
+class CourseProgressTest(TestCase):
+
+    def setUp(self):
+        self.course, self.modules, self.student = create_course(modules=4)
+        self.question = Question.objects.create(
+            owner=self.course.owner.user,
+            title='Question',
+            content='2 + 2?',
+            answer='4',
+        )
+        Content.objects.create(module=self.modules[0], item=self.question)
+        self.client.login(username='student', password='pw')
+
+    def answer(self, answer):
+        return self.client.post(
+            reverse('submit_answer', args=['question', self.question.id]),
+            json.dumps({'answer': answer}),
+            content_type='application/json',
+        ).json()
+
+    def module_done(self, module):
+        return self.client.post(reverse(
+            'student_module_done',
+            args=[self.course.id, module.id],
+        ))
+
+    def progress(self):
+        return CourseProgress.objects.filter(
+            user=self.student,
+            course=self.course,
+        ).values_list('unlocked_order', 'percent_done', 'completed').first()
+
+    def test_correct_answer_opens_next_module(self):
+        self.assertFalse(self.answer('5')['correct'])
+        self.module_done(self.modules[0])
+        self.assertIsNone(self.progress())
+
+        self.assertEqual(
+            self.answer(' 4.0 ')['passed_modules'],
+            [self.modules[0].id],
+        )
+        self.assertEqual(self.progress(), (self.modules[1].order, 25, None))
+
+    def test_percent_done_reaches_stats(self):
+        self.answer('4')
+        for module in self.modules[1:]:
+            self.module_done(module)
+        _, percent_done, completed = self.progress()
+        self.assertEqual(percent_done, 100)
+        self.assertIsNotNone(completed)
+
+        self.client.force_login(
+            User.objects.create_user('staff', is_staff=True),
+        )
+        stats = self.client.get(reverse('course_completion_stats')).json()
+        self.assertEqual(stats['courses'], [{
+            'course_id': self.course.id,
+            'course__title': self.course.title,
+            'started': 1,
+            'completed_count': 1,
+            'avg_percent_done': 100.0,
+        }])
+
+    def test_completed_course_stays_open(self):
+        # the first module does not have order 0 after a reordering
+        Module.objects.filter(course=self.course).update(order=F('order') + 5)
+        CourseProgress.objects.complete(self.student, self.course)
+        self.assertEqual(self.progress()[0], self.modules[-1].order + 5)
+        with static_not_collected(self):
+            for module in self.modules:
+                response = self.client.get(reverse(
+                    'student_course_detail_module',
+                    args=[self.course.id, module.id],
+                ))
+                self.assertEqual(response.status_code, 200)
+
+    def test_locked_module_cannot_be_passed(self):
+        response = self.module_done(self.modules[2])
+        self.assertEqual(response.status_code, 403)
+        self.assertIsNone(self.progress())
+
+
+class ThumbnailTest(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        caches['local'].clear()
+
+        course, modules, _ = create_course(modules=1)
+        output = io.BytesIO()
+        PillowImage.new('RGB', (700, 10), (0, 128, 255)).save(output, 'PNG')
+        self.image = Image(owner=course.owner.user, title='Image')
+        self.image.file.save('wide.png', ContentFile(output.getvalue()))
+        Content.objects.create(module=modules[0], item=self.image)
+        self.client.login(username='student', password='pw')
+
+    def get_thumbnail(self):
+        response = self.client.get(
+            reverse('image_thumbnail', args=[self.image.id, 320, 'jpeg']),
+        )
+        self.addCleanup(response.close)
+        return response
+
+    def test_thumbnail_is_made(self):
+        self.assertEqual(
+            thumbnails.available_widths(self.image.file),
+            [320, 640],
+        )
+        self.assertEqual(self.get_thumbnail().status_code, 200)
+
+    def test_decompression_bomb_has_no_thumbnails(self):
+        # 7000 pixels are more than twice the limit
+        with mock.patch.object(PillowImage, 'MAX_IMAGE_PIXELS', 3000):
+            widths = thumbnails.available_widths(self.image.file)
+            self.assertEqual(widths, [])
+            self.assertEqual(thumbnails.make_all(self.image.file), 0)
+            self.assertEqual(self.get_thumbnail().status_code, 404)
+
+
+class DownloadTest(TestCase):
+
+    content = b'0123456789'
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(
+            MEDIA_ROOT=media_root,
+            COURSES_DOWNLOAD_ACCEL_HEADER=None,
+        )
+        media.enable()
+        self.addCleanup(media.disable)
+
+        course, modules, _ = create_course(modules=1)
+        self.file = File(owner=course.owner.user, title='File')
+        self.file.file.save('notes.txt', ContentFile(self.content))
+        Content.objects.create(module=modules[0], item=self.file)
+        self.client.login(username='student', password='pw')
+
+    def get(self, **headers):
+        response = self.client.get(
+            reverse('content_download', args=['file', self.file.id]),
+            **headers
+        )
+        self.addCleanup(response.close)
+        return response
+
+    def test_whole_file(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment; filename="notes.txt"',
+                      response['Content-Disposition'])
+
+    def test_ranges(self):
+        for header, status, body, content_range in (
+            ('bytes=2-5', 206, b'2345', 'bytes 2-5/10'),
+            ('bytes=7-', 206, b'789', 'bytes 7-9/10'),
+            ('bytes=-3', 206, b'789', 'bytes 7-9/10'),
+            ('bytes=8-100', 206, b'89', 'bytes 8-9/10'),
+            ('bytes=0-1,4-5', 200, self.content, None),
+        ):
+            response = self.get(HTTP_RANGE=header)
+            self.assertEqual(response.status_code, status, header)
+            self.assertEqual(b''.join(response.streaming_content), body)
+            self.assertEqual(response.get('Content-Range'), content_range)
+
+        response = self.get(HTTP_RANGE='bytes=10-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_conditional_requests(self):
+        first = self.get()
+        etag = first['ETag']
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.get(HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        # If-Range with an outdated validator returns the whole new file
+        response = self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"')
+        self.assertEqual(response.status_code, 200)
+        response = self.get(HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    def test_only_course_members_download(self):
+        User.objects.create_user('outsider', password='pw')
+        self.client.login(username='outsider', password='pw')
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_front_server_sends_the_file(self):
+        with override_settings(
+            COURSES_DOWNLOAD_ACCEL_HEADER='X-Accel-Redirect',
+            COURSES_DOWNLOAD_ACCEL_PREFIX='/protected-media/',
+        ):
+            response = self.get()
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected-media/' + self.file.file.name,
+        )
+        self.assertEqual(response.content, b'')
+
+
+class ChunkedUploadTest(TestCase):
+
+    data = b'chunked upload ' * 100
+
+    def setUp(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        temp_settings = override_settings(
+            MEDIA_ROOT=os.path.join(temp_dir, 'media'),
+            COURSES_UPLOAD_TEMP_DIR=os.path.join(temp_dir, 'uploads'),
+            COURSES_UPLOAD_CHUNK_SIZE=1000,
+            COURSES_UPLOAD_MAX_PENDING=2,
+        )
+        temp_settings.enable()
+        self.addCleanup(temp_settings.disable)
+        self.course, self.modules, _ = create_course(modules=2)
+        self.client.login(username='teacher', password='pw')
+
+    def start(self, module):
+        return self.client.post(
+            reverse('upload_start'),
+            json.dumps({
+                'module': module.id,
+                'filename': 'notes.txt',
+                'size': len(self.data),
+                'sha256': hashlib.sha256(self.data).hexdigest(),
+            }),
+            content_type='application/json',
+        )
+
+    def send(self, upload_id):
+        for offset in range(0, len(self.data), 1000):
+            response = self.client.put(
+                reverse('upload_chunk', args=[upload_id]),
+                self.data[offset:offset + 1000],
+                content_type='application/octet-stream',
+                HTTP_UPLOAD_OFFSET=str(offset),
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def attach(self, module, upload_id):
+        return self.client.post(
+            reverse(
+                'module_content_upload',
+                args=[module.id, 'file', upload_id],
+            ),
+            {'title': 'Notes'},
+        )
+
+    def test_upload_is_attached_to_its_module(self):
+        upload_id = self.start(self.modules[0]).json()['id']
+        self.send(upload_id)
+        response = self.attach(self.modules[1], upload_id)
+        self.assertEqual(response.status_code, 404)
+        response = self.attach(self.modules[0], upload_id)
+        self.assertEqual(response.status_code, 201)
+        item = File.objects.get(id=response.json()['id'])
+        with item.file.open('rb') as stored:
+            self.assertEqual(stored.read(), self.data)
+        self.assertEqual(self.modules[0].contents.count(), 1)
+
+    def test_only_course_owner_starts_upload(self):
+        self.client.login(username='student', password='pw')
+        self.assertEqual(self.start(self.modules[0]).status_code, 404)
+        response = self.client.post(
+            reverse('upload_start'),
+            json.dumps({'filename': 'notes.txt', 'size': 1}),
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_unfinished_uploads_are_limited(self):
+        first = self.start(self.modules[0]).json()['id']
+        self.assertEqual(self.start(self.modules[0]).status_code, 201)
+        self.assertEqual(self.start(self.modules[1]).status_code, 429)
+
+        # an expired upload does not count
+        user_id = User.objects.get(username='teacher').id
+        part_path = os.path.join(
+            settings.COURSES_UPLOAD_TEMP_DIR,
+            str(user_id),
+            first,
+            'data.part',
+        )
+        expired = time.time() - settings.COURSES_UPLOAD_EXPIRE - 1
+        os.utime(part_path, (expired, expired))
+        self.assertEqual(self.start(self.modules[1]).status_code, 201)
+        self.assertFalse(os.path.exists(part_path))
+
+
+class VideoEmbedTest(TestCase):
+
+    url = 'https://www.youtube.com/watch?v=jNQXAC9IVRw'
+    fields = {
+        'provider': 'youtube',
+        'video_id': 'jNQXAC9IVRw',
+        'embed_url': 'https://www.youtube.com/embed/jNQXAC9IVRw?wmode=opaque',
+    }
+
+    def setUp(self):
+        self.course, self.modules, _ = create_course(modules=1)
+        self.client.login(username='teacher', password='pw')
+
+    def test_url_is_resolved_before_the_transaction(self):
+        # savepoints of the test case itself
+        depth = len(connection.savepoint_ids)
+        depths = []
+
+        def embed_fields(backend):
+            depths.append(len(connection.savepoint_ids))
+            return dict(self.fields)
+
+        with mock.patch('courses.embeds.embed_fields', embed_fields), \
+                mock.patch('courses.embeds.fetch_thumbnail', return_value=''):
+            response = self.client.post(
+                reverse('module_content_create', args=[
+                    self.modules[0].id,
+                    'video',
+                ]),
+                {'title': 'First video', 'url': self.url},
+            )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(depths, [depth])
+        video = Video.objects.get()
+        self.assertEqual(video.embed_url, self.fields['embed_url'])
+        self.assertEqual(self.modules[0].contents.get().item, video)
+
+    def test_backfill_moves_updated(self):
+        with mock.patch('courses.embeds.get_backend', return_value=None):
+            video = Video.objects.create(
+                owner=self.course.owner.user,
+                title='First video',
+                url=self.url,
+            )
+        old = timezone.now() - datetime.timedelta(days=1)
+        Video.objects.filter(id=video.id).update(updated=old)
+
+        with mock.patch(
+            'courses.embeds.embed_fields',
+            return_value=dict(self.fields),
+        ), mock.patch('courses.embeds.fetch_thumbnail', return_value=''):
+            call_command('backfill_video_embeds', stdout=io.StringIO())
+        video.refresh_from_db()
+        self.assertEqual(video.embed_url, self.fields['embed_url'])
+        self.assertGreater(video.updated, old)
+
+
+@skipUnless(shutil.which('g++'), 'g++ is not installed')
+class CppJudgeTest(TestCase):
+
+    source = (
+        '#include <iostream>\n'
+        'int main() { int a, b; std::cin >> a >> b; std::cout << a + b; }\n'
+    )
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        # env only passes the command through, a real server sets bwrap
+        judge_settings = override_settings(
+            COURSES_CPP_CACHE_DIR=cache_dir,
+            COURSES_CPP_SANDBOX_PREFIX=['env', 'SANDBOX={work_dir}'],
+            COURSES_CPP_RUN_TIMEOUT=1,
+        )
+        judge_settings.enable()
+        self.addCleanup(judge_settings.disable)
+
+    def test_compiler_and_program_run_in_sandbox(self):
+        commands = []
+        run = cpp._run
+
+        def sandboxed_run(command, cwd, *args):
+            commands.append(command)
+            return run(command, cwd, *args)
+
+        with mock.patch('courses.cpp._run', sandboxed_run):
+            result = cpp.run_source(self.source, '2 3')
+        self.assertEqual(result['stdout'], '5')
+        self.assertEqual(len(commands), 2)
+        for command in commands:
+            self.assertEqual(command[0], 'env')
+            self.assertTrue(command[1].startswith('SANDBOX=/'))
+        self.assertEqual(commands[1][2:], ['./program'])
+        self.assertTrue(cpp.run_source(self.source, '2 3')['cached'])
+
+    def test_wall_clock_timeout_is_not_stored(self):
+        source = '#include <unistd.h>\nint main() { sleep(10); }\n'
+        self.assertEqual(cpp.run_source(source)['status'], cpp.TIMEOUT)
+        entry = cpp._entry_dir(cpp.source_digest(source))
+        self.assertEqual(
+            [name for name in os.listdir(entry) if name.startswith('run-')],
+            [],
+        )
+
+    def test_least_recently_used_entries_are_evicted(self):
+        entries = []
+        for number in range(3):
+            entry = cpp._entry_dir(cpp.source_digest(str(number)))
+            os.makedirs(entry)
+            with open(os.path.join(entry, 'program'), 'wb') as program:
+                program.write(b'\0' * 100)
+            entries.append(entry)
+        # the first entry is the oldest, the last one may still be used
+        used = time.time() - 60 * 60
+        for entry in entries[:2]:
+            used += 60
+            os.utime(entry, (used, used))
+
+        call_command('clean_cpp_cache', max_bytes=250, stdout=io.StringIO())
+        self.assertEqual(
+            [os.path.exists(entry) for entry in entries],
+            [False, True, True],
+        )
+        self.assertEqual(cpp.evict(0), 1)
+        self.assertEqual(
+            [os.path.exists(entry) for entry in entries],
+            [False, False, True],
+        )
+
+    def test_no_sandbox_no_judge(self):
+        course, modules, _ = create_course(modules=1)
+        item = C_plus_plus.objects.create(
+            owner=course.owner.user,
+            title='Sum',
+            content='a + b',
+            answer='5',
+        )
+        Content.objects.create(module=modules[0], item=item)
+        self.client.login(username='student', password='pw')
+        with override_settings(COURSES_CPP_SANDBOX_PREFIX=[]):
+            with self.assertRaises(ImproperlyConfigured):
+                cpp.compile_source(self.source)
+            response = self.client.post(
+                reverse('cpp_run', args=[item.id]),
+                json.dumps({'source': self.source}),
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 503)
+
+
+class GradingTest(TestCase):
+
+    def setUp(self):
+        course, _, self.student = create_course(modules=1)
+        self.question = Question.objects.create(
+            owner=course.owner.user,
+            title='Question',
+            content='5 / 2?',
+            answer='2.5',
+        )
+
+    def submit(self, answer):
+        return Submission.objects.submit(self.student, self.question, answer)
+
+    def correct(self):
+        return dict(Submission.objects.for_item(self.question).values_list(
+            'answer',
+            'is_correct',
+        ))
+
+    def test_answers_are_normalized(self):
+        for answer in ('2,50', ' 2.500 ', '2.5000000001'):
+            self.assertTrue(self.submit(answer).is_correct, answer)
+        for answer in ('2.6', 'two and a half', ''):
+            self.assertFalse(self.submit(answer).is_correct, answer)
+
+    def test_changed_key_regrades_history(self):
+        self.submit('2,5')
+        self.submit('Five  HALVES')
+        self.question.answer = 'five halves'
+        self.question.save()
+        self.assertEqual(self.correct(), {'2,5': False, 'Five  HALVES': True})
+        self.question.answer = '2.50'
+        self.question.save()
+        self.assertEqual(self.correct(), {'2,5': True, 'Five  HALVES': False})
+
+    def test_regrade_compares_whole_answers(self):
+        # the longest key, an answer may be longer
+        key = 'a' * 300
+        self.question.answer = key
+        self.question.save()
+        self.submit(key + 'b')
+        self.submit(key.upper())
+        self.assertEqual(Submission.objects.regrade(self.question), 2)
+        self.assertEqual(self.correct(), {key + 'b': False, key.upper(): True})
+
+
+@override_settings(
+    COURSES_WORKSPACE_FLUSH_INTERVAL=60,
+    COURSES_WORKSPACE_REVISIONS=3,
+)
+class WorkspaceTest(TestCase):
+
+    def setUp(self):
+        course, modules, self.student = create_course(modules=1)
+        self.teacher = course.owner.user
+        self.blockly = Blockly.objects.create(
+            owner=self.teacher,
+            title='Blockly',
+            content='Draw a square',
+        )
+        Content.objects.create(module=modules[0], item=self.blockly)
+        cache.clear()
+
+    def revisions(self, user):
+        return list(WorkspaceRevision.objects.filter(
+            user=user,
+            blockly=self.blockly,
+        ).order_by('id').values_list('blob__digest', flat=True))
+
+    def test_autosaves_are_coalesced(self):
+        self.client.login(username='student', password='pw')
+        url = reverse('blockly_workspace', args=[self.blockly.id])
+
+        def save(workspace, final=False):
+            return self.client.post(
+                url,
+                json.dumps({'workspace': workspace, 'final': final}),
+                content_type='application/json',
+            ).json()['written']
+
+        self.assertFalse(save('<xml>1</xml>'))
+        self.assertFalse(save('<xml>2</xml>'))
+        self.assertEqual(self.revisions(self.student), [])
+        # loading writes the pending save
+        response = self.client.get(url)
+        self.assertEqual(response.json()['workspace'], '<xml>2</xml>')
+        self.assertEqual(len(self.revisions(self.student)), 1)
+        self.assertTrue(save('<xml>3</xml>', final=True))
+        self.assertEqual(len(self.revisions(self.student)), 2)
+        response = self.client.get(url)
+        self.assertEqual(response.json()['workspace'], '<xml>3</xml>')
+
+    def test_equal_workspaces_share_a_blob(self):
+        workspace = '<xml>{0}</xml>'.format('<block/>' * 100)
+        self.assertTrue(workspaces.write_revision(
+            self.student,
+            self.blockly.id,
+            workspace,
+        ))
+        self.assertFalse(workspaces.write_revision(
+            self.student,
+            self.blockly.id,
+            workspace,
+        ))
+        workspaces.write_revision(self.teacher, self.blockly.id, workspace)
+        self.assertEqual(WorkspaceBlob.objects.count(), 1)
+        self.assertEqual(
+            self.revisions(self.student),
+            self.revisions(self.teacher),
+        )
+        blob = WorkspaceBlob.objects.get()
+        self.assertLess(len(blob.data), blob.size)
+        self.assertEqual(workspaces.decompress(blob), workspace)
+
+    def test_old_revisions_and_blobs_are_removed(self):
+        for number in range(5):
+            workspaces.write_revision(
+                self.student,
+                self.blockly.id,
+                '<xml>{0}</xml>'.format(number),
+            )
+        workspaces.write_revision(
+            self.teacher,
+            self.blockly.id,
+            '<xml>0</xml>',
+        )
+        self.assertEqual(len(self.revisions(self.student)), 3)
+        self.assertEqual(
+            workspaces.load(self.student, self.blockly.id),
+            '<xml>4</xml>',
+        )
+
+        # <xml>1</xml> is not used, <xml>0</xml> is kept by the teacher
+        self.assertEqual(workspaces.remove_unused_blobs(), 1)
+        self.assertEqual(WorkspaceBlob.objects.count(), 4)
+        self.assertEqual(workspaces.remove_unused_blobs(), 0)
+
+
+class ModuleRenderTest(TestCase):
+
+    def setUp(self):
+        course, modules, _ = create_course(modules=1)
+        self.module = modules[0]
+        owner = course.owner.user
+        for number in range(2):
+            for item in (
+                Text(owner=owner, title='Text', content='<p>Text</p>'),
+                Question(owner=owner, title='Q', content='2 + 2?', answer='4'),
+                Blockly(owner=owner, title='Blockly', content='Square'),
+            ):
+                item.save()
+                Content.objects.create(module=self.module, item=item)
+        caches['local'].clear()
+
+    def test_items_are_loaded_per_type(self):
+        # the contents and one query for each of three item types
+        with self.assertNumQueries(4):
+            html = [
+                content.item.render()
+                for content in self.module.contents.with_items()
+            ]
+        self.assertEqual(len(html), 6)
+        self.assertIn('<p>Text</p>', html[0])
+
+    def test_edited_item_is_rendered_again(self):
+        text = Text.objects.first()
+        self.assertIn('<p>Text</p>', text.render())
+        self.assertIsNotNone(caches['local'].get(text.render_cache_key()))
+
+        text.content = '<p>Edited</p>'
+        text.save()
+        self.assertIsNone(caches['local'].get(text.render_cache_key()))
+        self.assertIn('<p>Edited</p>', Text.objects.get(id=text.id).render())
+
+        # a change without signals is noticed by the newer updated
+        Text.objects.filter(id=text.id).update(
+            content='<p>Updated</p>',
+            updated=timezone.now() + datetime.timedelta(seconds=1),
+        )
+        self.assertIn('<p>Updated</p>', Text.objects.get(id=text.id).render())
@@ -0,0 +1,211 @@
+"""Resized copies of Image items for srcset.
+
+Every uploaded image gets copies of COURSES_THUMBNAIL_WIDTHS widths in
+WebP and JPEG. Copies are stored under MEDIA_ROOT/thumbnails by the
+sha256 of the original content, so a re-uploaded file reuses them and
+a replaced file never gets old copies:
+
+    thumbnails/ab/ab12...ef-640.webp
+
+Copies are made on first request (courses.views.image_thumbnail) or in
+advance by the worker:
+
+    python manage.py make_thumbnails --evict
+
+The directory is kept under COURSES_THUMBNAIL_CACHE_SIZE bytes, the
+least recently used copies are removed first.
+"""
+import hashlib
+import io
+import os
+
+from django.conf import settings
+from django.core.cache import caches
+from PIL import Image as PillowImage
+from PIL import ImageOps, features
+
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpeg': ('JPEG', 'image/jpeg'),
+}
+THUMBNAILS_DIR = 'thumbnails'
+DIGEST_KEY = 'courses:thumbnail:digest:{0}:{1}:{2}'
+SIZE_KEY = 'courses:thumbnail:size:{0}'
+# an image which can not be read or is too large to decode safely
+# (more than twice PIL.Image.MAX_IMAGE_PIXELS) has no copies
+IMAGE_ERRORS = (OSError, ValueError, PillowImage.DecompressionBombError)
+
+
+def supported_formats():
+    """Return output formats supported by installed Pillow."""
+    if features.check('webp'):
+        return ['webp', 'jpeg']
+    return ['jpeg']
+
+
+def source_digest(field_file):
+    """Return sha256 of the original file, cached by name and mtime."""
+    path = field_file.path
+    stat = os.stat(path)
+    key = DIGEST_KEY.format(
+        hashlib.md5(field_file.name.encode()).hexdigest(),
+        stat.st_size,
+        int(stat.st_mtime),
+    )
+    digest = caches['local'].get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        caches['local'].set(key, digest, None)
+    return digest
+
+
+def source_size(field_file):
+    """Return (width, height) of the original image or None.
+
+    Only the header is read, the size is cached by the content digest.
+    """
+    digest = source_digest(field_file)
+    size = caches['local'].get(SIZE_KEY.format(digest))
+    if size is None:
+        try:
+            with PillowImage.open(field_file.path) as image:
+                size = _oriented(image).size
+        except IMAGE_ERRORS:
+            size = ()
+        caches['local'].set(SIZE_KEY.format(digest), size, None)
+    return tuple(size) or None
+
+
+def available_widths(field_file):
+    """Return widths of copies not wider than the original."""
+    size = source_size(field_file)
+    if size is None:
+        return []
+    return [
+        width
+        for width in settings.COURSES_THUMBNAIL_WIDTHS
+        if width < size[0]
+    ]
+
+
+def thumbnail_path(digest, width, image_format):
+    """Return the absolute path of a copy."""
+    return os.path.join(
+        settings.MEDIA_ROOT,
+        THUMBNAILS_DIR,
+        digest[:2],
+        '{0}-{1}.{2}'.format(digest, width, image_format),
+    )
+
+
+def _oriented(image):
+    # phone photos keep the rotation in EXIF
+    exif_transpose = getattr(ImageOps, 'exif_transpose', None)
+    if exif_transpose is None:
+        return image
+    return exif_transpose(image)
+
+
+def make_thumbnail(field_file, width, image_format):
+    """Return the path of a copy, create it if it does not exist.
+
+    Arguments:
+        field_file: FieldFile of Image.file
+        width: one of COURSES_THUMBNAIL_WIDTHS
+        image_format: 'webp' or 'jpeg'
+
+    Returns:
+        str: absolute path of the copy
+
+    Raises:
+        IMAGE_ERRORS: if the original can not be resized
+    """
+    path = thumbnail_path(source_digest(field_file), width, image_format)
+    if os.path.exists(path):
+        # the access time is not updated on noatime mounts
+        os.utime(path)
+        return path
+
+    with PillowImage.open(field_file.path) as image:
+        image = _oriented(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            has_alpha = image.mode in ('LA', 'PA') or (
+                'transparency' in image.info
+            )
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        if image_format == 'jpeg' and image.mode == 'RGBA':
+            background = PillowImage.new('RGB', image.size, (255, 255, 255))
+            background.paste(image, mask=image.split()[3])
+            image = background
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), PillowImage.LANCZOS)
+        output = io.BytesIO()
+        image.save(
+            output,
+            FORMATS[image_format][0],
+            quality=settings.COURSES_THUMBNAIL_QUALITY,
+            optimize=True,
+        )
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # written under a temporary name, a concurrent request never reads
+    # a half written copy
+    temporary_path = '{0}.{1}.tmp'.format(path, os.getpid())
+    with open(temporary_path, 'wb') as thumbnail:
+        thumbnail.write(output.getvalue())
+    os.replace(temporary_path, path)
+    return path
+
+
+def make_all(field_file):
+    """Create every copy of an image.
+
+    Returns:
+        int: amount of copies
+    """
+    widths = available_widths(field_file)
+    for width in widths:
+        for image_format in supported_formats():
+            make_thumbnail(field_file, width, image_format)
+    return len(widths) * len(supported_formats())
+
+
+def evict(max_bytes=None):
+    """Remove the least recently used copies above max_bytes.
+
+    Arguments:
+        max_bytes: size limit, COURSES_THUMBNAIL_CACHE_SIZE by default
+
+    Returns:
+        int: amount of removed files
+    """
+    if max_bytes is None:
+        max_bytes = settings.COURSES_THUMBNAIL_CACHE_SIZE
+    root = os.path.join(settings.MEDIA_ROOT, THUMBNAILS_DIR)
+    files = []
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            used = max(stat.st_atime, stat.st_mtime)
+            files.append((used, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+    removed = 0
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,297 @@
+"""Resumable chunked uploads of File and Image content.
+
+The owner of a course starts an upload for one of its modules with
+the name, size and sha256 of the file, sends it in chunks of at most
+COURSES_UPLOAD_CHUNK_SIZE bytes and asks the current offset after
+a dropped connection:
+
+    POST /courses/upload/       {"module", "filename", "size", "sha256"}
+    PUT  /courses/upload/<id>/  Upload-Offset: 0, body: bytes
+    GET  /courses/upload/<id>/  -> {"offset": 8388608, ...}
+    POST /courses/module/<m>/content/file/upload/<id>/   title=...
+
+Chunks are streamed to COURSES_UPLOAD_TEMP_DIR in blocks, a worker never
+keeps a whole chunk in memory. The assembled file is checked with sha256
+and moved (not copied) to MEDIA_ROOT by the storage.
+
+Uploads are kept in a directory of their user, a user has at most
+COURSES_UPLOAD_MAX_PENDING unfinished uploads.
+"""
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+
+BLOCK_SIZE = 64 * 1024
+UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadError(Exception):
+    """Upload request can not be applied.
+
+    Arguments:
+        message: description for the client
+        status: HTTP status of the response
+        offset: current offset of the upload, if it is known
+    """
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class AssembledFile(UploadedFile):
+    """Complete upload which is moved into the storage without a copy.
+
+    FileSystemStorage moves a file which has temporary_file_path().
+    """
+
+    def __init__(self, path, name, size):
+        super().__init__(open(path, 'rb'), name=name, size=size)
+        self.path = path
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def _user_dir(user_id):
+    return os.path.join(settings.COURSES_UPLOAD_TEMP_DIR, str(int(user_id)))
+
+
+def _upload_dir(user_id, upload_id):
+    if not UPLOAD_ID_RE.match(upload_id):
+        raise UploadError('Unknown upload', status=404)
+    return os.path.join(_user_dir(user_id), upload_id)
+
+
+def _part_path(upload):
+    return os.path.join(
+        _upload_dir(upload['user_id'], upload['id']),
+        'data.part',
+    )
+
+
+def _remove_expired_in(user_dir, deadline):
+    """Delete uploads of one user directory modified before deadline.
+
+    Returns:
+        int: amount of kept uploads
+    """
+    kept = 0
+    for upload_id in os.listdir(user_dir):
+        if not UPLOAD_ID_RE.match(upload_id):
+            continue
+        directory = os.path.join(user_dir, upload_id)
+        try:
+            modified = os.path.getmtime(os.path.join(directory, 'data.part'))
+        except FileNotFoundError:
+            try:
+                modified = os.path.getmtime(directory)
+            except FileNotFoundError:
+                continue
+        if modified < deadline:
+            shutil.rmtree(directory, ignore_errors=True)
+        else:
+            kept += 1
+    return kept
+
+
+def create_upload(user, module, filename, size, sha256):
+    """Start an upload.
+
+    Arguments:
+        user: uploading user, the owner of the course of module
+        module: module which gets the file
+        filename: name of the file
+        size: size of the file in bytes
+        sha256: hex digest of the whole file
+
+    Returns:
+        dict: upload description (id, filename, size, offset, chunk_size)
+
+    Raises:
+        UploadError: 429 if user has COURSES_UPLOAD_MAX_PENDING
+        unfinished uploads
+    """
+    filename = os.path.basename(str(filename or '')).strip()
+    if not filename:
+        raise UploadError('filename is required')
+    if not isinstance(size, int) or size <= 0:
+        raise UploadError('size must be a positive integer')
+    if size > settings.COURSES_UPLOAD_MAX_SIZE:
+        raise UploadError('File is too large', status=413)
+    sha256 = str(sha256 or '').lower()
+    if not SHA256_RE.match(sha256):
+        raise UploadError('sha256 hex digest is required')
+
+    upload = {
+        'id': uuid.uuid4().hex,
+        'user_id': user.pk,
+        'module_id': module.pk,
+        'filename': filename,
+        'size': size,
+        'sha256': sha256,
+        'created': time.time(),
+    }
+    user_dir = _user_dir(user.pk)
+    os.makedirs(user_dir, exist_ok=True)
+    with open(os.path.join(user_dir, '.lock'), 'w') as lock:
+        # parallel starts of one user are counted one by one
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        pending = _remove_expired_in(
+            user_dir,
+            time.time() - settings.COURSES_UPLOAD_EXPIRE,
+        )
+        if pending >= settings.COURSES_UPLOAD_MAX_PENDING:
+            raise UploadError(
+                'Too many unfinished uploads, finish or wait for them',
+                status=429,
+            )
+        directory = _upload_dir(user.pk, upload['id'])
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'meta.json'), 'w') as meta:
+            json.dump(upload, meta)
+        open(_part_path(upload), 'wb').close()
+    return describe(upload)
+
+
+def get_upload(upload_id, user):
+    """Return the upload of user, raise UploadError if it is unknown."""
+    try:
+        with open(os.path.join(
+            _upload_dir(user.pk, upload_id),
+            'meta.json',
+        )) as meta:
+            upload = json.load(meta)
+    except FileNotFoundError:
+        raise UploadError('Unknown upload', status=404)
+    if upload['user_id'] != user.pk:
+        raise UploadError('Unknown upload', status=404)
+    return upload
+
+
+def describe(upload):
+    """Return the upload state for the client."""
+    return {
+        'id': upload['id'],
+        'filename': upload['filename'],
+        'size': upload['size'],
+        'offset': os.path.getsize(_part_path(upload)),
+        'chunk_size': settings.COURSES_UPLOAD_CHUNK_SIZE,
+    }
+
+
+def write_chunk(upload, offset, stream, length, sha256=None):
+    """Append a chunk read from stream at offset.
+
+    The chunk must start at the current end of the data, a repeated or
+    skipped chunk is rejected with the current offset, so the client
+    can continue from it. A chunk which is cut or does not match sha256
+    is dropped.
+
+    Arguments:
+        upload: upload from get_upload()
+        offset: position of the chunk in the file
+        stream: file-like object with the chunk (request)
+        length: size of the chunk (Content-Length)
+        sha256: optional hex digest of the chunk
+
+    Returns:
+        int: new offset
+    """
+    if length <= 0 or length > settings.COURSES_UPLOAD_CHUNK_SIZE:
+        raise UploadError('Chunk size must be 1..{0} bytes'.format(
+            settings.COURSES_UPLOAD_CHUNK_SIZE,
+        ))
+    with open(_part_path(upload), 'r+b') as part:
+        # parallel requests of one upload are applied one by one
+        fcntl.flock(part, fcntl.LOCK_EX)
+        current = os.fstat(part.fileno()).st_size
+        if offset != current:
+            raise UploadError('Wrong offset', status=409, offset=current)
+        if offset + length > upload['size']:
+            raise UploadError('Chunk ends after the file', offset=current)
+
+        part.seek(offset)
+        digest = hashlib.sha256()
+        received = 0
+        while received < length:
+            block = stream.read(min(BLOCK_SIZE, length - received))
+            if not block:
+                break
+            part.write(block)
+            digest.update(block)
+            received += len(block)
+
+        if received != length or (sha256 and digest.hexdigest() != sha256):
+            part.truncate(offset)
+            raise UploadError(
+                'Chunk is incomplete or damaged',
+                status=422,
+                offset=offset,
+            )
+        part.flush()
+        os.fsync(part.fileno())
+        return offset + length
+
+
+def assemble(upload):
+    """Check the complete upload and return it as an uploaded file.
+
+    Returns:
+        AssembledFile: file for a form, it is moved by the storage
+    """
+    path = _part_path(upload)
+    size = os.path.getsize(path)
+    if size != upload['size']:
+        raise UploadError('Upload is not complete', status=409, offset=size)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    if digest.hexdigest() != upload['sha256']:
+        raise UploadError('sha256 of the file does not match', status=422)
+    return AssembledFile(path, upload['filename'], size)
+
+
+def remove_upload(upload):
+    """Delete the temporary data of an upload."""
+    shutil.rmtree(
+        _upload_dir(upload['user_id'], upload['id']),
+        ignore_errors=True,
+    )
+
+
+def remove_expired(max_age=None):
+    """Delete uploads started more than max_age seconds ago.
+
+    Returns:
+        int: amount of removed uploads
+    """
+    if max_age is None:
+        max_age = settings.COURSES_UPLOAD_EXPIRE
+    root = settings.COURSES_UPLOAD_TEMP_DIR
+    if not os.path.isdir(root):
+        return 0
+    removed = 0
+    deadline = time.time() - max_age
+    for user_id in os.listdir(root):
+        user_dir = os.path.join(root, user_id)
+        if not user_id.isdigit() or not os.path.isdir(user_dir):
+            continue
+        with open(os.path.join(user_dir, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            before = sum(
+                1 for name in os.listdir(user_dir) if UPLOAD_ID_RE.match(name)
+            )
+            removed += before - _remove_expired_in(user_dir, deadline)
+    return removed
@@ -8,6 +8,9 @@ urlpatterns = [
     path('mine/',
          views.ManageCourseListView.as_view(),
          name='manage_course_list'),
+    path('stats/',
+         views.completion_stats,
+         name='course_completion_stats'),
     path('create/',
          views.CourseCreateView.as_view(),
          name='course_create'),
@@ -20,6 +23,15 @@ urlpatterns = [
     path('<pk>/module/',
          views.CourseModuleUpdateView.as_view(),
          name='course_module_update'),
+    path('<int:pk>/enroll/',
+         views.CourseBulkEnrollView.as_view(),
+         name='course_bulk_enroll'),
+    path('<int:pk>/module/order/',
+         views.ModuleOrderView.as_view(),
+         name='course_module_order'),
+    path('module/<int:pk>/content/order/',
+         views.ContentOrderView.as_view(),
+         name='module_content_order'),
     path('module/<int:module_id>/content/<model_name>/create/',
          views.ContentCreateUpdateView.as_view(),
          name='module_content_create'),
@@ -32,6 +44,36 @@ urlpatterns = [
     path('module/<int:module_id>/',
          views.ModuleContentListView.as_view(),
          name='module_content_list'),
+    path('image/<int:pk>/<int:width>.<str:image_format>',
+         views.image_thumbnail,
+         name='image_thumbnail'),
+    path('<str:model_name>/<int:pk>/download/',
+         views.content_download,
+         name='content_download'),
+    path('upload/',
+         views.upload_start,
+         name='upload_start'),
+    path('upload/<upload_id>/',
+         views.upload_chunk,
+         name='upload_chunk'),
+    path('module/<int:module_id>/content/<model_name>/upload/<upload_id>/',
+         views.ContentUploadCompleteView.as_view(),
+         name='module_content_upload'),
+    path('module/<int:module_id>/content/<model_name>/<id>/upload/<upload_id>/',
+         views.ContentUploadCompleteView.as_view(),
+         name='module_content_upload_update'),
+    path('answer/<str:model_name>/<int:pk>/',
+         views.submit_answer,
+         name='submit_answer'),
+    path('<int:pk>/answers/stats/',
+         views.answer_stats,
+         name='course_answer_stats'),
+    path('blockly/<int:pk>/workspace/',
+         views.blockly_workspace,
+         name='blockly_workspace'),
+    path('cpp/<int:pk>/run/',
+         views.cpp_run,
+         name='cpp_run'),
     path('subject/<slug:subject>)/',
          views.CourseListView.as_view(),
          name='course_list_subject'),
@@ -1,17 +1,41 @@
+import json
+import os
+
 from django.urls import reverse_lazy
 from django.shortcuts import render
 from django.views.generic.list import ListView
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.views.generic.detail import DetailView
-from .models import Course, Module, Content, Subject
+from .models import (
+    Blockly,
+    C_plus_plus,
+    Content,
+    Course,
+    CourseProgress,
+    Image,
+    Module,
+    Subject,
+    Submission,
+    Video,
+)
 from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
 from django.shortcuts import redirect, get_object_or_404
 from django.views.generic.base import TemplateResponseMixin, View
 from .forms import ModuleFormSet
 from django.forms.models import modelform_factory
-from django.db.models import Count
+from django.db import transaction
+from django.http import FileResponse, Http404, JsonResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth.decorators import login_required
 from students.forms import CourseEnrollForm
+from . import cpp, thumbnails, uploads, workspaces
+from .grading import ANSWER_FIELDS
+from .downloads import file_response, user_can_download
+from .enrollment import get_enroll_students
+from .pagecache import get_cached_page
 
 
 # Create your views here.
@@ -25,6 +49,33 @@ class OwnerMixin(object):
         return qs.filter(owner=self.request.user)
 
 
+class PublicPageCacheMixin(object):
+    """Serve the same cached page to every anonymous visitor.
+
+    Authenticated users see their own version of the page, so their
+    requests always go to the view.
+    """
+
+    def get_page_cache_name(self):
+        return ':'.join(
+            [self.request.resolver_match.url_name] +
+            [str(value) for value in self.kwargs.values()],
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        dispatch = super(PublicPageCacheMixin, self).dispatch
+        if request.method != 'GET' or request.user.is_authenticated:
+            return dispatch(request, *args, **kwargs)
+
+        def build():
+            response = dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+
+        return get_cached_page(self.get_page_cache_name(), build)
+
+
 class OwnerEditMixin(object):
     def form_valid(self, form):
         form.instance.owner = self.request.user
@@ -70,11 +121,17 @@ class CourseModuleUpdateView(TemplateResponseMixin, View):
                              data=data)
 
     def dispatch(self, request, pk):
-        self.course = get_object_or_404(Course,
-                                        id=pk,
-                                        owner=request.user)
-        return super(CourseModuleUpdateView,
-                 self).dispatch(request, pk)
+        courses = Course.objects.all()
+        if request.method == 'POST':
+            # new modules get their order inside the INSERT, the lock
+            # keeps concurrent saves from taking the same order
+            courses = courses.select_for_update()
+        with transaction.atomic():
+            self.course = get_object_or_404(courses,
+                                            id=pk,
+                                            owner=request.user)
+            return super(CourseModuleUpdateView,
+                     self).dispatch(request, pk)
 
     def get(self, request, *args, **kwargs):
         formset = self.get_formset()
@@ -113,7 +170,7 @@ class ContentCreateUpdateView(TemplateResponseMixin, View):
     def dispatch(self, request, module_id, model_name, id = None):
         self.module = get_object_or_404(Module,
                                         id = module_id,
-                                        course__owner = request.user)
+                                        course__owner__user = request.user)
         self.model = self.get_model(model_name)
         if id:
             self.obj = get_object_or_404(self.model,
@@ -127,18 +184,34 @@ class ContentCreateUpdateView(TemplateResponseMixin, View):
                                         'object': self.obj,
                                         'model': model_name})
 
+    def save_content(self, form):
+        """Save the item of a valid form and add new one to the module.
+
+        A video url is resolved before the transaction, the HTTP requests
+        to the provider do not hold the module lock.
+        """
+        obj = form.save(commit=False)
+        obj.owner = self.request.user
+        if isinstance(obj, Video):
+            obj.resolve_embed()
+        with transaction.atomic():
+            if not self.obj:
+                # new contents get their order inside the INSERT, the
+                # lock keeps concurrent saves from taking the same order
+                Module.objects.select_for_update().get(id=self.module.id)
+            obj.save()
+            if not self.obj:
+                # new content
+                Content.objects.create(module=self.module,
+                                       item = obj)
+        return obj
+
     def post(self, request, module_id, model_name, id=None):
         form = self.get_form(self.model,
                              instance=self.obj, data=request.POST,
                              files=request.FILES)
         if form.is_valid():
-            obj = form.save(commit=False)
-            obj.owner = request.user
-            obj.save()
-            if not id:
-                # new content
-                Content.objects.create(module=self.module,
-                                       item = obj)
+            self.save_content(form)
             return redirect('module_content_list',
                             self.module.id)
 
@@ -146,6 +219,135 @@ class ContentCreateUpdateView(TemplateResponseMixin, View):
                                         'object': self.obj})
 
 
+class ContentUploadCompleteView(ContentCreateUpdateView):
+    """Attach a finished chunked upload (courses.uploads) to File or Image.
+
+    The item is saved by the form of ContentCreateUpdateView, other
+    fields (title) come in POST, the file comes from the upload. The
+    upload is checked before the module row is locked (save_content),
+    hashing of a large file does not hold the lock.
+    """
+
+    http_method_names = ['post']
+
+    def dispatch(self, request, module_id, model_name, upload_id, id=None):
+        if model_name not in ('file', 'image'):
+            return JsonResponse({'error': 'Only file and image'}, status=400)
+        try:
+            upload = uploads.get_upload(upload_id, request.user)
+            if upload.get('module_id') != module_id:
+                raise uploads.UploadError('Unknown upload', status=404)
+            self.assembled = uploads.assemble(upload)
+        except uploads.UploadError as error:
+            return JsonResponse(
+                {'error': str(error), 'offset': error.offset},
+                status=error.status,
+            )
+        try:
+            response = super().dispatch(request, module_id, model_name, id)
+        finally:
+            self.assembled.close()
+        if response.status_code == 201:
+            uploads.remove_upload(upload)
+        return response
+
+    def post(self, request, module_id, model_name, id=None):
+        form = self.get_form(self.model,
+                             instance=self.obj, data=request.POST,
+                             files={'file': self.assembled})
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+        obj = self.save_content(form)
+        return JsonResponse({'id': obj.id, 'url': obj.download_url()},
+                            status=201)
+
+
+@login_required
+def upload_start(request):
+    """Start a chunked upload of a file for a module of user's course.
+
+    Request body (json): {"module": 12, "filename": "lesson.mp4",
+    "size": 104857600, "sha256": "<hex digest of the file>"}
+
+    Returns:
+        JsonResponse (json): 201
+        {
+            'id': '0c5d...',
+            'filename': 'lesson.mp4',
+            'size': 104857600,
+            'offset': 0,
+            'chunk_size': 8388608
+        }
+        404 if the module is not in a course of the user, 429 if the
+        user has too many unfinished uploads
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST is expected'}, status=405)
+    try:
+        data = json.loads(request.body)
+        module_id = data.get('module')
+        if not isinstance(module_id, int):
+            raise uploads.UploadError('module is required')
+        module = Module.objects.filter(
+            id=module_id,
+            course__owner__user=request.user,
+        ).first()
+        if module is None:
+            raise uploads.UploadError('Unknown module', status=404)
+        upload = uploads.create_upload(
+            request.user,
+            module,
+            data.get('filename'),
+            data.get('size'),
+            data.get('sha256'),
+        )
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'json object is expected'}, status=400)
+    except uploads.UploadError as error:
+        return JsonResponse({'error': str(error)}, status=error.status)
+    return JsonResponse(upload, status=201)
+
+
+@login_required
+def upload_chunk(request, upload_id):
+    """Send a chunk (PUT) or ask the upload state (GET).
+
+    PUT headers: Upload-Offset - position of the chunk, optional
+    Upload-Checksum - sha256 hex digest of the chunk; body is the chunk.
+
+    Returns:
+        JsonResponse (json): upload state, offset is where the next
+        chunk starts; 409 with offset if the chunk is not the next one
+    """
+    try:
+        upload = uploads.get_upload(upload_id, request.user)
+        if request.method == 'GET':
+            return JsonResponse(uploads.describe(upload))
+        if request.method != 'PUT':
+            return JsonResponse({'error': 'GET or PUT is expected'}, status=405)
+        try:
+            offset = int(request.META['HTTP_UPLOAD_OFFSET'])
+            length = int(request.META['CONTENT_LENGTH'])
+        except (KeyError, ValueError):
+            return JsonResponse(
+                {'error': 'Upload-Offset and Content-Length are required'},
+                status=400,
+            )
+        uploads.write_chunk(
+            upload,
+            offset,
+            request,
+            length,
+            request.META.get('HTTP_UPLOAD_CHECKSUM', '').lower() or None,
+        )
+    except uploads.UploadError as error:
+        return JsonResponse(
+            {'error': str(error), 'offset': error.offset},
+            status=error.status,
+        )
+    return JsonResponse(uploads.describe(upload))
+
+
 class ContentDeleteView(View):
 
     def post(self, request, id):
@@ -158,6 +360,79 @@ class ContentDeleteView(View):
         return redirect('module_content_list', module.id)
 
 
+class OrderUpdateMixin(object):
+    """Apply a new order of parent's children sent as json.
+
+    Request body: {"ids": [3, 1, 2]}, ids of all children in the new
+    order. The parent row is locked, so concurrent inserts and reorders
+    of the same parent wait for each other.
+
+    Views set:
+        parent_model: model of the parent
+        owner_lookup: lookup from the parent to its owner user
+        children_attr: related manager of the ordered children
+    """
+    parent_model = None
+    owner_lookup = None
+    children_attr = None
+
+    def post(self, request, pk):
+        try:
+            ids = [int(child_id) for child_id in json.loads(request.body)['ids']]
+        except (ValueError, TypeError, KeyError):
+            return JsonResponse({'error': 'ids list is expected'}, status=400)
+        with transaction.atomic():
+            parent = get_object_or_404(
+                self.parent_model.objects.filter(
+                    **{self.owner_lookup: request.user}
+                ).select_for_update(of=('self',)),
+                pk=pk,
+            )
+            try:
+                updated = getattr(parent, self.children_attr).reorder(ids)
+            except ValueError as error:
+                return JsonResponse({'error': str(error)}, status=400)
+        return JsonResponse({'updated': updated})
+
+
+class ModuleOrderView(OrderUpdateMixin, View):
+    parent_model = Course
+    owner_lookup = 'owner__user'
+    children_attr = 'modules'
+
+
+class ContentOrderView(OrderUpdateMixin, View):
+    parent_model = Module
+    owner_lookup = 'course__owner__user'
+    children_attr = 'contents'
+
+
+class CourseBulkEnrollView(View):
+    """Enroll many students into a course.
+
+    Request body (json), one of:
+        {"student_ids": [1, 2, 3]}
+        {"filter": {"city": "Moscow"}}
+        {"all": true}
+
+    Response: {"enrolled": 2}, amount of newly enrolled students.
+    """
+
+    def post(self, request, pk):
+        course = get_object_or_404(Course, id=pk)
+        if not (request.user.is_staff or (
+            request.user.is_authenticated and
+            course.owner.user_id == request.user.id
+        )):
+            return JsonResponse({'error': 'forbidden'}, status=403)
+        try:
+            students = get_enroll_students(json.loads(request.body))
+        except (ValueError, TypeError, AttributeError) as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        enrolled = course.enroll(students.values_list('id', flat=True))
+        return JsonResponse({'enrolled': enrolled})
+
+
 class ModuleContentListView(TemplateResponseMixin, View):
     template_name = 'courses/manage/module/content_list.html'
 
@@ -165,18 +440,19 @@ class ModuleContentListView(TemplateResponseMixin, View):
         module = get_object_or_404(Module,
                                    id=module_id,
                                    course__owner=request.user)
-        return self.render_to_response({'module': module})
+        return self.render_to_response({
+            'module': module,
+            'contents': module.contents.with_items(),
+        })
 
 
-class CourseListView(TemplateResponseMixin, View):
+class CourseListView(PublicPageCacheMixin, TemplateResponseMixin, View):
     model = Course
     template_name = 'courses/course/list.html'
 
     def get(self, request, subject=None):
-        subjects = Subject.objects.annotate(
-            total_courses=Count('courses'))
-        courses = Course.objects.annotate(
-            total_modules=Count('modules'))
+        subjects = Subject.objects.all()
+        courses = Course.objects.select_related('subject', 'owner')
         if subject:
             subject = get_object_or_404(Subject, slug=subject)
             courses = courses.filter(subject=subject)
@@ -189,8 +465,9 @@ class CourseListView(TemplateResponseMixin, View):
         )
 
 
-class CourseDetailView(DetailView):
+class CourseDetailView(PublicPageCacheMixin, DetailView):
     model = Course
+    queryset = Course.objects.select_related('subject', 'owner')
     template_name = 'courses/course/detail.html'
 
     def get_context_data(self, **kwargs):
@@ -203,3 +480,275 @@ class CourseDetailView(DetailView):
                 )
 
         return context
+
+
+@staff_member_required
+def completion_stats(request):
+    """Returns json with completion stats of courses and subjects.
+
+    started is amount of students with progress in the course,
+    completed_count is amount of students who finished it.
+
+    Arguments:
+        request: client request
+
+    Returns:
+        JsonResponse (json):
+        {
+            'courses': [
+                {
+                    'course_id': 1,
+                    'course__title': 'Python',
+                    'started': 40,
+                    'completed_count': 12,
+                    'avg_percent_done': 57.5
+                }
+            ],
+            'subjects': [
+                {
+                    'course__subject_id': 1,
+                    'course__subject__title': 'Программирование',
+                    'started': 90,
+                    'completed_count': 30,
+                    'avg_percent_done': 61.0
+                }
+            ]
+        }
+    """
+    return JsonResponse({
+        'courses': list(CourseProgress.objects.course_stats()),
+        'subjects': list(CourseProgress.objects.subject_stats()),
+    })
+
+
+def image_thumbnail(request, pk, width, image_format):
+    """Return a resized copy of Image item, make it on first request.
+
+    Urls of copies carry the digest of the original (Image.thumbnail_url),
+    so a copy is cached by browsers for a year. Only course members get
+    it, like the original (content_download).
+
+    Arguments:
+        request: client request
+        pk: id of Image
+        width: one of COURSES_THUMBNAIL_WIDTHS
+        image_format: 'webp' or 'jpeg'
+
+    Returns:
+        FileResponse: image of the copy
+    """
+    image = get_object_or_404(Image, pk=pk)
+    if (
+        width not in settings.COURSES_THUMBNAIL_WIDTHS
+        or image_format not in thumbnails.supported_formats()
+    ):
+        raise Http404('Unknown thumbnail')
+    if not user_can_download(request.user, 'image', pk):
+        raise PermissionDenied
+    try:
+        path = thumbnails.make_thumbnail(image.file, width, image_format)
+    except thumbnails.IMAGE_ERRORS:
+        raise Http404('Image can not be resized')
+    response = FileResponse(
+        open(path, 'rb'),
+        content_type=thumbnails.FORMATS[image_format][1],
+    )
+    response['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+
+def content_download(request, model_name, pk):
+    """Return the file of File or Image item to the course members.
+
+    Range and conditional requests are supported, see courses.downloads.
+
+    Arguments:
+        request: client request
+        model_name: 'file' or 'image'
+        pk: id of the item
+
+    Returns:
+        HttpResponse: file or a part of it
+    """
+    if model_name not in ('file', 'image'):
+        raise Http404('Unknown content')
+    item = get_object_or_404(
+        apps.get_model(app_label='courses', model_name=model_name),
+        pk=pk,
+    )
+    if not user_can_download(request.user, model_name, pk):
+        raise PermissionDenied
+    try:
+        path = item.file.path
+    except ValueError:
+        raise Http404('No file')
+    if not os.path.isfile(path):
+        raise Http404('No file')
+    return file_response(
+        request,
+        path,
+        os.path.basename(item.file.name),
+        as_attachment=model_name == 'file',
+    )
+
+
+@login_required
+def cpp_run(request, pk):
+    """Compile and run a C++ solution of C_plus_plus item.
+
+    Request body (json): {"source": "#include <iostream>..."}
+
+    Returns:
+        JsonResponse (json):
+        {
+            'status': 'accepted',
+            'stdout': '42',
+            'stderr': '',
+            'time': 0.004,
+            'cached': false
+        }
+        status is accepted, wrong_answer, compile_error, runtime_error
+        or timeout; 503 when every worker stays busy or no sandbox
+        is configured (COURSES_CPP_SANDBOX_PREFIX)
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST is expected'}, status=405)
+    if not cpp.sandbox_configured():
+        return JsonResponse(
+            {'error': 'C++ solutions are not checked on this server'},
+            status=503,
+        )
+    item = get_object_or_404(C_plus_plus, pk=pk)
+    if not user_can_download(request.user, 'c_plus_plus', pk):
+        raise PermissionDenied
+    try:
+        source = json.loads(request.body)['source']
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': 'source is expected'}, status=400)
+    if not isinstance(source, str) or len(source) > 64 * 1024:
+        return JsonResponse({'error': 'source is too long'}, status=400)
+    try:
+        result = cpp.judge(source, item.answer)
+    except cpp.JudgeBusy as error:
+        response = JsonResponse({'error': str(error)}, status=503)
+        response['Retry-After'] = 5
+        return response
+    result.pop('digest')
+    return JsonResponse(result)
+
+
+@login_required
+def submit_answer(request, model_name, pk):
+    """Store and grade an answer to Question, Blockly or Drag_and_drop.
+
+    Request body (json): {"answer": "42"}
+
+    Returns:
+        JsonResponse (json):
+        {
+            'correct': true,
+            'passed_modules': [4],
+            'attempts': 3
+        }
+        passed_modules are modules finished by this answer, the next
+        module of the course is opened, attempts is amount of answers
+        of the user to the item
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST is expected'}, status=405)
+    if model_name not in ANSWER_FIELDS:
+        raise Http404
+    model = apps.get_model(app_label='courses', model_name=model_name)
+    item = get_object_or_404(model, pk=pk)
+    if not user_can_download(request.user, model_name, pk):
+        raise PermissionDenied
+    try:
+        answer = json.loads(request.body)['answer']
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': 'answer is expected'}, status=400)
+    if not isinstance(answer, str) or len(answer) > 10000:
+        return JsonResponse({'error': 'answer is too long'}, status=400)
+    submission = Submission.objects.submit(request.user, item, answer)
+    passed = []
+    if submission.is_correct:
+        passed = CourseProgress.objects.pass_solved_modules(
+            request.user,
+            item,
+        )
+    return JsonResponse({
+        'correct': submission.is_correct,
+        'passed_modules': [module.id for module in passed],
+        'attempts': Submission.objects.for_item(item).filter(
+            user=request.user,
+        ).count(),
+    })
+
+
+@login_required
+def answer_stats(request, pk):
+    """Returns json with answer stats of graded items of a course.
+
+    Only the course owner and staff see it.
+
+    Returns:
+        JsonResponse (json):
+        {
+            'items': [
+                {
+                    'content_type__model': 'question',
+                    'object_id': 7,
+                    'attempts': 52,
+                    'correct_attempts': 30,
+                    'students': 31,
+                    'solved': 28
+                }
+            ]
+        }
+    """
+    courses = Course.objects.all()
+    if not request.user.is_staff:
+        courses = courses.filter(owner__user=request.user)
+    course = get_object_or_404(courses, pk=pk)
+    return JsonResponse({
+        'items': list(Submission.objects.course_stats(course)),
+    })
+
+
+@login_required
+def blockly_workspace(request, pk):
+    """Load or autosave the workspace of the user in a Blockly item.
+
+    GET returns the last saved workspace, POST saves one, request body
+    (json): {"workspace": "<xml>...</xml>", "final": false}
+
+    Returns:
+        JsonResponse (json):
+        GET: {'workspace': '<xml>...</xml>'}, '' if nothing is saved
+        POST: {'written': false}, true if it went to the database
+    """
+    get_object_or_404(Blockly.objects.only('id'), pk=pk)
+    if not user_can_download(request.user, 'blockly', pk):
+        raise PermissionDenied
+    if request.method == 'GET':
+        return JsonResponse({
+            'workspace': workspaces.load(request.user, pk),
+        })
+    if request.method != 'POST':
+        return JsonResponse({'error': 'GET or POST is expected'}, status=405)
+    if len(request.body) > settings.COURSES_WORKSPACE_MAX_SIZE:
+        return JsonResponse({'error': 'workspace is too large'}, status=413)
+    try:
+        data = json.loads(request.body)
+        workspace = data['workspace']
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'error': 'workspace is expected'}, status=400)
+    if not isinstance(workspace, str):
+        return JsonResponse({'error': 'workspace is expected'}, status=400)
+    return JsonResponse({
+        'written': workspaces.autosave(
+            request.user,
+            pk,
+            workspace,
+            final=bool(data.get('final')),
+        ),
+    })
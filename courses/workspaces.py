@@ -0,0 +1,158 @@
+"""Autosave of Blockly workspaces of students.
+
+The page sends the workspace XML a few seconds after every change:
+
+    GET  /courses/blockly/<id>/workspace/   -> {"workspace": "<xml>..."}
+    POST /courses/blockly/<id>/workspace/   {"workspace": "<xml>...", "final": false}
+
+Saves are coalesced per student and item: a save is kept in the
+COURSES_WORKSPACE_CACHE cache and written to the database at most once
+in COURSES_WORKSPACE_FLUSH_INTERVAL seconds, when the page is closed
+(final) or when the workspace is loaded again. The cache is shared by
+all processes (the database cache by default), a per-process cache
+would let another process load an older revision.
+
+A written workspace is zlib compressed and stored once by its sha256
+(WorkspaceBlob), an unchanged workspace does not add a revision. Only
+COURSES_WORKSPACE_REVISIONS newest revisions of a student are kept,
+blobs without revisions are removed by:
+
+    python manage.py clean_workspaces
+
+A blob is locked (SELECT ... FOR UPDATE) while a revision is added to
+it, the cleaner skips locked blobs, so it never deletes a blob which
+is being reused.
+"""
+import hashlib
+import time
+import zlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .models import WorkspaceBlob, WorkspaceRevision
+
+PENDING_KEY = 'courses:workspace:pending:{0}:{1}'
+
+
+def _cache():
+    return caches[settings.COURSES_WORKSPACE_CACHE]
+
+
+def _pending_key(user, blockly_id):
+    return PENDING_KEY.format(user.pk, blockly_id)
+
+
+def compress(workspace):
+    """Return (sha256, compressed bytes) of a workspace."""
+    data = workspace.encode()
+    return hashlib.sha256(data).hexdigest(), zlib.compress(data, 9)
+
+
+def decompress(blob):
+    return zlib.decompress(bytes(blob.data)).decode()
+
+
+def write_revision(user, blockly_id, workspace):
+    """Store workspace as the newest revision of user.
+
+    Returns:
+        bool: False if it is equal to the newest revision
+    """
+    digest, data = compress(workspace)
+    latest_digest = WorkspaceRevision.objects.filter(
+        user=user,
+        blockly_id=blockly_id,
+    ).order_by('-id').values_list('blob__digest', flat=True).first()
+    if latest_digest == digest:
+        return False
+    with transaction.atomic():
+        blob, _ = WorkspaceBlob.objects.select_for_update().get_or_create(
+            digest=digest,
+            defaults={'data': data, 'size': len(workspace.encode())},
+        )
+        revision = WorkspaceRevision.objects.create(
+            user=user,
+            blockly_id=blockly_id,
+            blob=blob,
+        )
+        oldest_kept = WorkspaceRevision.objects.filter(
+            user=user,
+            blockly_id=blockly_id,
+        ).order_by('-id').values_list('id', flat=True)[
+            settings.COURSES_WORKSPACE_REVISIONS - 1:
+            settings.COURSES_WORKSPACE_REVISIONS
+        ].first()
+        if oldest_kept is not None and oldest_kept < revision.id:
+            WorkspaceRevision.objects.filter(
+                user=user,
+                blockly_id=blockly_id,
+                id__lt=oldest_kept,
+            ).delete()
+    return True
+
+
+def autosave(user, blockly_id, workspace, final=False):
+    """Remember workspace, write it to the database when it is due.
+
+    Arguments:
+        user: student user
+        blockly_id: id of Blockly item
+        workspace: workspace XML
+        final: the page is closed, write at once
+
+    Returns:
+        bool: True if the workspace was written to the database
+    """
+    key = _pending_key(user, blockly_id)
+    pending = _cache().get(key)
+    now = time.time()
+    since = pending['since'] if pending else now
+    if final or now - since >= settings.COURSES_WORKSPACE_FLUSH_INTERVAL:
+        write_revision(user, blockly_id, workspace)
+        _cache().delete(key)
+        return True
+    _cache().set(
+        key,
+        {'workspace': workspace, 'since': since},
+        settings.COURSES_WORKSPACE_PENDING_TIMEOUT,
+    )
+    return False
+
+
+def load(user, blockly_id):
+    """Return the last saved workspace of user or ''.
+
+    A save which is not written yet is written now, so it is not lost
+    when the cache drops it.
+    """
+    key = _pending_key(user, blockly_id)
+    pending = _cache().get(key)
+    if pending is not None:
+        write_revision(user, blockly_id, pending['workspace'])
+        _cache().delete(key)
+        return pending['workspace']
+    revision = WorkspaceRevision.objects.latest_for(user, blockly_id)
+    if revision is None:
+        return ''
+    return decompress(revision.blob)
+
+
+def remove_unused_blobs():
+    """Delete blobs which no revision refers to.
+
+    Blobs locked by write_revision() are skipped, they are checked again
+    by the next run.
+
+    Returns:
+        int: amount of removed blobs
+    """
+    with transaction.atomic():
+        unused = list(WorkspaceBlob.objects.select_for_update(
+            skip_locked=True,
+        ).exclude(
+            id__in=WorkspaceRevision.objects.values('blob_id'),
+        ).values_list('id', flat=True))
+        removed, _ = WorkspaceBlob.objects.filter(id__in=unused).delete()
+    return removed
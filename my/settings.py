@@ -43,6 +43,8 @@ INSTALLED_APPS = [
     'students.apps.StudentsConfig',
     'guardian',
     'managers',
+    'outbox',
+    'assets',
 ]
 
 STATIC_URL = '/static/'
@@ -51,6 +53,17 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static")
 ]
 
+# manage.py collectstatic writes hashed names with .gz/.br copies here,
+# assets.views.serve returns them when SERVE_STATIC is True
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+STATICFILES_STORAGE = 'assets.storage.CompressedManifestStaticFilesStorage'
+
+SERVE_STATIC = not DEBUG
+
+# seconds browsers keep static files without a hash in the name
+STATIC_MAX_AGE = 60 * 60
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -75,6 +88,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'students.context_processors.user_role',
             ],
         },
     },
@@ -147,3 +161,138 @@ AUTHENTICATION_BACKENDS = (
 )
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Outbox: emails are queued by views and sent by manage.py send_outbox,
+# a failed email is retried after OUTBOX_RETRY_DELAY seconds, the delay
+# doubles every attempt
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 60
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# 'default' is shared by all processes and servers: role and page
+# versions, page rebuild locks, login throttling and pending Blockly
+# autosaves live there. The database cache needs no extra service, run
+# once: python manage.py createcachetable
+# memcached is faster for a busy site:
+#     'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+#     'LOCATION': '127.0.0.1:11211',
+# 'local' is the memory of one process, only for values which are checked
+# against the database on read (rendered items, image digests)
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
+    },
+}
+
+# seconds to keep a rendered course item (text, video, blockly...)
+COURSES_RENDER_CACHE_TIMEOUT = 60 * 60 * 24
+
+# seconds to keep public course pages for anonymous visitors, a stale
+# copy is served while one request rebuilds an outdated page
+COURSES_PAGE_CACHE_TIMEOUT = 60 * 10
+COURSES_PAGE_CACHE_STALE_TIMEOUT = 60 * 60 * 24
+
+# default working window of a teacher without TeacherWorkingHours rows,
+# local time (TIME_ZONE) for every day of week
+TEACHER_WORKING_HOURS = ('09:00', '21:00')
+
+# seconds a process keeps its free slots index (students.availability)
+# when no change of lessons or teachers is signalled
+AVAILABILITY_INDEX_TTL = 60 * 5
+
+# seconds between reads of the lessons change log, a lesson booked in
+# another process is offered for at most this time
+AVAILABILITY_INDEX_POLL = 2
+
+# processes hashing passwords of imported students (students.importing),
+# started once per server process and shared by imports, 0 hashes them
+# in the request
+STUDENTS_IMPORT_WORKERS = 2
+
+# lesson length in minutes offered on the available lessons page
+LESSON_DURATION = 45
+
+# failed logins allowed in LOGIN_THROTTLE_WINDOW seconds from one IP
+# and for one username from one IP, counters are shared through the
+# default cache, 'my.throttling.LocalWindow' keeps them in the process
+# (one process servers)
+LOGIN_THROTTLE_BACKEND = 'my.throttling.CacheWindow'
+LOGIN_THROTTLE_WINDOW = 60 * 5
+LOGIN_THROTTLE_IP_ATTEMPTS = 20
+LOGIN_THROTTLE_USERNAME_ATTEMPTS = 5
+
+# widths of resized copies of course images (courses.thumbnails), JPEG and
+# WebP quality and the size limit of the copies directory in bytes
+COURSES_THUMBNAIL_WIDTHS = (320, 640, 1024, 1600)
+COURSES_THUMBNAIL_QUALITY = 80
+COURSES_THUMBNAIL_CACHE_SIZE = 1024 * 1024 * 1024
+
+# protected File and Image downloads (courses.downloads) are handed to the
+# front server with this header, e.g. 'X-Accel-Redirect' for nginx, None
+# streams them from django
+COURSES_DOWNLOAD_ACCEL_HEADER = None
+COURSES_DOWNLOAD_ACCEL_PREFIX = '/protected-media/'
+
+# resumable chunked uploads of File and Image content (courses.uploads),
+# the temporary directory should be on the same disk as MEDIA_ROOT so
+# finished files are moved, not copied
+COURSES_UPLOAD_TEMP_DIR = os.path.join(BASE_DIR, 'uploads_tmp')
+COURSES_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+COURSES_UPLOAD_MAX_SIZE = 4 * 1024 * 1024 * 1024
+# seconds after the last chunk an unfinished upload is removed
+COURSES_UPLOAD_EXPIRE = 60 * 60 * 24
+# unfinished uploads one user may have at once
+COURSES_UPLOAD_MAX_PENDING = 3
+
+# C++ solutions of C_plus_plus items (courses.cpp): compiler, limits of
+# compilation and of a run (seconds of CPU, bytes), host-wide amount of
+# parallel compilations and runs and seconds a solution waits for one
+COURSES_CPP_COMPILER = 'g++'
+COURSES_CPP_FLAGS = ('-std=c++17', '-O2', '-pipe')
+COURSES_CPP_CACHE_DIR = os.path.join(BASE_DIR, 'cpp_cache')
+# bytes of binaries and verdicts kept by clean_cpp_cache
+COURSES_CPP_CACHE_SIZE = 1024 * 1024 * 1024
+COURSES_CPP_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+COURSES_CPP_QUEUE_TIMEOUT = 60
+COURSES_CPP_COMPILE_TIMEOUT = 20
+COURSES_CPP_COMPILE_MEMORY = 1024 * 1024 * 1024
+COURSES_CPP_BINARY_LIMIT = 64 * 1024 * 1024
+COURSES_CPP_RUN_TIMEOUT = 2
+COURSES_CPP_RUN_MEMORY = 256 * 1024 * 1024
+COURSES_CPP_OUTPUT_LIMIT = 1024 * 1024
+# isolation tool which starts the compiler and the program, required by
+# courses.cpp; it must hide the project and the network, '{work_dir}' is
+# the temporary directory of the solution, e.g.
+# ['bwrap', '--ro-bind', '/usr', '/usr', '--symlink', 'usr/lib', '/lib',
+#  '--symlink', 'usr/lib64', '/lib64', '--symlink', 'usr/bin', '/bin',
+#  '--proc', '/proc', '--dev', '/dev', '--tmpfs', '/tmp',
+#  '--bind', '{work_dir}', '{work_dir}', '--chdir', '{work_dir}',
+#  '--unshare-all', '--die-with-parent', '--new-session']
+COURSES_CPP_SANDBOX_PREFIX = []
+
+# numeric answers to Question, Blockly and Drag_and_drop items match the
+# key within the larger of these tolerances (courses.grading)
+COURSES_GRADING_ABS_TOLERANCE = 1e-6
+COURSES_GRADING_REL_TOLERANCE = 1e-9
+
+# autosave of Blockly workspaces (courses.workspaces): saves wait in the
+# cache and go to the database at most once in FLUSH_INTERVAL seconds,
+# REVISIONS newest revisions of a student are kept
+COURSES_WORKSPACE_CACHE = 'default'
+COURSES_WORKSPACE_FLUSH_INTERVAL = 60
+COURSES_WORKSPACE_PENDING_TIMEOUT = 60 * 60 * 24 * 7
+COURSES_WORKSPACE_REVISIONS = 20
+COURSES_WORKSPACE_MAX_SIZE = 1024 * 1024
@@ -0,0 +1,154 @@
+import datetime
+import json
+from unittest import mock
+
+from django.contrib.auth.hashers import MD5PasswordHasher
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from assets.tests import static_not_collected
+from my.throttling import CacheWindow, LocalWindow, get_login_throttle
+from students.models import TeacherSchedule
+from students.tests import create_teacher, tomorrow_at
+
+
+class ScheduleWindowTest(TestCase):
+
+    def setUp(self):
+        self.teacher = create_teacher()
+        start = tomorrow_at(10)
+        # two lessons share a start, the cursor must keep them apart
+        self.lessons = [
+            TeacherSchedule.objects.create(
+                teacher=self.teacher,
+                start_timestamp=start + datetime.timedelta(hours=hours),
+                end_timestamp=start + datetime.timedelta(
+                    hours=hours,
+                    minutes=45,
+                ),
+            )
+            for hours in (0, 1, 1, 2, 3)
+        ]
+        self.url = reverse('api_get_schedule', args=[1])
+
+    def get(self, **params):
+        headers = params.pop('headers', {})
+        response = self.client.get(self.url, params, **headers)
+        if response.status_code == 200:
+            response.data = json.loads(b''.join(response.streaming_content))
+        return response
+
+    def test_pages_follow_each_other(self):
+        ids = []
+        pages = 0
+        params = {'limit': 2}
+        while True:
+            data = self.get(**params).data
+            ids.extend(row['id'] for row in data['shedule'])
+            pages += 1
+            if data['next'] is None:
+                break
+            params['cursor'] = data['next']
+        self.assertEqual(ids, [lesson.id for lesson in self.lessons])
+        self.assertEqual(pages, 3)
+
+    def test_wrong_parameters_are_rejected(self):
+        for params in (
+            {'cursor': 'not a cursor'},
+            {'limit': 0},
+            {'from': 'yesterday'},
+        ):
+            response = self.get(**params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.json())
+
+    def test_unchanged_window_is_not_modified(self):
+        etag = self.get()['ETag']
+        self.assertEqual(
+            self.get(headers={'HTTP_IF_NONE_MATCH': etag}).status_code,
+            304,
+        )
+
+        self.lessons[2].delete()
+        response = self.get(headers={'HTTP_IF_NONE_MATCH': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(len(response.data['shedule']), 4)
+
+
+# limits of settings, 20 attempts from an IP and 5 for a username
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class LoginThrottleTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user('student', password='right')
+        hashes = mock.patch.object(
+            MD5PasswordHasher,
+            'encode',
+            autospec=True,
+            side_effect=MD5PasswordHasher.encode,
+        )
+        self.hashes = hashes.start()
+        self.addCleanup(hashes.stop)
+
+    def login(self, password, username='student', ip='10.0.0.1'):
+        return self.client.post(
+            reverse('login'),
+            {'username': username, 'password': password},
+            REMOTE_ADDR=ip,
+        )
+
+    def test_counters_keep_the_limit(self):
+        for counter in (LocalWindow(60), CacheWindow(60)):
+            handles = [counter.reserve('key', 3) for _ in range(3)]
+            self.assertNotIn(None, handles)
+            self.assertIsNone(counter.reserve('key', 3))
+            self.assertEqual(counter.count('key', 3)[0], 3)
+            counter.release('key', handles[0])
+            self.assertIsNotNone(counter.reserve('key', 3))
+            counter.reset('key', 3)
+            self.assertEqual(counter.count('key', 3), (0, 0))
+
+    def test_failed_attempts_lock_the_username(self):
+        with static_not_collected(self):
+            for _ in range(5):
+                self.assertEqual(self.login('wrong').status_code, 200)
+            response = self.login('right')
+            self.assertEqual(response.status_code, 429)
+            self.assertGreater(int(response['Retry-After']), 0)
+            # one hash for every checked attempt, none for limited ones
+            self.assertEqual(self.hashes.call_count, 5)
+
+            # the owner of the account logs in from another IP
+            response = self.login('right', ip='10.0.0.2')
+            self.assertEqual(response.status_code, 302)
+
+    def test_login_resets_failed_attempts(self):
+        with static_not_collected(self):
+            for _ in range(4):
+                self.login('wrong')
+            self.assertEqual(self.login('right').status_code, 302)
+            self.client.logout()
+            for _ in range(4):
+                self.assertEqual(self.login('wrong').status_code, 200)
+            self.assertEqual(
+                get_login_throttle().failures(
+                    mock.Mock(META={'REMOTE_ADDR': '10.0.0.1'}),
+                    'student',
+                ),
+                4,
+            )
+
+    def test_ip_is_limited_over_usernames(self):
+        with static_not_collected(self):
+            for number in range(20):
+                response = self.login('wrong', 'user{0}'.format(number))
+                self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.login('right').status_code, 429)
+            self.assertEqual(self.hashes.call_count, 20)
@@ -0,0 +1,281 @@
+"""Sliding-window limit of failed login attempts.
+
+Attempts are counted per client IP and per (IP, username) pair, so a
+client can not lock out the account of somebody else. An attempt is
+reserved before the password is hashed and the reservation is atomic:
+a parallel burst gets no more hashes than the limit allows, a limited
+request is rejected without computing PBKDF2. A failed attempt keeps
+its reservation, a successful login releases it.
+
+CacheWindow keeps the counters in the django cache, so all processes
+and servers share them. LocalWindow keeps them in the process (one
+process servers):
+
+    LOGIN_THROTTLE_BACKEND = 'my.throttling.LocalWindow'
+
+Example:
+
+    from my.throttling import get_login_throttle
+    throttle = get_login_throttle()
+    reservation = throttle.reserve(request, username)
+    if reservation is None:
+        ...answer 429 after throttle.retry_after(request, username)...
+    elif ...the password is right...:
+        throttle.succeed(request, username, reservation)
+"""
+import collections
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+
+class LocalWindow:
+    """Exact sliding window over timestamps kept in process memory.
+
+    Arguments:
+        window: length of the window in seconds
+        max_keys: keys kept at most, the least recently used are dropped
+    """
+
+    def __init__(self, window, max_keys=100000):
+        self.window = window
+        self.max_keys = max_keys
+        self.hits = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def _expire(self, key, now):
+        hits = self.hits.get(key)
+        if hits is None:
+            return None
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if not hits:
+            del self.hits[key]
+            return None
+        return hits
+
+    def count(self, key, limit):
+        """Return amount of hits of key in the last window and the
+        seconds until the oldest of them leaves the window."""
+        now = time.monotonic()
+        with self.lock:
+            hits = self._expire(key, now)
+            if hits is None:
+                return 0, 0
+            return len(hits), hits[0] + self.window - now
+
+    def reserve(self, key, limit):
+        """Count one hit of key if there are less than limit hits.
+
+        Returns:
+            float: handle of the hit for release(), None if the limit
+            is reached
+        """
+        now = time.monotonic()
+        with self.lock:
+            hits = self._expire(key, now)
+            if hits is None:
+                hits = self.hits[key] = collections.deque()
+            elif len(hits) >= limit:
+                return None
+            else:
+                self.hits.move_to_end(key)
+            hits.append(now)
+            while len(self.hits) > self.max_keys:
+                self.hits.popitem(last=False)
+            return now
+
+    def release(self, key, handle):
+        """Forget one hit of key returned by reserve()."""
+        with self.lock:
+            hits = self.hits.get(key)
+            if hits is not None and handle in hits:
+                hits.remove(handle)
+                if not hits:
+                    del self.hits[key]
+
+    def reset(self, key, limit):
+        """Forget hits of key."""
+        with self.lock:
+            self.hits.pop(key, None)
+
+
+class CacheWindow:
+    """Approximate sliding window over two fixed windows in the cache.
+
+    Every hit is a separate cache key numbered from 0 to limit - 1 in
+    its fixed window, a hit is reserved with cache.add, which is atomic
+    in every backend (the database cache relies on the primary key),
+    so parallel requests never take one number twice. Hits of the
+    previous window are weighted by the part of it which still
+    overlaps the sliding window.
+
+    Arguments:
+        window: length of the window in seconds
+        alias: name of the cache in CACHES
+    """
+
+    KEY = 'login:throttle:{0}:{1}:{2}'
+
+    def __init__(self, window, alias='default'):
+        self.window = window
+        self.cache = caches[alias]
+
+    def _slot_keys(self, key, slot, limit):
+        return [self.KEY.format(key, slot, number) for number in range(limit)]
+
+    def _hits(self, key, limit):
+        """Return the current slot, seconds passed in it, the weighted
+        amount of previous hits and numbers of the current hits."""
+        now = time.time()
+        slot = int(now // self.window)
+        elapsed = now - slot * self.window
+        previous_keys = self._slot_keys(key, slot - 1, limit)
+        current_keys = self._slot_keys(key, slot, limit)
+        found = self.cache.get_many(previous_keys + current_keys)
+        previous = sum(cache_key in found for cache_key in previous_keys)
+        taken = {
+            number
+            for number, cache_key in enumerate(current_keys)
+            if cache_key in found
+        }
+        weighted = int(previous * (1 - elapsed / self.window))
+        return slot, elapsed, weighted, taken
+
+    def count(self, key, limit):
+        """Return estimated hits of key in the last window and the
+        seconds until the estimation drops."""
+        _, elapsed, weighted, taken = self._hits(key, limit)
+        hits = weighted + len(taken)
+        if not hits:
+            return 0, 0
+        retry_after = self.window - elapsed if weighted else self.window
+        return hits, retry_after
+
+    def reserve(self, key, limit):
+        """Count one hit of key if there are less than limit hits.
+
+        Returns:
+            str: handle of the hit for release(), None if the limit
+            is reached
+        """
+        slot, _, weighted, taken = self._hits(key, limit)
+        for number in range(limit - weighted):
+            if number in taken:
+                continue
+            cache_key = self.KEY.format(key, slot, number)
+            # a parallel request may take the number first
+            if self.cache.add(cache_key, 1, self.window * 2):
+                return cache_key
+        return None
+
+    def release(self, key, handle):
+        """Forget one hit of key returned by reserve()."""
+        self.cache.delete(handle)
+
+    def reset(self, key, limit):
+        """Forget hits of key."""
+        slot = int(time.time() // self.window)
+        self.cache.delete_many(
+            self._slot_keys(key, slot - 1, limit)
+            + self._slot_keys(key, slot, limit),
+        )
+
+
+class LoginThrottle:
+    """Limits failed logins per client IP and per IP and username.
+
+    Arguments:
+        counter: LocalWindow or CacheWindow
+        ip_attempts: failed attempts allowed from one IP in the window
+        username_attempts: failed attempts allowed for one username
+        from one IP
+    """
+
+    def __init__(self, counter, ip_attempts, username_attempts):
+        self.counter = counter
+        self.limits = (
+            ('ip', ip_attempts),
+            ('username', username_attempts),
+        )
+
+    def _keys(self, request, username):
+        ip = request.META.get('REMOTE_ADDR', '')
+        return {
+            'ip': 'ip:{0}'.format(ip),
+            'username': 'username:{0}:{1}'.format(
+                ip,
+                (username or '').lower(),
+            ),
+        }
+
+    def failures(self, request, username):
+        """Return amount of failed attempts of the username."""
+        keys = self._keys(request, username)
+        return self.counter.count(keys['username'], self.limits[1][1])[0]
+
+    def retry_after(self, request, username):
+        """Return seconds until the next attempt is allowed, 0 if the
+        attempt can be checked now."""
+        keys = self._keys(request, username)
+        wait = 0
+        for name, attempts in self.limits:
+            hits, retry_after = self.counter.count(keys[name], attempts)
+            if hits >= attempts:
+                wait = max(wait, retry_after)
+        return int(wait + 0.999)
+
+    def _release(self, reservation):
+        for key, handle in reservation:
+            self.counter.release(key, handle)
+
+    def reserve(self, request, username):
+        """Count an attempt before its password is checked.
+
+        The IP limit is checked first, an attempt over it does not
+        count against the username. The attempt stays counted as
+        failed unless succeed() releases it.
+
+        Returns:
+            list: reservation for succeed(), None if the limit is
+            reached and the password must not be checked
+        """
+        keys = self._keys(request, username)
+        reservation = []
+        for name, attempts in self.limits:
+            handle = self.counter.reserve(keys[name], attempts)
+            if handle is None:
+                self._release(reservation)
+                return None
+            reservation.append((keys[name], handle))
+        return reservation
+
+    def succeed(self, request, username, reservation):
+        """Release the attempt and forget failed attempts of the
+        username from this IP after a login."""
+        self._release(reservation)
+        self.counter.reset(
+            self._keys(request, username)['username'],
+            self.limits[1][1],
+        )
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def get_login_throttle():
+    """Return the process-wide login throttle configured in settings."""
+    global _throttle
+    with _throttle_lock:
+        if _throttle is None:
+            counter_class = import_string(settings.LOGIN_THROTTLE_BACKEND)
+            _throttle = LoginThrottle(
+                counter_class(settings.LOGIN_THROTTLE_WINDOW),
+                settings.LOGIN_THROTTLE_IP_ATTEMPTS,
+                settings.LOGIN_THROTTLE_USERNAME_ATTEMPTS,
+            )
+        return _throttle
@@ -14,10 +14,11 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.contrib.auth import views as auth_views
 from django.conf import settings
 from django.conf.urls.static import static
+from assets.views import serve as serve_static
 from . import views
 
 
@@ -39,6 +40,7 @@ urlpatterns = [
     path('courses/', include('courses.urls')),
     path('students/', include('students.urls')),
     path('managers/', include('managers.urls')),
+    path('outbox/', include('outbox.urls')),
     path(
         'password-reset/',
         auth_views.PasswordResetView.as_view(),
@@ -71,6 +73,15 @@ urlpatterns = [
     ),
 ]
 
+if settings.SERVE_STATIC:
+    urlpatterns += [
+        re_path(
+            r'^{0}(?P<path>.*)$'.format(settings.STATIC_URL.lstrip('/')),
+            serve_static,
+            name='static',
+        ),
+    ]
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
\ No newline at end of file
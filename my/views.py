@@ -1,13 +1,32 @@
 """Module for client requests handling."""
-from django.contrib.auth import authenticate, login
+import base64
+import datetime
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
-from django.http import HttpResponseRedirect, JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Q
+from django.http import (
+    HttpResponseRedirect,
+    JsonResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import redirect, render
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_datetime
 from django.views import View
 
+from my.throttling import get_login_throttle
+from students.booking import LessonConflict, book_lesson
+from students.forms import LessonBookingForm
 from students.models import TeacherSchedule
+from students.roles import get_role
 
 
 def index(request):
@@ -26,29 +45,29 @@ def index(request):
 def profile(request):
     """Redirect to profile page to which group user belongs.
 
+    The role is read from the session (students.roles), it is stored
+    there at login, so the redirect needs no group queries.
+
     Arguments:
         request: client request
 
     Returns:
-        HttpResponseRedirect: if
-        request.user.groups.filter(user=request.user)[0] = Administrator
+        HttpResponseRedirect: if role is Administrator
         then redirect to administrator/profile page TODO: test it
 
-        HttpResponseRedirect: if
-        request.user.groups.filter(user=request.user)[0] = Teachers
+        HttpResponseRedirect: if role is Teachers
         then redirect to courses/course_list/ page
 
-        HttpResponseRedirect: if
-        request.user.groups.filter(user=request.user)[0] = Students
+        HttpResponseRedirect: if role is Students
         then redirect to students/student profile page
     """
-    group = request.user.groups.filter(user=request.user)[0]
+    role = get_role(request)
 
-    if group.name == 'Administrator':
+    if role == 'Administrator':
         return HttpResponseRedirect(reverse('administrator'))
-    elif group.name == 'Teachers':
+    elif role == 'Teachers':
         return HttpResponseRedirect(reverse('teacher'))
-    elif group.name == 'Students':
+    elif role == 'Students':
         return HttpResponseRedirect(reverse('student'))
 
     context: dict = {}
@@ -59,6 +78,10 @@ def profile(request):
 class CustomLoginView(View):
     """Custom LoginView for handling the login amout.
 
+    Failed attempts are counted on the server per IP and per IP and
+    username (my.throttling). An attempt is reserved before the
+    password is hashed, a limited one is rejected with 429.
+
     Arguments:
         View: default view superclass
     """
@@ -99,6 +122,9 @@ class CustomLoginView(View):
     def post(self, request):
         """Handle POST-request.
 
+        The password is hashed once: AuthenticationForm.is_valid()
+        authenticates the user and form.get_user() returns it.
+
         Arguments:
             request: client request
 
@@ -108,29 +134,46 @@ class CustomLoginView(View):
 
             render(): if form is not valid or no user or user is blocked
             then return form and render page, where is form.errors
-            which describes the problem
+            which describes the problem, retry_after is seconds
+            until the next attempt when there were too many failed ones
         """
-        next_try: int = int(request.POST.get('next'))
-        next_try += 1
+        throttle = get_login_throttle()
+        username = request.POST.get('username', '')
+
+        reservation = throttle.reserve(request, username)
+        if reservation is None:
+            retry_after = max(throttle.retry_after(request, username), 1)
+            # unbound form, validation of a bound one would hash
+            response = render(
+                request=request,
+                template_name=self.template_name,
+                context={
+                    'form': AuthenticationForm(
+                        request,
+                        initial={'username': username},
+                    ),
+                    'next': throttle.failures(request, username),
+                    'retry_after': retry_after,
+                },
+                status=429,
+            )
+            response['Retry-After'] = retry_after
+            return response
 
         form = AuthenticationForm(request, data=request.POST)
-
         if form.is_valid():
-            user = authenticate(
-                username=form.cleaned_data.get('username'),
-                password=form.cleaned_data.get('password'),
-            )
-            if user and user.is_active:
-                login(request, user)
-                next_try = 0
-                # FIXME: какая группа присваивается? Не происходит редирект
-                return redirect(to='profile')
+            throttle.succeed(request, username, reservation)
+            login(request, form.get_user())
+            # FIXME: какая группа присваивается? Не происходит редирект
+            return redirect(to='profile')
+        # the reserved attempt stays counted as failed
         return render(
             request=request,
             template_name=self.template_name,
             context={
                 'form': form,
-                'next': next_try,
+                'next': throttle.failures(request, username),
+                'retry_after': throttle.retry_after(request, username),
             },
         )
 
@@ -170,10 +213,150 @@ def get_json_busy_datetime(request, api_version):
                 )
             )
         return JsonResponse({'shedule': schedule})
+    elif api_version == 1:
+        return get_schedule_window(request)
     else:
         return JsonResponse({})
 
 
+SCHEDULE_FIELDS = ('id', 'teacher_id', 'start_timestamp', 'end_timestamp')
+SCHEDULE_PAGE_SIZE = 500
+SCHEDULE_MAX_PAGE_SIZE = 2000
+
+
+def _parse_timestamp(value):
+    timestamp = parse_datetime(value)
+    if timestamp is None:
+        raise ValueError('Wrong datetime: {0}'.format(value))
+    if timezone.is_naive(timestamp):
+        timestamp = timezone.make_aware(timestamp)
+    return timestamp
+
+
+def _encode_cursor(row):
+    cursor = '{0}|{1}'.format(row['start_timestamp'].isoformat(), row['id'])
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def _decode_cursor(cursor):
+    try:
+        start, row_id = base64.urlsafe_b64decode(
+            cursor.encode(),
+        ).decode().split('|')
+    except (ValueError, UnicodeError):
+        raise ValueError('Wrong cursor')
+    return _parse_timestamp(start), int(row_id)
+
+
+def _stream_schedule(rows, limit):
+    """Yield json of schedule page row by row.
+
+    rows holds one row more than limit, it means there is a next page.
+    """
+    yield '{"shedule": ['
+    next_cursor = None
+    last_row = None
+    for number, row in enumerate(rows.iterator()):
+        if number == limit:
+            next_cursor = _encode_cursor(last_row)
+            break
+        yield '{0}{1}'.format(
+            ',' if number else '',
+            json.dumps(row, cls=DjangoJSONEncoder),
+        )
+        last_row = row
+    yield '], "next": {0}}}'.format(json.dumps(next_cursor))
+
+
+def get_schedule_window(request):
+    """Returns json with teachers busy datetime in the requested window.
+
+    GET parameters (all optional):
+        teacher_id: only lessons of this teacher
+        from, to: ISO datetimes, lessons which overlap [from, to)
+        limit: page size, SCHEDULE_PAGE_SIZE by default
+        cursor: value of "next" from the previous page
+
+    Pages are ordered by (start_timestamp, id) and selected by keyset,
+    not by offset. ETag describes the whole window: the number of
+    lessons, the last id and the last change. A deleted lesson changes
+    the number, so there is no Last-Modified, Max('updated') does not
+    notice deletions. An unchanged calendar is answered with 304 after
+    one aggregate query. The page itself is streamed while rows are read.
+
+    Arguments:
+        request: client request
+
+    Returns:
+        StreamingHttpResponse (json):
+        {
+            'shedule': [
+                {
+                    'id': 2,
+                    'teacher_id': 1,
+                    'start_timestamp': '2020-05-15T22:42:37.763Z',
+                    'end_timestamp': '2020-05-15T23:27:37.763Z'
+                },
+            ],
+            'next': 'MjAyMC0wNS0xNVQyMjo0MjozNy43NjMrMDA6MDB8Mg=='
+        }
+    """
+    try:
+        schedule = TeacherSchedule.objects.all()
+        if request.GET.get('teacher_id'):
+            schedule = schedule.filter(
+                teacher_id=int(request.GET['teacher_id']),
+            )
+        if request.GET.get('from'):
+            schedule = schedule.filter(
+                end_timestamp__gt=_parse_timestamp(request.GET['from']),
+            )
+        if request.GET.get('to'):
+            schedule = schedule.filter(
+                start_timestamp__lt=_parse_timestamp(request.GET['to']),
+            )
+        limit = min(
+            int(request.GET.get('limit', SCHEDULE_PAGE_SIZE)),
+            SCHEDULE_MAX_PAGE_SIZE,
+        )
+        if limit < 1:
+            raise ValueError('limit must be positive')
+        cursor = request.GET.get('cursor')
+        if cursor:
+            start, row_id = _decode_cursor(cursor)
+    except ValueError as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    state = schedule.aggregate(
+        total=Count('id'),
+        last_id=Max('id'),
+        last_updated=Max('updated'),
+    )
+    etag = '"{0}"'.format(hashlib.md5(
+        repr((sorted(state.items()), request.GET.urlencode())).encode(),
+    ).hexdigest())
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    if cursor:
+        schedule = schedule.filter(
+            Q(start_timestamp__gt=start) |
+            Q(start_timestamp=start, id__gt=row_id),
+        )
+    rows = schedule.order_by(
+        'start_timestamp',
+        'id',
+    ).values(*SCHEDULE_FIELDS)[:limit + 1]
+
+    response = StreamingHttpResponse(
+        _stream_schedule(rows, limit),
+        content_type='application/json',
+    )
+    response['ETag'] = etag
+    return response
+
+
 class CalendarView(View):
     """Describe view for calendar.
     
@@ -200,15 +383,51 @@ class CalendarView(View):
     
 
     def post(self, request):
-        """Reseive json with day and time.
+        """Book a lesson at day and time.
 
         Student set time which he/she wants
-        to do a free trial lesson
+        to do a free trial lesson, lesson lasts settings.LESSON_DURATION
 
         Arguments:
             request: client request
+
+        Returns:
+            JsonResponse (json): booked lesson, status 201
+            {'id': 5, 'teacher_id': 1, 'start_timestamp': ..., 'end_timestamp': ...}
+
+            JsonResponse (json): form errors, status 400
+            {'errors': {'teacher': ['This field is required.']}}
+
+            JsonResponse (json): overlapping lessons, status 409
+            {'conflicts': [{'id': 2, 'start_timestamp': ..., 'end_timestamp': ...}]}
         """
-        print(request.POST)
+        form = LessonBookingForm(request.POST)
+        if not form.is_valid():
+            return JsonResponse({'errors': form.errors}, status=400)
+
+        start = form.cleaned_data['start_timestamp']
+        try:
+            lesson = book_lesson(
+                teacher_id=form.cleaned_data['teacher'].id,
+                start=start,
+                end=start + datetime.timedelta(
+                    minutes=settings.LESSON_DURATION,
+                ),
+                parent_name=form.cleaned_data['parent_name'],
+                student_name=form.cleaned_data['student_name'],
+                phone=form.cleaned_data['phone'],
+            )
+        except LessonConflict as conflict:
+            return JsonResponse({'conflicts': conflict.conflicts}, status=409)
+        return JsonResponse(
+            {
+                'id': lesson.id,
+                'teacher_id': lesson.teacher_id,
+                'start_timestamp': lesson.start_timestamp,
+                'end_timestamp': lesson.end_timestamp,
+            },
+            status=201,
+        )
 
 
 @login_required
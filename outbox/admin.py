@@ -0,0 +1,9 @@
+from django.contrib import admin
+from .models import OutgoingEmail
+
+
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ['to', 'subject', 'status', 'attempts', 'created', 'sent']
+    list_filter = ['status']
+    search_fields = ['to', 'subject']
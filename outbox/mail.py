@@ -0,0 +1,187 @@
+"""Enqueue emails and send the queue in batches.
+
+Example:
+
+    from outbox.mail import enqueue
+    enqueue('Subject', 'Message', user.email)
+
+The email is sent later by the worker:
+
+    python manage.py send_outbox --loop
+"""
+import datetime
+import logging
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from outbox.models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(subject, message, to, from_email=None):
+    """Put one email into the outbox.
+
+    Arguments:
+        subject: email subject
+        message: email body
+        to: recipient address
+        from_email: sender, settings.DEFAULT_FROM_EMAIL by default
+
+    Returns:
+        OutgoingEmail: queued email
+    """
+    return OutgoingEmail.objects.create(
+        subject=subject,
+        body=message,
+        to=to,
+        from_email=from_email or '',
+        send_after=timezone.now(),
+    )
+
+
+def enqueue_many(emails, batch_size=1000):
+    """Put many emails into the outbox with bulk inserts.
+
+    Arguments:
+        emails: iterable of (subject, message, to) tuples
+        batch_size: amount of rows in one INSERT
+
+    Returns:
+        int: amount of queued emails
+    """
+    now = timezone.now()
+    total = 0
+    batch = []
+    for subject, message, to in emails:
+        batch.append(OutgoingEmail(
+            subject=subject,
+            body=message,
+            to=to,
+            send_after=now,
+        ))
+        if len(batch) >= batch_size:
+            OutgoingEmail.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+    OutgoingEmail.objects.bulk_create(batch)
+    return total + len(batch)
+
+
+def _retry_delay(attempts):
+    """Return the delay before the next attempt, it doubles every time."""
+    return datetime.timedelta(
+        seconds=settings.OUTBOX_RETRY_DELAY * 2 ** (attempts - 1),
+    )
+
+
+def send_batch(batch_size=None):
+    """Send one batch of due emails over one SMTP connection.
+
+    Rows are locked with SKIP LOCKED, so several workers can run at
+    once without sending an email twice.
+
+    Arguments:
+        batch_size: amount of emails, settings.OUTBOX_BATCH_SIZE by default
+
+    Returns:
+        tuple: amount of sent and failed emails
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    sent_ids = []
+    failed = 0
+    with transaction.atomic():
+        emails = list(
+            OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+                status=OutgoingEmail.QUEUED,
+                send_after__lte=timezone.now(),
+            )[:batch_size],
+        )
+        if not emails:
+            return 0, 0
+
+        connection = get_connection(fail_silently=False)
+        try:
+            connection.open()
+        except Exception as error:
+            logger.warning('Outbox: cannot connect to mail server: %s', error)
+            connection = None
+
+        for email in emails:
+            try:
+                if connection is None:
+                    raise ConnectionError('No connection to mail server')
+                EmailMessage(
+                    subject=email.subject,
+                    body=email.body,
+                    from_email=email.from_email or None,
+                    to=[email.to],
+                    connection=connection,
+                ).send()
+            except Exception as error:
+                failed += 1
+                email.attempts += 1
+                email.last_error = str(error)
+                if email.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                    email.status = OutgoingEmail.DEAD
+                    logger.error('Outbox: email %s is dead: %s', email.id, error)
+                else:
+                    email.send_after = timezone.now() + _retry_delay(
+                        email.attempts,
+                    )
+                email.save(update_fields=[
+                    'attempts',
+                    'last_error',
+                    'status',
+                    'send_after',
+                ])
+            else:
+                sent_ids.append(email.id)
+
+        if connection is not None:
+            connection.close()
+        OutgoingEmail.objects.filter(id__in=sent_ids).update(
+            status=OutgoingEmail.SENT,
+            sent=timezone.now(),
+        )
+    return len(sent_ids), failed
+
+
+def metrics(latency_window=1000):
+    """Return queue depth and send latency of the outbox.
+
+    Arguments:
+        latency_window: amount of the latest sent emails for latency
+
+    Returns:
+        dict: queued, due, dead - amount of emails,
+        oldest_queued_seconds - age of the oldest queued email,
+        avg_latency_seconds - time from enqueue to send
+    """
+    now = timezone.now()
+    queued = OutgoingEmail.objects.filter(status=OutgoingEmail.QUEUED)
+    oldest = queued.aggregate(oldest=Min('created'))['oldest']
+    latest_sent = list(OutgoingEmail.objects.filter(
+        status=OutgoingEmail.SENT,
+    ).order_by('-sent').values_list('created', 'sent')[:latency_window])
+    latency = 0
+    if latest_sent:
+        latency = sum(
+            (sent - created).total_seconds()
+            for created, sent in latest_sent
+        ) / len(latest_sent)
+    return {
+        'queued': queued.count(),
+        'due': queued.filter(send_after__lte=now).count(),
+        'dead': OutgoingEmail.objects.filter(
+            status=OutgoingEmail.DEAD,
+        ).count(),
+        'oldest_queued_seconds': (
+            (now - oldest).total_seconds() if oldest else 0
+        ),
+        'avg_latency_seconds': latency,
+    }
@@ -0,0 +1,41 @@
+"""Worker which sends queued emails."""
+import time
+
+from django.core.management.base import BaseCommand
+
+from outbox.mail import send_batch
+
+
+class Command(BaseCommand):
+    """Send due emails from the outbox in batches.
+
+    Run once (e.g. from cron) or keep running with --loop:
+
+        python manage.py send_outbox --loop --interval 5
+    """
+
+    help = 'Send queued emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep polling the outbox',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=5,
+            help='Seconds to sleep when the outbox is empty',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_batch(options['batch_size'])
+            if sent or failed:
+                self.stdout.write('Sent {0}, failed {1}'.format(sent, failed))
+            elif not options['loop']:
+                break
+            else:
+                time.sleep(options['interval'])
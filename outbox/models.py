@@ -0,0 +1,50 @@
+"""Emails which wait to be sent by the send_outbox worker."""
+from django.db import models
+
+
+class OutgoingEmail(models.Model):
+    """Describe outbox_outgoingemail table in database.
+
+    Views only put emails here (see outbox.enqueue), the send_outbox
+    command sends them in batches.
+
+    status: queued - waits for sending, sent - delivered to SMTP server,
+    dead - failed settings.OUTBOX_MAX_ATTEMPTS times, is not retried
+    send_after: queued email is not sent before it, moves forward
+    after every failed attempt
+
+    Arguments:
+        models.Model: superclass which describes fields for database
+    """
+    QUEUED = 'queued'
+    SENT = 'sent'
+    DEAD = 'dead'
+    STATUS_CHOICES = (
+        (QUEUED, 'Queued'),
+        (SENT, 'Sent'),
+        (DEAD, 'Dead'),
+    )
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True, default='')
+    to = models.EmailField(max_length=254)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=QUEUED,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+    created = models.DateTimeField(auto_now_add=True)
+    send_after = models.DateTimeField()
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['send_after', 'id']
+        indexes = [
+            models.Index(fields=['status', 'send_after', 'id']),
+        ]
+
+    def __str__(self):
+        return '{0}: {1}'.format(self.to, self.subject)
@@ -0,0 +1,95 @@
+import datetime
+from smtplib import SMTPException
+from unittest import mock
+
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from outbox.mail import enqueue, enqueue_many, metrics, send_batch
+from outbox.models import OutgoingEmail
+
+
+def make_due(email):
+    """Move send_after of a retried email to the past."""
+    OutgoingEmail.objects.filter(id=email.id).update(
+        send_after=timezone.now() - datetime.timedelta(seconds=1),
+    )
+
+
+@override_settings(
+    EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+    OUTBOX_MAX_ATTEMPTS=3,
+    OUTBOX_RETRY_DELAY=60,
+)
+class SendBatchTest(TestCase):
+
+    def test_queued_emails_are_sent_once(self):
+        enqueue_many(
+            ('Subject', 'Message', 'user{0}@example.com'.format(number))
+            for number in range(3)
+        )
+        self.assertEqual(send_batch(), (3, 0))
+        self.assertEqual(send_batch(), (0, 0))
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertFalse(
+            OutgoingEmail.objects.exclude(status=OutgoingEmail.SENT).exists(),
+        )
+        self.assertEqual(metrics()['queued'], 0)
+
+    def test_failed_email_is_retried_with_backoff(self):
+        email = enqueue('Subject', 'Message', 'user@example.com')
+        delays = []
+        with mock.patch(
+            'outbox.mail.EmailMessage.send',
+            side_effect=SMTPException('Mailbox is full'),
+        ):
+            for _ in range(2):
+                before = timezone.now()
+                self.assertEqual(send_batch(), (0, 1))
+                # not due until the delay has passed
+                self.assertEqual(send_batch(), (0, 0))
+                email.refresh_from_db()
+                delays.append((email.send_after - before).total_seconds())
+                make_due(email)
+        self.assertEqual(email.status, OutgoingEmail.QUEUED)
+        self.assertEqual(email.attempts, 2)
+        self.assertEqual(email.last_error, 'Mailbox is full')
+        self.assertAlmostEqual(delays[0], 60, delta=5)
+        self.assertAlmostEqual(delays[1], 120, delta=5)
+
+        self.assertEqual(send_batch(), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.SENT)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_email_is_dead_after_max_attempts(self):
+        email = enqueue('Subject', 'Message', 'user@example.com')
+        with mock.patch(
+            'outbox.mail.EmailMessage.send',
+            side_effect=SMTPException('Unknown user'),
+        ), self.assertLogs('outbox.mail', 'ERROR'):
+            for _ in range(3):
+                send_batch()
+                make_due(email)
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.DEAD)
+        self.assertEqual(email.attempts, 3)
+        self.assertEqual(send_batch(), (0, 0))
+        self.assertEqual(metrics()['dead'], 1)
+
+    def test_batch_fails_without_mail_server(self):
+        enqueue_many([
+            ('Subject', 'Message', 'first@example.com'),
+            ('Subject', 'Message', 'second@example.com'),
+        ])
+        with mock.patch(
+            'django.core.mail.backends.locmem.EmailBackend.open',
+            side_effect=ConnectionRefusedError('Connection refused'),
+        ), self.assertLogs('outbox.mail', 'WARNING'):
+            self.assertEqual(send_batch(), (0, 2))
+        self.assertEqual(
+            set(OutgoingEmail.objects.values_list('attempts', flat=True)),
+            {1},
+        )
+        self.assertEqual(len(mail.outbox), 0)
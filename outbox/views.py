@@ -0,0 +1,24 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import JsonResponse
+
+from outbox.mail import metrics
+
+
+@staff_member_required
+def outbox_metrics(request):
+    """Returns json with outbox queue depth and send latency.
+
+    Arguments:
+        request: client request
+
+    Returns:
+        JsonResponse (json):
+        {
+            'queued': 12,
+            'due': 2,
+            'dead': 0,
+            'oldest_queued_seconds': 3.5,
+            'avg_latency_seconds': 1.2
+        }
+    """
+    return JsonResponse(metrics())
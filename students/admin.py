@@ -1,7 +1,14 @@
 from django.contrib import admin
-from .models import Student, StudentStatus, Teacher, TeacherStatus
+from .models import (
+    Student,
+    StudentStatus,
+    Teacher,
+    TeacherStatus,
+    TeacherWorkingHours,
+)
 
 admin.site.register(StudentStatus)
 admin.site.register(Student)
 admin.site.register(TeacherStatus)
-admin.site.register(Teacher)
\ No newline at end of file
+admin.site.register(Teacher)
+admin.site.register(TeacherWorkingHours)
@@ -1,5 +1,36 @@
 from django.apps import AppConfig
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+)
 
 
 class StudentsConfig(AppConfig):
     name = 'students'
+
+    def ready(self):
+        from django.contrib.auth.models import Group, User
+
+        from .availability import (
+            lesson_deleted,
+            lesson_saved,
+            remember_lesson,
+            teachers_changed,
+        )
+        from .models import Teacher, TeacherSchedule, TeacherWorkingHours
+        from .roles import groups_changed, role_on_login, user_groups_changed
+
+        post_init.connect(remember_lesson, sender=TeacherSchedule)
+        post_save.connect(lesson_saved, sender=TeacherSchedule)
+        post_delete.connect(lesson_deleted, sender=TeacherSchedule)
+        for model in (Teacher, TeacherWorkingHours):
+            post_save.connect(teachers_changed, sender=model)
+            post_delete.connect(teachers_changed, sender=model)
+
+        user_logged_in.connect(role_on_login)
+        m2m_changed.connect(user_groups_changed, sender=User.groups.through)
+        post_save.connect(groups_changed, sender=Group)
+        post_delete.connect(groups_changed, sender=Group)
@@ -0,0 +1,405 @@
+"""Search of free lesson slots of teachers.
+
+Busy intervals of every teacher (TeacherSchedule rows) are kept in
+memory sorted by start, so a search between A and B bisects to the
+first interval which can overlap A and reads only the intervals inside
+the window, it never scans the whole history.
+
+Example:
+
+    from students.availability import get_index
+    index = get_index()
+    index.free_slots(start, end, datetime.timedelta(minutes=45))
+    {1: [(datetime(...10:00), datetime(...10:45)), ...], 2: [...]}
+"""
+import bisect
+import datetime
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+
+def parse_time(value):
+    """Return datetime.time from 'HH:MM' string."""
+    return datetime.datetime.strptime(value, '%H:%M').time()
+
+
+class TeacherIntervals:
+    """Sorted busy intervals of one teacher.
+
+    Intervals may overlap and are not merged, an interval which is
+    already there is not added twice. longest keeps the length of the
+    longest interval, so every interval which overlaps a window
+    starts no earlier than window start - longest.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.intervals = []
+        self.longest = datetime.timedelta(0)
+
+    def add(self, start, end):
+        position = bisect.bisect_left(self.intervals, (start, end))
+        if self.intervals[position:position + 1] == [(start, end)]:
+            return
+        self.starts.insert(position, start)
+        self.intervals.insert(position, (start, end))
+        self.longest = max(self.longest, end - start)
+
+    def remove(self, start, end):
+        position = bisect.bisect_left(self.intervals, (start, end))
+        if self.intervals[position:position + 1] == [(start, end)]:
+            del self.starts[position]
+            del self.intervals[position]
+
+    def overlapping(self, start, end):
+        """Return intervals which overlap [start, end) sorted by start."""
+        first = bisect.bisect_left(self.starts, start - self.longest)
+        last = bisect.bisect_left(self.starts, end)
+        return [
+            interval
+            for interval in self.intervals[first:last]
+            if interval[1] > start
+        ]
+
+
+class AvailabilityIndex:
+    """Busy intervals and working hours of all teachers.
+
+    Arguments:
+        working_hours: dict teacher_id -> {weekday: [(start, end)]},
+        start and end are datetime.time
+        default_hours: list of (start, end) for teachers without
+        working hours
+    """
+
+    def __init__(self, working_hours=None, default_hours=()):
+        self.teachers = {}
+        self.working_hours = working_hours or {}
+        self.default_hours = list(default_hours)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def build(cls, since=None):
+        """Load the index from database.
+
+        Arguments:
+            since: lessons which end before it are skipped
+
+        Returns:
+            AvailabilityIndex: index with all teachers
+        """
+        from students.models import Teacher, TeacherSchedule, TeacherWorkingHours
+
+        working_hours = {}
+        for teacher_id, weekday, start, end in (
+            TeacherWorkingHours.objects.values_list(
+                'teacher_id',
+                'weekday',
+                'start_time',
+                'end_time',
+            )
+        ):
+            working_hours.setdefault(teacher_id, {}).setdefault(
+                weekday,
+                [],
+            ).append((start, end))
+        default_start, default_end = settings.TEACHER_WORKING_HOURS
+        index = cls(
+            working_hours,
+            [(parse_time(default_start), parse_time(default_end))],
+        )
+        for teacher_id in Teacher.objects.values_list('id', flat=True):
+            index.teachers[teacher_id] = TeacherIntervals()
+        lessons = TeacherSchedule.objects.order_by('start_timestamp')
+        if since is not None:
+            lessons = lessons.filter(end_timestamp__gt=since)
+        for teacher_id, start, end in lessons.values_list(
+            'teacher_id',
+            'start_timestamp',
+            'end_timestamp',
+        ).iterator():
+            index.book(teacher_id, start, end)
+        return index
+
+    def book(self, teacher_id, start, end):
+        """Mark [start, end) of teacher as busy."""
+        with self.lock:
+            self.teachers.setdefault(
+                teacher_id,
+                TeacherIntervals(),
+            ).add(start, end)
+
+    def cancel(self, teacher_id, start, end):
+        """Mark [start, end) of teacher as free again."""
+        with self.lock:
+            if teacher_id in self.teachers:
+                self.teachers[teacher_id].remove(start, end)
+
+    def working_windows(self, teacher_id, start, end):
+        """Return working windows of teacher which lie in [start, end)."""
+        hours = self.working_hours.get(teacher_id)
+        windows = []
+        day = timezone.localtime(start).date()
+        last_day = timezone.localtime(end).date()
+        while day <= last_day:
+            if hours is None:
+                day_hours = self.default_hours
+            else:
+                day_hours = hours.get(day.weekday(), ())
+            for day_start, day_end in day_hours:
+                window_start = max(start, timezone.make_aware(
+                    datetime.datetime.combine(day, day_start),
+                ))
+                window_end = min(end, timezone.make_aware(
+                    datetime.datetime.combine(day, day_end),
+                ))
+                if window_start < window_end:
+                    windows.append((window_start, window_end))
+            day += datetime.timedelta(days=1)
+        return windows
+
+    def teacher_free_slots(self, teacher_id, start, end, duration, step=None):
+        """Return free slots of one teacher.
+
+        Arguments:
+            teacher_id: id of Teacher
+            start, end: aware datetimes of the searched window
+            duration: timedelta, length of a slot
+            step: timedelta between slot starts, duration by default
+
+        Returns:
+            list: (slot_start, slot_end) tuples sorted by time
+        """
+        step = step or duration
+        intervals = self.teachers.get(teacher_id)
+        slots = []
+        for window_start, window_end in self.working_windows(
+            teacher_id,
+            start,
+            end,
+        ):
+            busy = []
+            if intervals is not None:
+                with self.lock:
+                    busy = intervals.overlapping(window_start, window_end)
+            cursor = window_start
+            for busy_start, busy_end in busy + [(window_end, window_end)]:
+                while cursor + duration <= busy_start:
+                    slots.append((cursor, cursor + duration))
+                    cursor += step
+                cursor = max(cursor, busy_end)
+        return slots
+
+    def free_slots(self, start, end, duration, teacher_ids=None, step=None):
+        """Return free slots of every teacher between start and end.
+
+        Returns:
+            dict: teacher_id -> list of (slot_start, slot_end),
+            teachers without free slots are skipped
+        """
+        if teacher_ids is None:
+            teacher_ids = list(self.teachers)
+        found = {}
+        for teacher_id in teacher_ids:
+            slots = self.teacher_free_slots(
+                teacher_id,
+                start,
+                end,
+                duration,
+                step,
+            )
+            if slots:
+                found[teacher_id] = slots
+        return found
+
+
+# a process which is behind by more changes rebuilds its index
+MAX_APPLIED_CHANGES = 1000
+
+_index = None
+_index_built = 0
+_index_polled = 0
+_last_change = 0
+_index_lock = threading.Lock()
+
+
+def _apply(index, changes):
+    for teacher_id, start, end, booked in changes:
+        if booked:
+            index.book(teacher_id, start, end)
+        else:
+            index.cancel(teacher_id, start, end)
+
+
+def _new_changes():
+    """Return LessonChange rows which the index has not seen.
+
+    Returns:
+        list: (id, teacher_id, start, end, booked) tuples or None if
+        the index has to be rebuilt
+    """
+    from students.models import LessonChange
+
+    changes = list(LessonChange.objects.filter(
+        id__gt=_last_change,
+    ).order_by('id').values_list(
+        'id',
+        'teacher_id',
+        'start_timestamp',
+        'end_timestamp',
+        'booked',
+    )[:MAX_APPLIED_CHANGES + 1])
+    if len(changes) > MAX_APPLIED_CHANGES or any(
+        change[1] is None for change in changes
+    ):
+        return None
+    return changes
+
+
+def _rebuild():
+    global _index, _index_built, _last_change
+    from students.models import LessonChange
+
+    # read the log position first, the changes made while the index
+    # is built are applied once more, book() and cancel() are idempotent
+    _last_change = LessonChange.objects.aggregate(
+        last=Max('id'),
+    )['last'] or 0
+    now = timezone.now()
+    _index = AvailabilityIndex.build(since=now - datetime.timedelta(days=1))
+    _index_built = time.monotonic()
+    # an older row can be needed only by an index which is past its TTL
+    LessonChange.objects.filter(
+        created__lt=now - datetime.timedelta(
+            seconds=settings.AVAILABILITY_INDEX_TTL * 2,
+        ),
+    ).delete()
+
+
+def get_index():
+    """Return the process-wide index, update it when it is outdated.
+
+    Lessons booked or cancelled in any process are written to the
+    LessonChange log, every process reads new rows at most once in
+    AVAILABILITY_INDEX_POLL seconds and applies them to its index.
+    The index is rebuilt when the log asks for it (teachers changed),
+    when the process is behind by more than MAX_APPLIED_CHANGES and
+    after AVAILABILITY_INDEX_TTL seconds, so changes which skip
+    signals (QuerySet.update, raw SQL) and a row which was committed
+    after a newer one had been read are seen too.
+    """
+    global _index, _index_polled, _last_change
+    with _index_lock:
+        now = time.monotonic()
+        if (
+            _index is not None
+            and now - _index_built > settings.AVAILABILITY_INDEX_TTL
+        ):
+            _index = None
+        if (
+            _index is not None
+            and now - _index_polled >= settings.AVAILABILITY_INDEX_POLL
+        ):
+            changes = _new_changes()
+            if changes is None:
+                _index = None
+            elif changes:
+                _apply(_index, [change[1:] for change in changes])
+                _last_change = changes[-1][0]
+            _index_polled = now
+        if _index is None:
+            _rebuild()
+            _index_polled = now
+        return _index
+
+
+def _publish(changes):
+    """Write changes to the log and apply them to this process index.
+
+    Arguments:
+        changes: list of (teacher_id, start, end, booked)
+    """
+    from students.models import LessonChange
+
+    LessonChange.objects.bulk_create([
+        LessonChange(
+            teacher_id=teacher_id,
+            start_timestamp=start,
+            end_timestamp=end,
+            booked=booked,
+        )
+        for teacher_id, start, end, booked in changes
+    ])
+
+    def apply_here():
+        if _index is not None:
+            _apply(_index, changes)
+
+    transaction.on_commit(apply_here)
+
+
+def reset_index():
+    """Make the index of every process outdated."""
+    global _index
+    from students.models import LessonChange
+
+    # a row without a lesson makes every process rebuild its index
+    LessonChange.objects.create()
+    with _index_lock:
+        _index = None
+
+
+def _lesson_of(instance):
+    return (
+        instance.teacher_id,
+        instance.start_timestamp,
+        instance.end_timestamp,
+    )
+
+
+def remember_lesson(sender, instance, **kwargs):
+    """Remember the time of a loaded lesson.
+
+    It lets lesson_saved() cancel the old time of a moved lesson.
+    """
+    if all(
+        field in instance.__dict__
+        for field in ('teacher_id', 'start_timestamp', 'end_timestamp')
+    ):
+        instance._indexed_lesson = _lesson_of(instance)
+
+
+def lesson_saved(sender, instance, created, raw=False, **kwargs):
+    """Log a booked or moved lesson."""
+    if raw:
+        return
+    lesson = _lesson_of(instance)
+    old_lesson = None
+    if not created:
+        old_lesson = getattr(instance, '_indexed_lesson', None)
+        if old_lesson is None:
+            # deferred fields, the old time is unknown
+            reset_index()
+            return
+    if lesson != old_lesson:
+        changes = [lesson + (True,)]
+        if old_lesson is not None:
+            changes.insert(0, old_lesson + (False,))
+        _publish(changes)
+    instance._indexed_lesson = lesson
+
+
+def lesson_deleted(sender, instance, **kwargs):
+    """Log a cancelled lesson."""
+    lesson = getattr(instance, '_indexed_lesson', _lesson_of(instance))
+    _publish([lesson + (False,)])
+
+
+def teachers_changed(sender, **kwargs):
+    """Rebuild indexes after teachers or working hours changed."""
+    reset_index()
@@ -0,0 +1,53 @@
+"""Booking of lessons in teachers schedule."""
+from django.db import transaction
+
+from students.models import Teacher, TeacherSchedule
+
+
+class LessonConflict(Exception):
+    """Requested time overlaps lessons which are already booked.
+
+    Arguments:
+        conflicts: list of dicts with id, start_timestamp and
+        end_timestamp of the overlapping lessons
+    """
+
+    def __init__(self, conflicts):
+        super().__init__('Teacher is busy at this time')
+        self.conflicts = conflicts
+
+
+def book_lesson(teacher_id, start, end, **fields):
+    """Create a lesson if teacher is free in [start, end).
+
+    The teacher row is locked before the overlap check, so parallel
+    bookings of one teacher are checked one after another and only
+    one of them can take a slot.
+
+    Arguments:
+        teacher_id: id of Teacher
+        start, end: aware datetimes of the lesson
+        fields: other TeacherSchedule fields (parent_name, ...)
+
+    Returns:
+        TeacherSchedule: booked lesson
+
+    Raises:
+        LessonConflict: if the slot overlaps booked lessons
+        Teacher.DoesNotExist: if there is no such teacher
+    """
+    with transaction.atomic():
+        Teacher.objects.select_for_update().only('id').get(pk=teacher_id)
+        conflicts = list(TeacherSchedule.objects.filter(
+            teacher_id=teacher_id,
+            start_timestamp__lt=end,
+            end_timestamp__gt=start,
+        ).values('id', 'start_timestamp', 'end_timestamp'))
+        if conflicts:
+            raise LessonConflict(conflicts)
+        return TeacherSchedule.objects.create(
+            teacher_id=teacher_id,
+            start_timestamp=start,
+            end_timestamp=end,
+            **fields,
+        )
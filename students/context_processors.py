@@ -0,0 +1,8 @@
+"""Template context processors of students app."""
+from .roles import get_role
+
+
+def user_role(request):
+    """Add user_role ('Administrator', 'Teachers', 'Students' or None)
+    to the context of every template."""
+    return {'user_role': get_role(request)}
@@ -1,8 +1,14 @@
+import datetime
+
 from django import forms
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from courses.models import Course
-from students.models import Student
+from students.models import Student, TeacherSchedule
 from django.contrib.auth.models import User
 from django.contrib.auth.forms import UserCreationForm
+from django.contrib.auth.password_validation import validate_password
 
 
 class CourseEnrollForm(forms.Form):
@@ -28,6 +34,29 @@ class StudentSignupForm(forms.ModelForm):
         fields = ('name', 'age', 'phone', 'city')
 
 
+class StudentImportForm(StudentSignupForm):
+    """Describe one row of students import.
+
+    Student fields are checked by StudentSignupForm rules, user fields
+    like at signup. Username uniqueness is checked by the import
+    for a chunk of rows at once.
+
+    Arguments:
+        StudentSignupForm: superclass which describe student fields.
+    """
+    username = User._meta.get_field('username').formfield()
+    email = forms.EmailField(max_length=150)
+    password = forms.CharField()
+
+    class Meta(StudentSignupForm.Meta):
+        fields = ('name', 'age', 'phone', 'city')
+
+    def clean_password(self):
+        password = self.cleaned_data['password']
+        validate_password(password)
+        return password
+
+
 class UserSignupForm(UserCreationForm):
     """Describe form for User.
 
@@ -47,3 +76,40 @@ class UserSignupForm(UserCreationForm):
             'username', 'email',
             'password1', 'password2',
             )
+
+
+class LessonBookingForm(forms.ModelForm):
+    """Describe form for lesson booking from the calendar.
+
+    start_timestamp is ISO datetime or milliseconds since epoch
+    (javascript Date.now()).
+
+    Arguments:
+        forms.ModelForm: superclass which describe form fields.
+    """
+    start_timestamp = forms.CharField()
+
+    class Meta:
+        model = TeacherSchedule
+        fields = ('teacher', 'parent_name', 'student_name', 'phone')
+
+    def clean_start_timestamp(self):
+        value = self.cleaned_data['start_timestamp'].strip()
+        try:
+            if value.isdigit():
+                start = datetime.datetime.fromtimestamp(
+                    int(value) / 1000,
+                    tz=datetime.timezone.utc,
+                )
+            else:
+                start = parse_datetime(value)
+            if start is not None and timezone.is_naive(start):
+                start = timezone.make_aware(start)
+            if start is not None:
+                # the lesson end must be a valid datetime too
+                start + datetime.timedelta(minutes=settings.LESSON_DURATION)
+        except (OverflowError, ValueError, OSError):
+            start = None
+        if start is None:
+            raise forms.ValidationError('Wrong datetime')
+        return start
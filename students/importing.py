@@ -0,0 +1,366 @@
+"""Import of many students from CSV or JSON lines.
+
+Every row has username, email, password, name, age, phone and city.
+Rows are validated one by one with StudentImportForm, valid rows are
+created in chunks: passwords are hashed in a process pool, users,
+students and their Students group membership are inserted with
+bulk_create, activation emails are queued to the outbox.
+
+A row which cannot be read (not utf-8, broken CSV or JSON) is reported
+like a row with wrong fields, the next rows are imported.
+
+Example:
+
+    with open('school.csv', 'rb') as rows_file:
+        report = import_students(read_rows(rows_file, 'csv'), 'example.com')
+    report
+    {'created': 998, 'errors': [{'row': 17, 'errors': {...}}, ...]}
+"""
+import csv
+import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group, User
+from django.db import DatabaseError, transaction
+from django.template.loader import get_template
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from outbox.mail import enqueue_many
+from students.forms import StudentImportForm
+from students.models import Student
+from students.tokens import account_activation_token
+
+
+# chunks with fewer passwords are hashed in the current process
+INLINE_HASH_ROWS = 16
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+class UnreadableRow(object):
+    """Yielded by read_rows instead of a row which cannot be read."""
+
+    def __init__(self, message):
+        self.message = message
+
+
+def _decode_lines(rows_file, bad_lines):
+    """Yield lines of rows_file as text.
+
+    Lines of a binary file are decoded from utf-8 one by one, numbers of
+    lines which are not utf-8 are added to bad_lines.
+    """
+    for number, line in enumerate(rows_file, start=1):
+        if isinstance(line, bytes):
+            try:
+                line = line.decode('utf-8')
+            except UnicodeDecodeError:
+                bad_lines.add(number)
+                line = line.decode('utf-8', 'replace')
+        yield line
+
+
+def _read_csv(lines, bad_lines):
+    reader = csv.DictReader(lines)
+    # the header is read with the first row
+    last_line = 1
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            row = UnreadableRow('Wrong CSV: {0}'.format(error))
+        else:
+            if any(last_line < line <= reader.line_num for line in bad_lines):
+                row = UnreadableRow('Row is not utf-8.')
+        last_line = reader.line_num
+        yield row
+
+
+def _read_jsonl(lines, bad_lines):
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        if number in bad_lines:
+            yield UnreadableRow('Row is not utf-8.')
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield UnreadableRow('Wrong JSON: {0}'.format(error))
+            continue
+        if isinstance(row, dict):
+            yield row
+        else:
+            yield UnreadableRow('Row is not a JSON object.')
+
+
+def read_rows(rows_file, rows_format):
+    """Yield rows of CSV (with header) or JSON lines file as dicts.
+
+    A row which cannot be read is yielded as UnreadableRow, reading goes
+    on with the next row.
+
+    Arguments:
+        rows_file: binary file object, lines are decoded from utf-8,
+        or text file object opened with newline=''
+        rows_format: 'csv' or 'jsonl'
+    """
+    bad_lines = set()
+    lines = _decode_lines(rows_file, bad_lines)
+    if rows_format == 'csv':
+        yield from _read_csv(lines, bad_lines)
+    elif rows_format == 'jsonl':
+        yield from _read_jsonl(lines, bad_lines)
+    else:
+        raise ValueError('Unknown format: {0}'.format(rows_format))
+
+
+def shared_pool():
+    """Return the password hashing pool of this process.
+
+    The pool has settings.STUDENTS_IMPORT_WORKERS processes, it is
+    started by the first import and used by all the next ones.
+
+    Returns:
+        ProcessPoolExecutor or None: None if STUDENTS_IMPORT_WORKERS is 0
+    """
+    global _shared_pool
+    if not settings.STUDENTS_IMPORT_WORKERS:
+        return None
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = ProcessPoolExecutor(
+                max_workers=settings.STUDENTS_IMPORT_WORKERS,
+            )
+        return _shared_pool
+
+
+def _drop_shared_pool(pool):
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is pool:
+            _shared_pool = None
+    pool.shutdown(wait=False)
+
+
+def _hash_passwords(passwords, pool):
+    if pool is not None and len(passwords) >= INLINE_HASH_ROWS:
+        try:
+            return list(pool.map(make_password, passwords, chunksize=16))
+        except BrokenProcessPool:
+            # a killed worker breaks the pool, the next import starts
+            # a new one
+            _drop_shared_pool(pool)
+    return [make_password(password) for password in passwords]
+
+
+def _insert_rows(rows, students_group):
+    """Insert users and students of rows with hashed passwords.
+
+    Arguments:
+        rows: list of ((row number, cleaned data), password hash)
+
+    Returns:
+        tuple: dict username -> user id, list of created students
+    """
+    with transaction.atomic():
+        User.objects.bulk_create([
+            User(
+                username=cleaned['username'],
+                email=cleaned['email'],
+                password=password,
+                is_active=False,
+            )
+            for (_, cleaned), password in rows
+        ])
+        # ids are not returned by bulk_create on every database
+        user_ids = dict(User.objects.filter(
+            username__in=[cleaned['username'] for (_, cleaned), _ in rows],
+        ).values_list('username', 'id'))
+        students = Student.objects.bulk_create([
+            Student(
+                user_id=user_ids[cleaned['username']],
+                name=cleaned['name'],
+                age=cleaned['age'],
+                phone=cleaned['phone'],
+                city=cleaned['city'],
+            )
+            for (_, cleaned), _ in rows
+        ])
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=user_id, group_id=students_group.id)
+            for user_id in user_ids.values()
+        ])
+    return user_ids, students
+
+
+def _create_chunk(rows, pool, students_group, domain, send_activation):
+    """Create users and students of valid rows.
+
+    A database error rolls back the whole chunk, then rows are inserted
+    one by one, each in its own savepoint, so only the rows which fail
+    again are reported.
+
+    Arguments:
+        rows: list of (row number, cleaned data)
+
+    Returns:
+        tuple: amount of created students, list of (row number,
+        DatabaseError) of rows which were not created
+    """
+    hashed = list(zip(rows, _hash_passwords(
+        [cleaned['password'] for _, cleaned in rows],
+        pool,
+    )))
+    failed = []
+    try:
+        user_ids, students = _insert_rows(hashed, students_group)
+    except DatabaseError as error:
+        if len(hashed) == 1:
+            return 0, [(rows[0][0], error)]
+        user_ids, students, created_rows = {}, [], []
+        for row in hashed:
+            try:
+                row_user_ids, row_students = _insert_rows(
+                    [row],
+                    students_group,
+                )
+            except DatabaseError as row_error:
+                failed.append((row[0][0], row_error))
+            else:
+                user_ids.update(row_user_ids)
+                students.extend(row_students)
+                created_rows.append(row[0])
+        rows = created_rows
+
+    if send_activation:
+        template = get_template('students/student/activation_request.html')
+        emails = []
+        for (_, cleaned), student in zip(rows, students):
+            user = User(
+                id=user_ids[cleaned['username']],
+                username=cleaned['username'],
+            )
+            user.student = student
+            emails.append((
+                'Please Activate Your Account',
+                template.render({
+                    'user': user,
+                    'domain': domain,
+                    'uid': urlsafe_base64_encode(force_bytes(user.pk)),
+                    'token': account_activation_token.make_token(user=user),
+                }),
+                cleaned['email'],
+            ))
+        enqueue_many(emails)
+    return len(rows), failed
+
+
+def import_students(
+    rows,
+    domain,
+    send_activation=True,
+    chunk_size=500,
+    workers=None,
+):
+    """Validate and create students from rows.
+
+    A wrong row does not stop the import, it is reported in errors.
+
+    Arguments:
+        rows: iterable of dicts
+        domain: site domain for activation links
+        send_activation: queue activation emails
+        chunk_size: amount of rows created at once
+        workers: processes for password hashing started for this import,
+        None uses the shared pool (see shared_pool), 0 hashes in the
+        current process
+
+    Returns:
+        dict: created - amount of created students,
+        errors - list of {'row': number, 'errors': {field: [messages]}}
+    """
+    students_group = Group.objects.get(name='Students')
+    report = {'created': 0, 'errors': []}
+    own_pool = None
+    if workers is None:
+        pool = shared_pool()
+    elif workers:
+        pool = own_pool = ProcessPoolExecutor(max_workers=workers)
+    else:
+        pool = None
+
+    def flush(chunk):
+        taken = set(User.objects.filter(
+            username__in=[cleaned['username'] for _, cleaned in chunk],
+        ).values_list('username', flat=True))
+        valid = []
+        for number, cleaned in chunk:
+            if cleaned['username'] in taken:
+                report['errors'].append({
+                    'row': number,
+                    'errors': {'username': ['Username is already taken.']},
+                })
+            else:
+                valid.append((number, cleaned))
+        if not valid:
+            return
+        created, failed = _create_chunk(
+            valid,
+            pool,
+            students_group,
+            domain,
+            send_activation,
+        )
+        report['created'] += created
+        report['errors'].extend(
+            {'row': number, 'errors': {'__all__': [str(error)]}}
+            for number, error in failed
+        )
+
+    try:
+        chunk = []
+        usernames = set()
+        for number, row in enumerate(rows, start=1):
+            if isinstance(row, UnreadableRow):
+                report['errors'].append({
+                    'row': number,
+                    'errors': {'__all__': [row.message]},
+                })
+                continue
+            form = StudentImportForm(data=row)
+            if not form.is_valid():
+                report['errors'].append({
+                    'row': number,
+                    'errors': {
+                        field: list(messages)
+                        for field, messages in form.errors.items()
+                    },
+                })
+                continue
+            username = form.cleaned_data['username']
+            if username in usernames:
+                report['errors'].append({
+                    'row': number,
+                    'errors': {'username': ['Username repeats in the file.']},
+                })
+                continue
+            usernames.add(username)
+            chunk.append((number, form.cleaned_data))
+            if len(chunk) >= chunk_size:
+                flush(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    finally:
+        if own_pool is not None:
+            own_pool.shutdown()
+    return report
@@ -0,0 +1,91 @@
+"""Benchmark the free-slot search on synthetic schedules."""
+import datetime
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from students.availability import AvailabilityIndex, parse_time
+
+
+class Command(BaseCommand):
+    """Measure AvailabilityIndex on generated lessons, no database used.
+
+        python manage.py bench_availability --teachers 500 --days 365
+    """
+
+    help = 'Benchmark free lesson slot search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teachers', type=int, default=500)
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--lessons-per-day', type=int, default=6)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        lesson = datetime.timedelta(minutes=45)
+        first_day = timezone.now().replace(
+            hour=0,
+            minute=0,
+            second=0,
+            microsecond=0,
+        )
+        index = AvailabilityIndex(
+            default_hours=[(parse_time('09:00'), parse_time('21:00'))],
+        )
+
+        started = time.perf_counter()
+        total = 0
+        for teacher_id in range(1, options['teachers'] + 1):
+            for day in range(options['days']):
+                day_start = first_day + datetime.timedelta(days=day, hours=9)
+                hours = rng.sample(range(12), options['lessons_per_day'])
+                for hour in sorted(hours):
+                    start = day_start + datetime.timedelta(hours=hour)
+                    index.book(teacher_id, start, start + lesson)
+                    total += 1
+        build_time = time.perf_counter() - started
+        self.stdout.write('Indexed {0} lessons of {1} teachers in {2:.2f}s'.format(
+            total,
+            options['teachers'],
+            build_time,
+        ))
+
+        for window_days in (1, 7):
+            timings = []
+            found = 0
+            for _ in range(options['queries']):
+                start = first_day + datetime.timedelta(
+                    days=rng.randrange(options['days'] - window_days + 1),
+                )
+                end = start + datetime.timedelta(days=window_days)
+                started = time.perf_counter()
+                slots = index.free_slots(start, end, lesson)
+                timings.append(time.perf_counter() - started)
+                found += sum(len(teacher_slots) for teacher_slots in slots.values())
+            timings.sort()
+            self.stdout.write(
+                '{0}-day window, all teachers: avg {1:.1f}ms, '
+                'p99 {2:.1f}ms, {3:.0f} slots per query'.format(
+                    window_days,
+                    sum(timings) / len(timings) * 1000,
+                    timings[int(len(timings) * 0.99) - 1] * 1000,
+                    found / len(timings),
+                ),
+            )
+
+        started = time.perf_counter()
+        for _ in range(options['queries']):
+            teacher_id = rng.randrange(1, options['teachers'] + 1)
+            start = first_day + datetime.timedelta(
+                days=rng.randrange(options['days']),
+                hours=9 + rng.randrange(12),
+            )
+            index.book(teacher_id, start, start + lesson)
+            index.cancel(teacher_id, start, start + lesson)
+        self.stdout.write('Book and cancel: {0:.3f}ms per pair'.format(
+            (time.perf_counter() - started) / options['queries'] * 1000,
+        ))
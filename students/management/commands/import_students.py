@@ -0,0 +1,66 @@
+"""Import students from CSV or JSON lines file."""
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from students.importing import import_students, read_rows
+
+
+class Command(BaseCommand):
+    """Create students from file, report rows which were not imported.
+
+    CSV needs a header: username,email,password,name,age,phone,city
+
+        python manage.py import_students school.csv --domain example.com
+    """
+
+    help = 'Import students from CSV or JSON lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format',
+            choices=['csv', 'jsonl'],
+            default=None,
+            help='By default taken from file extension',
+        )
+        parser.add_argument('--domain', default='localhost:8000')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Password hashing processes, 0 hashes in this process, '
+                 'by default STUDENTS_IMPORT_WORKERS',
+        )
+        parser.add_argument(
+            '--no-activation',
+            action='store_true',
+            help='Do not queue activation emails',
+        )
+
+    def handle(self, *args, **options):
+        rows_format = options['format']
+        if rows_format is None:
+            rows_format = os.path.splitext(options['path'])[1].lstrip('.')
+            if rows_format not in ('csv', 'jsonl'):
+                raise CommandError('Set --format for {0}'.format(
+                    options['path'],
+                ))
+        with open(options['path'], 'rb') as rows_file:
+            report = import_students(
+                read_rows(rows_file, rows_format),
+                domain=options['domain'],
+                send_activation=not options['no_activation'],
+                chunk_size=options['chunk_size'],
+                workers=options['workers'],
+            )
+        for error in report['errors']:
+            self.stderr.write(json.dumps(error, ensure_ascii=False))
+        self.stdout.write(self.style.SUCCESS(
+            'Created {0} students, {1} rows with errors'.format(
+                report['created'],
+                len(report['errors']),
+            ),
+        ))
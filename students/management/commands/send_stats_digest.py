@@ -0,0 +1,79 @@
+"""Send the finished courses digest to active students."""
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.loader import get_template
+
+from courses.models import CourseProgress
+from outbox.mail import enqueue_many
+from students.models import Student
+
+
+class Command(BaseCommand):
+    """Queue student_stats_to_email.html digest for active students.
+
+    Students are read in chunks by user id, finished courses of a chunk
+    come from one query, emails of a chunk are queued with one bulk
+    insert. A student without finished courses gets no email. Memory does not grow with the amount of students:
+
+        python manage.py send_stats_digest --chunk-size 2000
+    """
+
+    help = 'Queue course statistics emails for all active students'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def get_done_courses(self, user_ids):
+        """Return dict user_id -> titles of finished courses."""
+        done = {}
+        for user_id, title in CourseProgress.objects.filter(
+            user_id__in=user_ids,
+            completed__isnull=False,
+        ).values_list('user_id', 'course__title'):
+            done.setdefault(user_id, []).append(title)
+        return done
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        template = get_template('students/student/student_stats_to_email.html')
+        email_subject = 'Course statistics'
+        students = Student.objects.filter(
+            user__is_active=True,
+        ).exclude(user__email='').order_by('user_id')
+
+        last_user_id = 0
+        total = 0
+        while True:
+            chunk = list(students.filter(
+                user_id__gt=last_user_id,
+            ).values_list(
+                'user_id',
+                'user__username',
+                'user__email',
+            )[:options['chunk_size']])
+            if not chunk:
+                break
+            last_user_id = chunk[-1][0]
+            done = self.get_done_courses(
+                [user_id for user_id, _, _ in chunk],
+            )
+            total += enqueue_many(
+                (
+                    email_subject,
+                    template.render({
+                        'user': {'username': username},
+                        'courses': done.get(user_id, []),
+                    }),
+                    email,
+                )
+                for user_id, username, email in chunk
+                if user_id in done
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            'Queued {0} emails in {1:.1f}s'.format(
+                total,
+                time.monotonic() - started,
+            ),
+        ))
@@ -0,0 +1,80 @@
+"""Fire parallel bookings at one slot and check that one wins."""
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from students.booking import LessonConflict, book_lesson
+from students.models import Teacher, TeacherSchedule
+
+
+class Command(BaseCommand):
+    """Book the same slot of one teacher from many threads at once.
+
+    Every thread uses its own database connection, exactly one booking
+    must succeed and all the others must get a conflict:
+
+        python manage.py stress_booking --teacher 1 --bookings 300
+    """
+
+    help = 'Stress test of concurrent lesson booking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--teacher', type=int, required=True)
+        parser.add_argument('--bookings', type=int, default=300)
+        parser.add_argument('--workers', type=int, default=50)
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the booked lesson',
+        )
+
+    def handle(self, *args, **options):
+        if not Teacher.objects.filter(pk=options['teacher']).exists():
+            raise CommandError('No teacher {0}'.format(options['teacher']))
+        # a far future slot, so real lessons are not touched
+        start = timezone.now().replace(
+            minute=0,
+            second=0,
+            microsecond=0,
+        ) + datetime.timedelta(days=3650)
+        end = start + datetime.timedelta(minutes=45)
+
+        def book(number):
+            try:
+                book_lesson(
+                    options['teacher'],
+                    start,
+                    end,
+                    parent_name='stress',
+                    student_name='stress {0}'.format(number),
+                )
+            except LessonConflict:
+                return 'conflict'
+            except Exception as error:
+                return 'error: {0}'.format(error)
+            finally:
+                connection.close()
+            return 'booked'
+
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            results = list(pool.map(book, range(options['bookings'])))
+
+        booked = TeacherSchedule.objects.filter(
+            teacher_id=options['teacher'],
+            start_timestamp__lt=end,
+            end_timestamp__gt=start,
+        )
+        outcome = {}
+        for result in results:
+            outcome[result] = outcome.get(result, 0) + 1
+        self.stdout.write('Results: {0}'.format(outcome))
+        self.stdout.write('Lessons in the slot: {0}'.format(booked.count()))
+        if booked.count() == 1 and outcome.get('booked') == 1:
+            self.stdout.write(self.style.SUCCESS('No double booking'))
+        else:
+            self.stdout.write(self.style.ERROR('Double booking detected'))
+        if not options['keep']:
+            booked.delete()
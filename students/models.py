@@ -80,6 +80,39 @@ class Teacher(models.Model):
         return self.name
 
 
+class TeacherWorkingHours(models.Model):
+    """Describe the time of week when teacher gives lessons.
+
+    weekday: 0 is Monday, 6 is Sunday
+    start_time, end_time: local time (TIME_ZONE) of the working window
+
+    A teacher without rows works settings.TEACHER_WORKING_HOURS.
+
+    Arguments:
+        models.Model: superclass which describes fields for database
+    """
+
+    teacher = models.ForeignKey(
+        Teacher,
+        related_name='working_hours',
+        on_delete=models.CASCADE,
+    )
+    weekday = models.PositiveSmallIntegerField()
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ['teacher', 'weekday', 'start_time']
+
+    def __str__(self):
+        return '{0}: {1} {2}-{3}'.format(
+            self.teacher,
+            self.weekday,
+            self.start_time,
+            self.end_time,
+        )
+
+
 class TeacherSchedule(models.Model):
     """Class describe teacher scheduler.
 
@@ -107,3 +140,33 @@ class TeacherSchedule(models.Model):
     phone = models.TextField(max_length=500, blank=True, default='79151761287')
     start_timestamp = models.DateTimeField()
     end_timestamp = models.DateTimeField()
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_timestamp', 'id']),
+            models.Index(fields=['teacher', 'start_timestamp', 'id']),
+        ]
+
+
+class LessonChange(models.Model):
+    """Change log of lessons for free slots indexes of all processes.
+
+    Every process applies new rows to its students.availability index
+    instead of rebuilding it.
+
+    teacher_id, start_timestamp, end_timestamp: the changed lesson,
+    empty in a row which makes every index rebuilt (teachers or
+    working hours were changed)
+    booked: True for a booked lesson, False for a cancelled one
+
+    Arguments:
+        models.Model: superclass which describes fields for database
+    """
+
+    # not a ForeignKey, lessons of a deleted teacher are logged too
+    teacher_id = models.IntegerField(null=True)
+    start_timestamp = models.DateTimeField(null=True)
+    end_timestamp = models.DateTimeField(null=True)
+    booked = models.BooleanField(default=True)
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
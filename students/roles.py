@@ -0,0 +1,124 @@
+"""Role of a user (Administrator, Teachers, Students group).
+
+The role is resolved with one query at login and kept in the session,
+later requests read it from there. The session copy carries cache
+versions of the user and of all groups, a changed membership rotates
+a version and the role is resolved again on the next request.
+
+Versions live in the default cache, it must be shared by all processes
+(checked by courses.E001), otherwise a process keeps serving a role
+changed in another one. A lost version is created again and only makes
+the role be resolved once more.
+
+Example:
+
+    from students.roles import get_role
+    get_role(request)
+    'Students'
+"""
+import uuid
+
+from django.core.cache import cache
+
+# groups in order of priority, a teacher who is also a student is Teachers
+ROLES = ('Administrator', 'Teachers', 'Students')
+
+SESSION_KEY = 'user_role'
+USER_VERSION_KEY = 'roles:user:{0}'
+GROUPS_VERSION_KEY = 'roles:groups'
+
+
+def _versions(user_id):
+    """Return the versions of the user and of all groups.
+
+    Both are read with one cache query, a lost version is created again.
+    """
+    keys = [USER_VERSION_KEY.format(user_id), GROUPS_VERSION_KEY]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # another process may create the version at the same time
+            cache.add(key, uuid.uuid4().hex, None)
+            versions[key] = cache.get(key)
+    return ':'.join(versions[key] for key in keys)
+
+
+def invalidate_user_role(user_id):
+    """Make the stored role of one user outdated."""
+    cache.set(USER_VERSION_KEY.format(user_id), uuid.uuid4().hex, None)
+
+
+def invalidate_all_roles():
+    """Make stored roles of every user outdated."""
+    cache.set(GROUPS_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def resolve_role(user):
+    """Return the role of user from database or None."""
+    names = set(user.groups.filter(name__in=ROLES).values_list(
+        'name',
+        flat=True,
+    ))
+    for role in ROLES:
+        if role in names:
+            return role
+    return None
+
+
+def remember_role(request, user):
+    """Resolve the role of user and store it in the session."""
+    role = resolve_role(user)
+    request.session[SESSION_KEY] = {
+        'role': role,
+        'user_id': user.pk,
+        'version': _versions(user.pk),
+    }
+    return role
+
+
+def get_role(request):
+    """Return the role of the current user.
+
+    Arguments:
+        request: client request
+
+    Returns:
+        str: 'Administrator', 'Teachers', 'Students' or None
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    stored = request.session.get(SESSION_KEY)
+    if (
+        stored is not None
+        and stored['user_id'] == user.pk
+        and stored['version'] == _versions(user.pk)
+    ):
+        return stored['role']
+    return remember_role(request, user)
+
+
+def role_on_login(sender, request, user, **kwargs):
+    """Store the role of a logged in user in the session."""
+    remember_role(request, user)
+
+
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Forget stored roles of users whose groups were changed."""
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        # user.groups.add(...), instance is a User
+        invalidate_user_role(instance.pk)
+    elif pk_set:
+        # group.user_set.add(...), pk_set are user ids
+        for user_id in pk_set:
+            invalidate_user_role(user_id)
+    else:
+        # group.user_set.clear(), cleared users are unknown here
+        invalidate_all_roles()
+
+
+def groups_changed(sender, **kwargs):
+    """Forget all stored roles after a group is renamed or deleted."""
+    invalidate_all_roles()
@@ -1,3 +1,353 @@
-from django.test import TestCase
+import datetime
+import io
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import Group, User
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    RequestFactory,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+    skipUnlessDBFeature,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from courses.models import CourseProgress
+from courses.tests import create_course
+from outbox.models import OutgoingEmail
+from students import availability, roles
+from students.booking import LessonConflict, book_lesson
+from students.importing import UnreadableRow, read_rows
+from students.models import (
+    LessonChange,
+    Student,
+    StudentStatus,
+    Teacher,
+    TeacherSchedule,
+    TeacherStatus,
+)
+
+
+def create_teacher(username='teacher'):
+    TeacherStatus.objects.get_or_create(id=1, name='Teacher')
+    return Teacher.objects.create(
+        user=User.objects.create_user(username, username + '@example.com'),
+        name=username,
+    )
+
+
+def tomorrow_at(hour, minute=0):
+    return (timezone.now() + datetime.timedelta(days=1)).replace(
+        hour=hour,
+        minute=minute,
+        second=0,
+        microsecond=0,
+    )
+
+
+@override_settings(AVAILABILITY_INDEX_POLL=0)
+class AvailabilityIndexTest(TestCase):
+
+    def setUp(self):
+        availability.reset_index()
+        self.teacher = create_teacher()
+        self.start = tomorrow_at(9)
+        self.end = tomorrow_at(12)
+
+    def free_slots(self):
+        return availability.get_index().free_slots(
+            self.start,
+            self.end,
+            datetime.timedelta(minutes=45),
+        ).get(self.teacher.id, [])
+
+    def test_booked_lesson_is_not_offered(self):
+        self.assertEqual(len(self.free_slots()), 4)
+        TeacherSchedule.objects.create(
+            teacher=self.teacher,
+            parent_name='parent',
+            student_name='student',
+            start_timestamp=tomorrow_at(9),
+            end_timestamp=tomorrow_at(9, 45),
+        )
+        self.assertEqual(self.free_slots()[0][0], tomorrow_at(9, 45))
+
+    def test_change_in_another_process_is_applied(self):
+        index = availability.get_index()
+        # another worker booked a lesson and logged it
+        TeacherSchedule.objects.bulk_create([TeacherSchedule(
+            teacher=self.teacher,
+            parent_name='parent',
+            student_name='student',
+            start_timestamp=tomorrow_at(9),
+            end_timestamp=tomorrow_at(9, 45),
+        )])
+        LessonChange.objects.create(
+            teacher_id=self.teacher.id,
+            start_timestamp=tomorrow_at(9),
+            end_timestamp=tomorrow_at(9, 45),
+        )
+        with override_settings(AVAILABILITY_INDEX_POLL=60), \
+                self.assertNumQueries(0):
+            self.assertEqual(len(self.free_slots()), 4)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.free_slots()), 3)
+        self.assertIs(availability.get_index(), index)
+
+    def test_moved_lesson_is_applied(self):
+        lesson = TeacherSchedule.objects.create(
+            teacher=self.teacher,
+            parent_name='parent',
+            student_name='student',
+            start_timestamp=tomorrow_at(9),
+            end_timestamp=tomorrow_at(9, 45),
+        )
+        index = availability.get_index()
+        lesson = TeacherSchedule.objects.get(id=lesson.id)
+        lesson.start_timestamp = tomorrow_at(11, 15)
+        lesson.end_timestamp = tomorrow_at(12)
+        lesson.save()
+        self.assertEqual(
+            [slot[0] for slot in self.free_slots()],
+            [tomorrow_at(9), tomorrow_at(9, 45), tomorrow_at(10, 30)],
+        )
+        lesson.delete()
+        self.assertEqual(len(self.free_slots()), 4)
+        self.assertIs(availability.get_index(), index)
+
+    def test_teacher_change_rebuilds_index(self):
+        index = availability.get_index()
+        create_teacher('other')
+        self.assertIsNot(availability.get_index(), index)
+
+
+class LessonBookingTest(TestCase):
+
+    def setUp(self):
+        self.teacher = create_teacher()
+        book_lesson(
+            self.teacher.id,
+            tomorrow_at(10),
+            tomorrow_at(10, 45),
+            parent_name='parent',
+            student_name='student',
+        )
+
+    def book(self, start):
+        return self.client.post('/calendar/', {
+            'teacher': self.teacher.id,
+            'parent_name': 'parent',
+            'student_name': 'student',
+            'phone': '79990000000',
+            'start_timestamp': start,
+        })
+
+    def test_overlapping_lesson_is_rejected(self):
+        response = self.book(tomorrow_at(10, 30).isoformat())
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(len(response.json()['conflicts']), 1)
+        with self.assertRaises(LessonConflict):
+            book_lesson(self.teacher.id, tomorrow_at(9, 30), tomorrow_at(11))
+
+    def test_adjacent_lesson_is_booked(self):
+        response = self.book(str(int(tomorrow_at(10, 45).timestamp() * 1000)))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(TeacherSchedule.objects.count(), 2)
+
+    def test_wrong_timestamp_is_a_form_error(self):
+        for start in ('9' * 400, '9999-12-31T23:59:00', '2020-13-45T10:00'):
+            response = self.book(start)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('start_timestamp', response.json()['errors'])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class ConcurrentBookingTest(TransactionTestCase):
+
+    def test_one_of_parallel_bookings_wins(self):
+        teacher = create_teacher()
+
+        def book(number):
+            try:
+                book_lesson(
+                    teacher.id,
+                    tomorrow_at(10),
+                    tomorrow_at(10, 45),
+                    parent_name='parent',
+                    student_name='student {0}'.format(number),
+                )
+            except LessonConflict:
+                return False
+            finally:
+                connection.close()
+            return True
+
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            results = list(pool.map(book, range(20)))
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(TeacherSchedule.objects.count(), 1)
+
+
+class StatsDigestTest(TestCase):
+
+    def test_students_with_finished_courses_are_queued(self):
+        course, _, _ = create_course()
+        finished = []
+        for number in range(6):
+            user = User.objects.create_user(
+                'user{0}'.format(number),
+                'user{0}@example.com'.format(number),
+            )
+            Student.objects.create(user=user, name=user.username)
+            if number % 2:
+                finished.append(user)
+                CourseProgress.objects.complete(user, course)
+        inactive = User.objects.create_user('inactive', 'in@example.com')
+        inactive.is_active = False
+        inactive.save()
+        Student.objects.create(user=inactive, name='inactive')
+        CourseProgress.objects.complete(inactive, course)
+
+        call_command('send_stats_digest', chunk_size=2, stdout=io.StringIO())
+        emails = OutgoingEmail.objects.order_by('to')
+        self.assertEqual(
+            [email.to for email in emails],
+            [user.email for user in finished],
+        )
+        for email, user in zip(emails, finished):
+            self.assertIn(user.username, email.body)
+            self.assertIn(course.title, email.body)
+
+
+class StudentImportTest(TestCase):
+
+    def setUp(self):
+        Group.objects.get_or_create(name='Students')
+        StudentStatus.objects.get_or_create(id=1, name='lead')
+        admin = User.objects.create_superuser('admin', 'admin@a.ru', 'pw')
+        self.client.force_login(admin)
+
+    def import_file(self, name, content):
+        return self.client.post(reverse('student_import'), {
+            'file': SimpleUploadedFile(name, content),
+            'send_activation': '0',
+        }).json()
+
+    def test_unreadable_jsonl_rows_are_reported(self):
+        row = (
+            '{"username": "pupil", "email": "pupil@a.ru", '
+            '"password": "Very-Strong-1!", "name": "Pupil", "age": "10", '
+            '"phone": "79990001122", "city": "Moscow"}'
+        )
+        report = self.import_file('school.jsonl', b'\n'.join([
+            b'{"username": ',
+            b'[1, 2]',
+            '{"name": "\u0410"}'.encode('cp1251'),
+            b'',
+            row.encode(),
+        ]))
+        self.assertEqual(report['created'], 1)
+        self.assertEqual(
+            [(error['row'], error['errors']['__all__'][0][:10])
+             for error in report['errors']],
+            [(1, 'Wrong JSON'), (2, 'Row is not'), (3, 'Row is not')],
+        )
+        self.assertTrue(User.objects.filter(username='pupil').exists())
+
+    def test_taken_username_fails_only_its_row(self):
+        def taken_while_hashing(passwords, pool):
+            # another import created the user after the usernames check
+            User.objects.create_user('second', 'other@a.ru')
+            return passwords
+
+        rows = [
+            'username,email,password,name,age,phone,city',
+        ] + [
+            '{0},{0}@a.ru,Very-Strong-1!,{0},10,79990001122,Moscow'.format(
+                username,
+            )
+            for username in ('first', 'second', 'third', 'first')
+        ]
+        with mock.patch(
+            'students.importing._hash_passwords',
+            side_effect=taken_while_hashing,
+        ):
+            report = self.import_file(
+                'school.csv',
+                '\r\n'.join(rows).encode(),
+            )
+        self.assertEqual(report['created'], 2)
+        self.assertEqual(
+            [
+                (error['row'], list(error['errors']))
+                for error in report['errors']
+            ],
+            [(4, ['username']), (2, ['__all__'])],
+        )
+        self.assertEqual(
+            set(Student.objects.values_list('user__username', flat=True)),
+            {'first', 'third'},
+        )
+
+    def test_unreadable_csv_rows_are_reported(self):
+        rows = list(read_rows([
+            b'username,email,password,name,age,phone,city\r\n',
+            'first,f@a.ru,pw,\u0410,10,7999,M\r\n'.encode('cp1251'),
+            b'second,s@a.ru,"pw\r\n',
+            b'line",B,10,7999,M\r\n',
+            b'third,t@a.ru,pw,C,10,7999,M\r\n',
+        ], 'csv'))
+        self.assertEqual(len(rows), 3)
+        self.assertIsInstance(rows[0], UnreadableRow)
+        self.assertEqual(rows[1]['password'], 'pw\r\nline')
+        self.assertEqual(rows[2]['username'], 'third')
+
+
+class RoleTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('pupil')
+        self.students = Group.objects.create(name='Students')
+        self.teachers = Group.objects.create(name='Teachers')
+        self.user.groups.add(self.students)
+
+    def request(self, session):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        request.session = session
+        return request
+
+    def test_role_follows_group_changes(self):
+        session = SessionStore()
+        roles.remember_role(self.request(session), self.user)
+        self.assertEqual(roles.get_role(self.request(session)), 'Students')
+
+        # another process changes groups, the shared version moves
+        self.teachers.user_set.add(self.user)
+        self.assertEqual(roles.get_role(self.request(session)), 'Teachers')
+        self.teachers.delete()
+        self.assertEqual(roles.get_role(self.request(session)), 'Students')
+
+    def test_stored_role_costs_one_query(self):
+        session = SessionStore()
+        roles.remember_role(self.request(session), self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                roles.get_role(self.request(session)),
+                'Students',
+            )
+
+    def test_lost_versions_resolve_role_again(self):
+        session = SessionStore()
+        roles.remember_role(self.request(session), self.user)
+        # no m2m_changed signal, only the lost versions refresh the role
+        User.groups.through.objects.filter(user=self.user).delete()
+        cache.clear()
+        self.assertIsNone(roles.get_role(self.request(session)))
@@ -16,6 +16,9 @@ urlpatterns = [
     path('register/',
          views.StudentRegistrationView.as_view(),
          name='student_registration'),
+    path('import/',
+         views.StudentImportView.as_view(),
+         name='student_import'),
     path('enroll-course/',
          views.StudentEnrollCourseView.as_view(),
          name='student_enroll_course'),
@@ -28,6 +31,9 @@ urlpatterns = [
     path('course/<pk>/<module_id>/',
          views.StudentCourseDetailView.as_view(),
          name='student_course_detail_module'),
+    path('course/<int:pk>/<int:module_id>/done/',
+         views.module_done,
+         name='student_module_done'),
     path('sent/', views.activation_sent_view, name="activation_sent"),
     path(
          'activate/<slug:uidb64>/<slug:token>/',
@@ -1,34 +1,70 @@
 """Module where described the logic for user response."""
+import datetime
+
+from django.conf import settings
 from django.urls import reverse_lazy
 from django.contrib.auth import authenticate, login
 from django.contrib.auth.models import User, Group
 from django.views.generic.edit import FormView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from students.forms import CourseEnrollForm, StudentSignupForm, UserSignupForm
-from courses.models import Course
+from courses.models import Course, CourseProgress, Module
 from django.views.generic.detail import DetailView
 from students.models import Student, Teacher
-from guardian.shortcuts import assign_perm
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse
+from django.utils.decorators import method_decorator
 from django.views import View
 from django.contrib.sites.shortcuts import get_current_site
 from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
 from django.utils.encoding import force_bytes, force_text
+from django.utils import timezone
+from students.availability import get_index
+from students.importing import import_students, read_rows
 from students.tokens import account_activation_token
-from guardian.shortcuts import get_objects_for_user
+from outbox.mail import enqueue
 
 
 def get_available_lessons(request):
     """Render available lessons list html.
 
+    GET parameters (all optional):
+        days: how many days ahead are searched, 7 by default
+        duration: lesson length in minutes, settings.LESSON_DURATION
+        by default
+
     Arguments:
-        request: 
+        request: client request
+
+    Returns:
+        render(): render available_lessons.html with lessons,
+        dict Teacher -> list of (start, end) free slots
     """
     template_name = 'students/student/available_lessons.html'
 
-    lessons = {} 
+    try:
+        days = int(request.GET.get('days', 7))
+        duration = int(request.GET.get('duration', settings.LESSON_DURATION))
+    except ValueError:
+        days, duration = 7, settings.LESSON_DURATION
+    start = timezone.now()
+    end = start + datetime.timedelta(days=min(max(days, 1), 31))
+
+    free_slots = get_index().free_slots(
+        start,
+        end,
+        datetime.timedelta(minutes=max(duration, 1)),
+    )
+    teachers = Teacher.objects.in_bulk(list(free_slots))
+    lessons = {
+        teachers[teacher_id]: slots
+        for teacher_id, slots in free_slots.items()
+        if teacher_id in teachers
+    }
 
     return render(
         request=request,
@@ -51,17 +87,10 @@ def send_stats_to_email(request):
 
     How to select done courses by student:
 
-    from students.models import Student
     from courses.models import Course
-    from guardian.shortcuts import get_objects_for_user
-    student = Student.objects.get(name='testuser testuser')
-
-    'courses.course_done'
-        ^         ^
-    app name | permission for model
-
-    done_student_courses = get_objects_for_user(
-        student.user, 'courses.course_done'
+    done_student_courses = Course.objects.filter(
+        progress__user=request.user,
+        progress__completed__isnull=False,
     )
     done_student_courses
     <QuerySet [<Course: Программирование 1-4 класс>]>
@@ -74,9 +103,9 @@ def send_stats_to_email(request):
         stats_email_sent
         
     """
-    done_student_courses = get_objects_for_user(
-        request.user,
-        'courses.course_done',
+    done_student_courses = Course.objects.filter(
+        progress__user=request.user,
+        progress__completed__isnull=False,
     )
     email_subject = 'Please Activate Your Account'
     email_message = render_to_string(
@@ -86,7 +115,7 @@ def send_stats_to_email(request):
             'courses': done_student_courses,
             },
         )
-    request.user.email_user(email_subject, email_message)
+    enqueue(email_subject, email_message, request.user.email)
     return redirect(to='stats_email_sent')
 
 
@@ -241,7 +270,7 @@ class StudentRegistrationView(View):
                         ),
                     },
                 )
-            user.email_user(email_subject, email_message)
+            enqueue(email_subject, email_message, user.email)
             return redirect(to='activation_sent')
         # FIXME: здесь ошибка при рендере пришло 8 значений, а надо 2
         return render(
@@ -254,6 +283,41 @@ class StudentRegistrationView(View):
         )
 
 
+@method_decorator(staff_member_required, name='dispatch')
+class StudentImportView(View):
+    """Import students from an uploaded CSV or JSON lines file."""
+
+    def post(self, request):
+        """POST-request treatment.
+
+        Form fields:
+            file: CSV with header or JSON lines, utf-8
+            format: 'csv' or 'jsonl', by default taken from file name
+            send_activation: '0' disables activation emails
+
+        Arguments:
+            request: client request
+
+        Returns:
+            JsonResponse (json): report of students.importing.import_students
+            {'created': 998, 'errors': [{'row': 17, 'errors': {...}}]}
+        """
+        rows_file = request.FILES.get('file')
+        if rows_file is None:
+            return JsonResponse({'error': 'file is required'}, status=400)
+        rows_format = request.POST.get('format') or (
+            'jsonl' if rows_file.name.endswith('.jsonl') else 'csv'
+        )
+        if rows_format not in ('csv', 'jsonl'):
+            return JsonResponse({'error': 'unknown format'}, status=400)
+        report = import_students(
+            read_rows(rows_file, rows_format),
+            domain=get_current_site(request).domain,
+            send_activation=request.POST.get('send_activation') != '0',
+        )
+        return JsonResponse(report)
+
+
 @login_required(login_url='/accounts/login/')
 def get_profile(request):
     # student = Student.objects.get(user=request.user)
@@ -271,7 +335,9 @@ class StudentEnrollCourseView(LoginRequiredMixin, FormView):
 
     def form_valid(self, form):
         self.course = form.cleaned_data.get('course')
-        self.course.students.add(self.request.user)
+        self.course.students.add(
+            get_object_or_404(Student, user=self.request.user),
+        )
         return super(
             StudentEnrollCourseView,
             self,
@@ -296,7 +362,7 @@ def get_courses_list(request):
         contains user.student
     """
     courses = Course.objects.filter(
-        students__in=[request.user],
+        students__user=request.user,
         )
     return render(
         request=request,
@@ -311,25 +377,78 @@ class StudentCourseDetailView(DetailView):
 
     def get_queryset(self):
         query_set = super(StudentCourseDetailView, self).get_queryset()
-        return query_set.filter(students__in=[self.request.user])
+        return query_set.filter(students__user=self.request.user)
 
     def get_context_data(self, **kwargs):
         context = super(StudentCourseDetailView, self).get_context_data(**kwargs)
 
         context['user'] = self.request.user
-        # get course object
-        course = self.get_object()
-
-        context['user_permission'] = []
-        for cur_module in course.modules.all():
-            context['user_permission'].append(self.request.user.has_perm('view_current_module', cur_module))
+        course = self.object
+        modules = list(course.modules.all())
+
+        # the first module is always open, the rest are opened
+        # one by one and kept in CourseProgress
+        unlocked_order = CourseProgress.objects.unlocked_order(
+            self.request.user,
+            course,
+        )
+        if modules:
+            unlocked_order = max(unlocked_order or 0, modules[0].order)
+        else:
+            unlocked_order = unlocked_order or 0
+        context['user_permission'] = [
+            cur_module.order <= unlocked_order for cur_module in modules
+        ]
 
         if 'module_id' in self.kwargs:
         # get current module
-            context['module'] = course.modules.get(
-                id=self.kwargs['module_id'])
-        else:
+            context['module'] = get_object_or_404(
+                course.modules,
+                id=self.kwargs['module_id'],
+            )
+            if context['module'].order > unlocked_order:
+                raise PermissionDenied
+        elif modules:
         # get first module
-            context['module'] = course.modules.all()[0]
-            assign_perm('view_current_module', context['user'], context['module'])
+            context['module'] = modules[0]
+        else:
+            raise Http404
+        context['module_passed'] = context['module'].is_passed_by(
+            self.request.user,
+        )
+        context['contents'] = context['module'].contents.with_items()
         return context
+
+
+@login_required(login_url='/accounts/login/')
+def module_done(request, pk, module_id):
+    """Open the next module when the student finished the current one.
+
+    Every Question, Blockly and Drag_and_drop item of the module must be
+    answered correctly, a module with no graded items is passed at once.
+
+    Arguments:
+        request: client request (POST)
+        pk: id of the course
+        module_id: id of the finished module
+
+    Returns:
+        redirect(): to the next module, to the course when it is
+        completed or back to the module when it is not passed
+    """
+    if request.method != 'POST':
+        return redirect('student_course_detail_module', pk, module_id)
+    module = get_object_or_404(
+        Module.objects.select_related('course'),
+        id=module_id,
+        course_id=pk,
+        course__students__user=request.user,
+    )
+    if not CourseProgress.objects.is_unlocked(request.user, module):
+        raise PermissionDenied
+    if not module.is_passed_by(request.user):
+        return redirect('student_course_detail_module', pk, module.id)
+    next_module = CourseProgress.objects.pass_module(request.user, module)
+    if next_module is None:
+        return redirect('student_course_detail', pk)
+    return redirect('student_course_detail_module', pk, next_module.id)